@@ -0,0 +1,515 @@
+"""Обработчики API, общие для Flask и асинхронного сервера.
+
+Каждая функция возвращает пару (payload, status), которую сервер
+сериализует в JSON.
+"""
+import base64
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from db import execute_query, fetch_query, fetch_one, fetch_val, estimate_count, stream_query
+
+MAX_PAGE_SIZE = 100
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(moment, row_id):
+    """Непрозрачный курсор для keyset-пагинации по (время, id)"""
+    raw = json.dumps([moment.isoformat() if moment else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        moment, row_id = json.loads(raw)
+        return (datetime.fromisoformat(moment) if moment else None), int(row_id)
+    except Exception:
+        raise InvalidCursor('Некорректный курсор')
+
+def where_clause(conditions):
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+def page_size(limit, default):
+    return max(1, min(limit or default, MAX_PAGE_SIZE))
+
+async def stats():
+    """Основная статистика"""
+    try:
+        # Счетчики поддерживаются триггерами бота, поэтому все читается
+        # одним запросом без сканирования таблиц пользователей и платежей
+        row = await fetch_one("""
+            SELECT 
+                (SELECT COALESCE(SUM(value), 0)::bigint FROM stats_counters
+                 WHERE name = 'total_users') as total_users,
+                (SELECT COALESCE(SUM(value), 0)::bigint FROM stats_counters
+                 WHERE name = 'active_subscriptions') as active_subs,
+                COALESCE(d.successful_payments, 0) as today_count,
+                COALESCE(d.total_revenue, 0) as today_total
+            FROM (SELECT CURRENT_DATE as day) today
+            LEFT JOIN payment_daily_stats d ON d.day = today.day
+        """)
+        
+        return {
+            'success': True,
+            'stats': {
+                'total_users': int(row['total_users'] or 0),
+                'active_subs': int(row['active_subs'] or 0),
+                'today_payments_count': int(row['today_count']),
+                'today_payments_amount': float(row['today_total'])
+            }
+        }, 200
+    except Exception as e:
+        print(f"Error in stats: {e}")
+        return {
+            'success': True,
+            'stats': {
+                'total_users': 0,
+                'active_subs': 0,
+                'today_payments_count': 0,
+                'today_payments_amount': 0
+            }
+        }, 200
+
+async def users(limit, cursor=None, with_total=False):
+    """Список пользователей (keyset-пагинация по created_at, id)"""
+    try:
+        limit = page_size(limit, 20)
+        
+        # Строим запрос
+        query = """
+            SELECT 
+                u.*, 
+                s.id as subscription_id,
+                s.start_date as sub_start,
+                s.end_date as sub_end,
+                s.is_active as sub_active,
+                s.request_limit,
+                s.used_requests
+            FROM users u
+            LEFT JOIN subscriptions s ON u.id = s.user_id AND s.is_active = true
+        """
+        where = []
+        args = []
+        
+        if cursor:
+            args.extend(decode_cursor(cursor))
+            where.append("(u.created_at, u.id) < ($1, $2)")
+        
+        query += where_clause(where)
+        
+        query += " ORDER BY u.created_at DESC, u.id DESC LIMIT $%d" % (len(args) + 1)
+        
+        # Берем на одну строку больше, чтобы понять, есть ли следующая страница
+        rows = await fetch_query(query, *args, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        users_list = []
+        for user in rows:
+            users_list.append({
+                'id': user['id'],
+                'telegram_id': user['telegram_id'],
+                'username': user['username'],
+                'full_name': user['full_name'],
+                'created_at': user['created_at'].isoformat() if user['created_at'] else None,
+                'subscription': {
+                    'id': user['subscription_id'],
+                    'start': user['sub_start'].isoformat() if user['sub_start'] else None,
+                    'end': user['sub_end'].isoformat() if user['sub_end'] else None,
+                    'active': user['sub_active'],
+                    'request_limit': user['request_limit'],
+                    'used_requests': user['used_requests']
+                } if user['subscription_id'] else None
+            })
+        
+        result = {
+            'success': True,
+            'users': users_list,
+            'next_cursor': encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_more else None
+        }
+        
+        if with_total:
+            total = await estimate_count("SELECT id FROM users")
+            result['total'] = total
+            result['total_pages'] = (total + limit - 1) // limit if total else 1
+        
+        return result, 200
+    except InvalidCursor as e:
+        return {'success': False, 'error': str(e), 'users': []}, 400
+    except Exception as e:
+        print(f"Error in users API: {e}")
+        return {
+            'success': False, 
+            'error': str(e),
+            'users': [],
+            'total': 0
+        }, 500
+
+async def subscriptions(status, limit=50, cursor=None, with_total=False):
+    """Список подписок (keyset-пагинация по end_date, id)"""
+    try:
+        limit = page_size(limit, 50)
+        
+        # Базовый запрос
+        base_query = """
+            SELECT 
+                s.*, 
+                u.telegram_id, 
+                u.username, 
+                u.full_name
+            FROM subscriptions s
+            JOIN users u ON s.user_id = u.id
+        """
+        where = []
+        args = []
+        
+        # Истекшие подписки бот сам переводит в is_active = false
+        if status == 'active':
+            where.append("s.is_active = true")
+        elif status == 'expired':
+            where.append("s.is_active = false")
+        
+        # Запрос без курсора нужен для оценки общего количества
+        count_query = base_query + where_clause(where)
+        
+        # Подписки без end_date идут первыми, как в индексе (end_date DESC, id DESC)
+        if cursor:
+            end_date, sub_id = decode_cursor(cursor)
+            if end_date is None:
+                args.append(sub_id)
+                where.append("(s.end_date IS NOT NULL OR s.id < $1)")
+            else:
+                args.extend((end_date, sub_id))
+                where.append("(s.end_date, s.id) < ($1, $2)")
+        
+        query = base_query + where_clause(where)
+        query += " ORDER BY s.end_date DESC NULLS FIRST, s.id DESC LIMIT $%d" % (len(args) + 1)
+        
+        rows = await fetch_query(query, *args, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        subs_list = []
+        for sub in rows:
+            subs_list.append({
+                'id': sub['id'],
+                'user': {
+                    'id': sub['user_id'],
+                    'telegram_id': sub['telegram_id'],
+                    'username': sub['username'],
+                    'full_name': sub['full_name']
+                },
+                'start_date': sub['start_date'].isoformat() if sub['start_date'] else None,
+                'end_date': sub['end_date'].isoformat() if sub['end_date'] else None,
+                'is_active': sub['is_active'],
+                'request_limit': sub['request_limit'],
+                'used_requests': sub['used_requests'],
+                'created_at': sub['created_at'].isoformat() if sub['created_at'] else None
+            })
+        
+        result = {
+            'success': True,
+            'subscriptions': subs_list,
+            'next_cursor': encode_cursor(rows[-1]['end_date'], rows[-1]['id']) if has_more else None
+        }
+        
+        if with_total:
+            result['total'] = await estimate_count(count_query)
+        
+        return result, 200
+    except InvalidCursor as e:
+        return {'success': False, 'error': str(e), 'subscriptions': []}, 400
+    except Exception as e:
+        print(f"Error in subscriptions API: {e}")
+        return {'success': False, 'error': str(e), 'subscriptions': []}, 500
+
+async def extend_subscription(sub_id, data):
+    """Продлить подписку"""
+    try:
+        days = (data or {}).get('days', 30)
+        
+        result = await execute_query("""
+            UPDATE subscriptions 
+            SET end_date = end_date + INTERVAL '%s days',
+                is_active = true,
+                reminder_sent = false,
+                updated_at = NOW()
+            WHERE id = $1
+            RETURNING id
+        """ % days, sub_id)
+        
+        if result:
+            return {'success': True, 'message': 'Подписка продлена'}, 200
+        else:
+            return {'success': False, 'error': 'Подписка не найдена'}, 404
+    except Exception as e:
+        print(f"Error extending subscription: {e}")
+        return {'success': False, 'error': str(e)}, 500
+
+async def cancel_subscription(sub_id):
+    """Отменить подписку"""
+    try:
+        result = await execute_query("""
+            UPDATE subscriptions 
+            SET is_active = false,
+                updated_at = NOW()
+            WHERE id = $1
+            RETURNING id
+        """, sub_id)
+        
+        if result:
+            return {'success': True, 'message': 'Подписка отменена'}, 200
+        else:
+            return {'success': False, 'error': 'Подписка не найдена'}, 404
+    except Exception as e:
+        print(f"Error canceling subscription: {e}")
+        return {'success': False, 'error': str(e)}, 500
+
+async def get_user(user_id):
+    """Получить информацию о пользователе"""
+    try:
+        # Получаем пользователя
+        user = await fetch_one("""
+            SELECT 
+                u.*,
+                s.id as subscription_id,
+                s.start_date as sub_start,
+                s.end_date as sub_end,
+                s.is_active as sub_active,
+                s.request_limit,
+                s.used_requests
+            FROM users u
+            LEFT JOIN subscriptions s ON u.id = s.user_id AND s.is_active = true
+            WHERE u.id = $1
+        """, user_id)
+        
+        if not user:
+            return {'success': False, 'error': 'Пользователь не найден'}, 404
+        
+        user_data = {
+            'id': user['id'],
+            'telegram_id': user['telegram_id'],
+            'username': user['username'],
+            'full_name': user['full_name'],
+            'created_at': user['created_at'].isoformat(),
+            'subscription': None
+        }
+        
+        if user['subscription_id']:
+            user_data['subscription'] = {
+                'id': user['subscription_id'],
+                'start_date': user['sub_start'].isoformat(),
+                'end_date': user['sub_end'].isoformat(),
+                'is_active': user['sub_active'],
+                'request_limit': user['request_limit'],
+                'used_requests': user['used_requests']
+            }
+        
+        # История подписок
+        sub_history = await fetch_query("""
+            SELECT 
+                s.*
+            FROM subscriptions s
+            WHERE s.user_id = $1 
+            ORDER BY s.created_at DESC 
+            LIMIT 10
+        """, user_id)
+        
+        # История платежей
+        payments = await fetch_query("""
+            SELECT 
+                p.*
+            FROM payments p
+            WHERE p.user_id = $1 
+            ORDER BY p.created_at DESC 
+            LIMIT 10
+        """, user_id)
+        
+        return {
+            'success': True,
+            'user': user_data,
+            'subscription_history': [
+                {
+                    'id': sub['id'],
+                    'start_date': sub['start_date'].isoformat(),
+                    'end_date': sub['end_date'].isoformat(),
+                    'is_active': sub['is_active'],
+                    'created_at': sub['created_at'].isoformat()
+                } for sub in sub_history
+            ],
+            'payments': [
+                {
+                    'id': p['id'],
+                    'amount': float(p['amount']) if p['amount'] else 0,
+                    'status': p['status'] or 'unknown',
+                    'created_at': p['created_at'].isoformat() if p['created_at'] else None
+                } for p in payments
+            ]
+        }, 200
+    except Exception as e:
+        print(f"Error getting user: {e}")
+        return {'success': False, 'error': str(e)}, 500
+
+async def add_subscription(user_id, data):
+    """Добавить подписку пользователю"""
+    try:
+        days = (data or {}).get('days', 30)
+        
+        # Отключаем старую активную подписку
+        await execute_query("""
+            UPDATE subscriptions 
+            SET is_active = false 
+            WHERE user_id = $1 AND is_active = true
+        """, user_id)
+        
+        # Создаем новую подписку
+        result = await execute_query("""
+            INSERT INTO subscriptions (
+                user_id, 
+                start_date, 
+                end_date, 
+                is_active, 
+                request_limit,
+                used_requests
+            ) VALUES ($1, NOW(), NOW() + INTERVAL '%s days', true, 50, 0)
+            RETURNING id
+        """ % days, user_id)
+        
+        return {
+            'success': True, 
+            'message': 'Подписка добавлена',
+            'subscription_id': result if result else None
+        }, 200
+    except Exception as e:
+        print(f"Error adding subscription: {e}")
+        return {'success': False, 'error': str(e)}, 500
+
+async def restart_bot():
+    """Перезапуск бота"""
+    try:
+        return {'success': True, 'message': 'Команда перезапуска отправлена'}, 200
+    except Exception as e:
+        return {'success': False, 'error': str(e)}, 500
+
+async def bot_status():
+    """Статус бота"""
+    try:
+        # Простая проверка подключения к БД
+        await fetch_val("SELECT 1")
+        return {
+            'success': True,
+            'status': 'online',
+            'last_active': datetime.now().isoformat()
+        }, 200
+    except Exception as e:
+        print(f"Bot status error: {e}")
+        return {
+            'success': True,
+            'status': 'offline',
+            'last_active': datetime.now().isoformat(),
+            'error': str(e)
+        }, 200
+
+# Экспорт данных
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8'
+}
+
+EXPORT_QUERIES = {
+    'users': """
+        SELECT 
+            u.id,
+            u.telegram_id,
+            u.username,
+            u.full_name,
+            u.created_at,
+            s.id as subscription_id,
+            s.start_date as subscription_start,
+            s.end_date as subscription_end,
+            s.is_active as subscription_active,
+            s.request_limit,
+            s.used_requests
+        FROM users u
+        LEFT JOIN subscriptions s ON u.id = s.user_id AND s.is_active = true
+        ORDER BY u.id
+    """,
+    'subscriptions': """
+        SELECT 
+            s.*, 
+            u.telegram_id, 
+            u.username, 
+            u.full_name
+        FROM subscriptions s
+        JOIN users u ON s.user_id = u.id
+        ORDER BY s.id
+    """,
+    'payments': """
+        SELECT 
+            p.*,
+            u.telegram_id
+        FROM payments p
+        LEFT JOIN users u ON p.user_id = u.id
+        WHERE ($1::date IS NULL OR p.created_at >= $1::date)
+        AND ($2::date IS NULL OR p.created_at < $2::date + 1)
+        ORDER BY p.id
+    """
+}
+
+# Сколько строк склеивать в один кусок ответа
+EXPORT_CHUNK_ROWS = 200
+
+class ExportError(ValueError):
+    pass
+
+def _export_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        raise ExportError(f'Некорректная дата: {value}')
+
+def export_params(kind, fmt, date_from=None, date_to=None):
+    """Проверка параметров экспорта, возвращает аргументы запроса"""
+    if kind not in EXPORT_QUERIES:
+        raise ExportError('Неизвестный тип выгрузки')
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError('Неизвестный формат выгрузки')
+    if kind == 'payments':
+        return [_parse_date(date_from), _parse_date(date_to)]
+    return []
+
+async def export_rows(kind, fmt, args):
+    """Потоковая выгрузка таблицы в NDJSON или CSV кусками текста"""
+    buffer = io.StringIO()
+    writer = None
+    count = 0
+
+    async for row in stream_query(EXPORT_QUERIES[kind], *args):
+        if fmt == 'csv':
+            if writer is None:
+                writer = csv.writer(buffer)
+                writer.writerow(row.keys())
+            writer.writerow(_export_value(v) for v in row.values())
+        else:
+            buffer.write(json.dumps({k: _export_value(v) for k, v in row.items()}, ensure_ascii=False))
+            buffer.write('\n')
+
+        count += 1
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
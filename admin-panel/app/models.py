@@ -18,7 +18,7 @@ class User:
                    COUNT(DISTINCT ul.id) as links_count,
                    COUNT(DISTINCT s.id) as subscriptions_count,
                    MAX(s.end_date) as subscription_end,
-                   BOOL_OR(s.is_active AND s.end_date > NOW()) as has_active_sub
+                   BOOL_OR(s.is_active) as has_active_sub
             FROM users u
             LEFT JOIN user_links ul ON u.id = ul.user_id
             LEFT JOIN subscriptions s ON u.id = s.user_id
@@ -37,7 +37,7 @@ class User:
             params.extend([search_param, search_param, search_param])
         
         if filter_type == 'active':
-            where_clauses.append("s.is_active = TRUE AND s.end_date > NOW()")
+            where_clauses.append("s.is_active = TRUE")
         elif filter_type == 'inactive':
             where_clauses.append("(s.is_active = FALSE OR s.id IS NULL)")
         
@@ -122,9 +122,9 @@ class Subscription:
         params = []
         
         if filter_type == 'active':
-            where_clauses.append("s.is_active = TRUE AND s.end_date > NOW()")
+            where_clauses.append("s.is_active = TRUE")
         elif filter_type == 'expired':
-            where_clauses.append("s.is_active = FALSE OR s.end_date <= NOW()")
+            where_clauses.append("s.is_active = FALSE")
         elif filter_type == 'trial':
             where_clauses.append("s.plan = 'Пробный'")
         
@@ -152,8 +152,8 @@ class Subscription:
         query = """
             SELECT 
                 COUNT(*) as total_subscriptions,
-                COUNT(CASE WHEN is_active = TRUE AND end_date > NOW() THEN 1 END) as active_subscriptions,
-                COUNT(CASE WHEN is_active = FALSE OR end_date <= NOW() THEN 1 END) as expired_subscriptions,
+                COUNT(CASE WHEN is_active = TRUE THEN 1 END) as active_subscriptions,
+                COUNT(CASE WHEN is_active = FALSE THEN 1 END) as expired_subscriptions,
                 AVG(EXTRACT(DAY FROM (end_date - start_date))) as avg_duration,
                 SUM(request_limit - used_requests) as total_requests_available,
                 SUM(used_requests) as total_requests_used
@@ -0,0 +1,247 @@
+"""Асинхронный режим админ-панели (ADMIN_SERVER_MODE=async).
+
+Тот же набор маршрутов и JSON-ответов, что и в app.py, но все запросы
+обслуживаются в одном event loop aiohttp с общим пулом asyncpg.
+Сессия хранится в том же подписанном cookie, что и у Flask, поэтому
+оба режима взаимозаменяемы за балансировщиком.
+"""
+import os
+from datetime import datetime, timedelta
+
+from aiohttp import web
+from flask import Flask, render_template
+
+import api
+from db import close_pool
+from settings import SECRET_KEY, ADMINS, HOST, PORT, SESSION_TIMEOUT_HOURS, check_credentials
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Flask используется только для подписи cookie сессии и рендеринга шаблонов
+_flask = Flask(__name__, static_folder='static', template_folder='templates')
+_flask.secret_key = SECRET_KEY
+_serializer = _flask.session_interface.get_signing_serializer(_flask)
+SESSION_COOKIE = _flask.config['SESSION_COOKIE_NAME']
+
+routes = web.RouteTableDef()
+
+def render(template):
+    with _flask.test_request_context():
+        html = render_template(template)
+    return web.Response(text=html, content_type='text/html')
+
+def redirect(location):
+    return web.Response(status=302, headers={'Location': location})
+
+def respond(result):
+    payload, status = result
+    return web.json_response(payload, status=status)
+
+def int_arg(request, name, default):
+    try:
+        return int(request.query.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+def flag_arg(request, name):
+    return request.query.get(name, '').lower() in ('1', 'true', 'yes')
+
+async def json_body(request):
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+def is_authenticated(request):
+    return request['session'].get('_user_id') in ADMINS
+
+# Сессии
+def load_session(request):
+    value = request.cookies.get(SESSION_COOKIE)
+    if not value:
+        return {}
+    try:
+        max_age = int(_flask.permanent_session_lifetime.total_seconds())
+        return dict(_serializer.loads(value, max_age=max_age))
+    except Exception:
+        return {}
+
+def save_session(request, response):
+    session = request['session']
+    if session:
+        response.set_cookie(SESSION_COOKIE, _serializer.dumps(session), httponly=True, path='/')
+    elif SESSION_COOKIE in request.cookies:
+        response.del_cookie(SESSION_COOKIE, path='/')
+
+@web.middleware
+async def session_middleware(request, handler):
+    """Загрузка сессии и проверка активности"""
+    request['session'] = session = load_session(request)
+
+    if session.get('_user_id'):
+        last_activity = session.get('last_activity')
+        if last_activity:
+            try:
+                last_activity = datetime.fromisoformat(last_activity)
+                if datetime.now() - last_activity > timedelta(hours=SESSION_TIMEOUT_HOURS):
+                    session.clear()
+                    response = redirect('/login')
+                    save_session(request, response)
+                    return response
+            except ValueError:
+                pass
+        session['last_activity'] = datetime.now().isoformat()
+
+    response = await handler(request)
+    save_session(request, response)
+    return response
+
+def admin_required(handler):
+    async def wrapper(request):
+        if not is_authenticated(request):
+            return web.json_response({'success': False, 'error': 'Требуется авторизация'}, status=401)
+        return await handler(request)
+    return wrapper
+
+def login_required(handler):
+    async def wrapper(request):
+        if not is_authenticated(request):
+            return redirect('/login')
+        return await handler(request)
+    return wrapper
+
+# Маршруты
+@routes.get('/')
+@login_required
+async def index(request):
+    return render('index.html')
+
+@routes.get('/login')
+async def login_page(request):
+    if is_authenticated(request):
+        return redirect('/')
+    return render('login.html')
+
+@routes.post('/login')
+async def login(request):
+    if is_authenticated(request):
+        return redirect('/')
+
+    form = await request.post()
+    username = form.get('username', '').strip()
+    password = form.get('password', '')
+
+    if check_credentials(username, password):
+        request['session'].update({
+            '_user_id': username,
+            '_fresh': True,
+            'last_activity': datetime.now().isoformat()
+        })
+        return web.json_response({'success': True, 'redirect': '/'})
+
+    return web.json_response({'success': False, 'error': 'Неверные данные'})
+
+@routes.get('/logout')
+@login_required
+async def logout(request):
+    request['session'].clear()
+    return redirect('/login')
+
+# API маршруты
+@routes.get('/api/stats')
+@admin_required
+async def api_stats(request):
+    return respond(await api.stats())
+
+@routes.get('/api/users')
+@admin_required
+async def api_users(request):
+    limit = int_arg(request, 'limit', 20)
+    cursor = request.query.get('cursor') or None
+    return respond(await api.users(limit, cursor, flag_arg(request, 'with_total')))
+
+@routes.get('/api/subscriptions')
+@admin_required
+async def api_subscriptions(request):
+    status = request.query.get('status', 'all')
+    limit = int_arg(request, 'limit', 50)
+    cursor = request.query.get('cursor') or None
+    return respond(await api.subscriptions(status, limit, cursor, flag_arg(request, 'with_total')))
+
+@routes.post('/api/subscription/{sub_id:\\d+}/extend')
+@admin_required
+async def api_extend_subscription(request):
+    sub_id = int(request.match_info['sub_id'])
+    return respond(await api.extend_subscription(sub_id, await json_body(request)))
+
+@routes.post('/api/subscription/{sub_id:\\d+}/cancel')
+@admin_required
+async def api_cancel_subscription(request):
+    sub_id = int(request.match_info['sub_id'])
+    return respond(await api.cancel_subscription(sub_id))
+
+@routes.get('/api/user/{user_id:\\d+}')
+@admin_required
+async def api_get_user(request):
+    user_id = int(request.match_info['user_id'])
+    return respond(await api.get_user(user_id))
+
+@routes.post('/api/user/{user_id:\\d+}/add_subscription')
+@admin_required
+async def api_add_subscription(request):
+    user_id = int(request.match_info['user_id'])
+    return respond(await api.add_subscription(user_id, await json_body(request)))
+
+@routes.post('/api/bot/restart')
+@admin_required
+async def api_restart_bot(request):
+    return respond(await api.restart_bot())
+
+@routes.get('/api/bot/status')
+@admin_required
+async def api_bot_status(request):
+    return respond(await api.bot_status())
+
+@routes.get('/api/export/{kind}')
+@admin_required
+async def api_export(request):
+    """Потоковая выгрузка пользователей, подписок или платежей"""
+    kind = request.match_info['kind']
+    fmt = request.query.get('format', 'ndjson')
+    try:
+        args = api.export_params(kind, fmt, request.query.get('from'), request.query.get('to'))
+    except api.ExportError as e:
+        return web.json_response({'success': False, 'error': str(e)}, status=400)
+
+    response = web.StreamResponse(headers={
+        'Content-Type': api.EXPORT_FORMATS[fmt],
+        'Content-Disposition': f'attachment; filename={kind}.{fmt}'
+    })
+    save_session(request, response)
+    await response.prepare(request)
+
+    rows = api.export_rows(kind, fmt, args)
+    try:
+        async for chunk in rows:
+            await response.write(chunk.encode())
+    finally:
+        await rows.aclose()
+
+    await response.write_eof()
+    return response
+
+async def _on_cleanup(app):
+    await close_pool()
+
+def create_app():
+    app = web.Application(middlewares=[session_middleware])
+    app.add_routes(routes)
+    app.router.add_static('/static', os.path.join(BASE_DIR, 'static'))
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+def run():
+    web.run_app(create_app(), host=HOST, port=PORT)
+
+if __name__ == '__main__':
+    run()
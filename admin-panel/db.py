@@ -0,0 +1,84 @@
+import asyncio
+import json
+import asyncpg
+
+from settings import DB_CONFIG, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE
+
+# Пул создается в том event loop, где выполняется первый запрос,
+# и дальше используется только в нем.
+_pool = None
+_pool_lock = asyncio.Lock()
+
+async def get_pool():
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(
+                    **DB_CONFIG,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE
+                )
+    return _pool
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+async def execute_query(query, *args):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.execute(query, *args)
+
+async def fetch_query(query, *args):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetch(query, *args)
+
+async def fetch_one(query, *args):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchrow(query, *args)
+
+async def fetch_val(query, *args):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval(query, *args)
+
+async def estimate_count(query, *args):
+    """Приблизительное количество строк запроса по оценке планировщика"""
+    plan = await fetch_val("EXPLAIN (FORMAT JSON) " + query, *args)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+# Проверка наличия колонок в таблице
+async def check_column_exists(table, column):
+    result = await fetch_val("""
+        SELECT COUNT(*)
+        FROM information_schema.columns 
+        WHERE table_name = $1 AND column_name = $2
+    """, table, column)
+    return result > 0
+
+# Проверка существования таблицы
+async def table_exists(table_name):
+    result = await fetch_val("""
+        SELECT COUNT(*) 
+        FROM information_schema.tables 
+        WHERE table_name = $1
+    """, table_name)
+    return result > 0
+
+async def stream_query(query, *args, prefetch=500):
+    """Построчное чтение результата через серверный курсор.
+
+    Соединение занято, пока генератор не будет исчерпан или закрыт.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction(readonly=True):
+            async for row in conn.cursor(query, *args, prefetch=prefetch):
+                yield row
@@ -0,0 +1,38 @@
+import os
+import hashlib
+
+SECRET_KEY = os.getenv("SECRET_KEY", "admin-secret-key-change-me")
+
+# Конфигурация БД
+DB_CONFIG = {
+    'host': os.getenv("DB_HOST", "postgres"),
+    'port': os.getenv("DB_PORT", "5432"),
+    'database': os.getenv("DB_NAME", "avito_bot"),
+    'user': os.getenv("DB_USER", "postgres"),
+    'password': os.getenv("DB_PASSWORD", "1")
+}
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+
+# Режим сервера: flask (по умолчанию) или async
+SERVER_MODE = os.getenv("ADMIN_SERVER_MODE", "flask")
+HOST = os.getenv("ADMIN_HOST", "0.0.0.0")
+PORT = int(os.getenv("ADMIN_PORT", "5000"))
+
+# Время жизни сессии без активности
+SESSION_TIMEOUT_HOURS = 1
+
+# Админские учетки
+ADMINS = {
+    'admin': {
+        'password': hashlib.sha256('Admin123!'.encode()).hexdigest(),
+        'name': 'Администратор'
+    }
+}
+
+def check_credentials(username, password):
+    """Проверка логина и пароля администратора"""
+    if username not in ADMINS:
+        return False
+    hashed_password = hashlib.sha256(password.encode()).hexdigest()
+    return ADMINS[username]['password'] == hashed_password
@@ -1,24 +1,49 @@
-async function loadSubscriptions() {
+let subscriptionsCursor = null;
+
+async function loadSubscriptions(append = false) {
     try {
         const filter = document.getElementById('subscription-filter')?.value || 'all';
-
-        const response = await api.get('/api/subscriptions', {
+        const params = {
             status: filter !== 'all' ? filter : ''
-        });
+        };
+
+        if (append && subscriptionsCursor) {
+            params.cursor = subscriptionsCursor;
+        }
+
+        const response = await api.get('/api/subscriptions', params);
 
         if (response.success) {
-            updateSubscriptionsTable(response.subscriptions);
+            subscriptionsCursor = response.next_cursor;
+            updateSubscriptionsTable(response.subscriptions, append);
+            updateSubscriptionsLoadMore();
         }
     } catch (error) {
         console.error('Error loading subscriptions:', error);
     }
 }
 
-function updateSubscriptionsTable(subscriptions) {
+function updateSubscriptionsLoadMore() {
+    const container = document.getElementById('subscriptions-pagination');
+    if (!container) return;
+
+    container.innerHTML = '';
+
+    if (subscriptionsCursor) {
+        const moreBtn = document.createElement('button');
+        moreBtn.textContent = 'Показать еще';
+        moreBtn.onclick = () => loadSubscriptions(true);
+        container.appendChild(moreBtn);
+    }
+}
+
+function updateSubscriptionsTable(subscriptions, append = false) {
     const tbody = document.getElementById('subscriptions-table-body');
-    tbody.innerHTML = '';
+    if (!append) {
+        tbody.innerHTML = '';
+    }
 
-    if (subscriptions.length === 0) {
+    if (subscriptions.length === 0 && !append) {
         tbody.innerHTML = `
             <tr>
                 <td colspan="6" class="text-center">Нет подписок</td>
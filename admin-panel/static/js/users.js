@@ -1,16 +1,28 @@
 let currentPage = 1;
 let totalPages = 1;
+// Курсоры страниц: pageCursors[n] - курсор, с которого начинается страница n
+let pageCursors = { 1: null };
 
 async function loadUsers(page = 1) {
     try {
+        if (!(page in pageCursors)) {
+            page = 1;
+        }
+        if (page === 1) {
+            pageCursors = { 1: null };
+        }
         currentPage = page;
 
         const search = document.getElementById('user-search')?.value || '';
         const params = {
-            page: page,
-            limit: 20
+            limit: 20,
+            with_total: 1
         };
 
+        if (pageCursors[page]) {
+            params.cursor = pageCursors[page];
+        }
+
         if (search) {
             // Поиск будет обрабатываться на сервере
             // Пока просто перезагружаем список
@@ -19,8 +31,11 @@ async function loadUsers(page = 1) {
         const response = await api.get('/api/users', params);
 
         if (response.success) {
+            if (response.next_cursor) {
+                pageCursors[page + 1] = response.next_cursor;
+            }
             updateUsersTable(response.users);
-            updatePagination(page, response.total_pages);
+            updatePagination(page, response.total_pages, Boolean(response.next_cursor));
         }
     } catch (error) {
         console.error('Error loading users:', error);
@@ -80,13 +95,14 @@ function updateUsersTable(users) {
     });
 }
 
-function updatePagination(page, total) {
+function updatePagination(page, total, hasNext) {
     const pagination = document.getElementById('users-pagination');
     pagination.innerHTML = '';
 
-    totalPages = total;
+    // Общее количество приблизительное, переход возможен только на соседние страницы
+    totalPages = Math.max(total || 1, hasNext ? page + 1 : page);
 
-    if (totalPages <= 1) return;
+    if (page === 1 && !hasNext) return;
 
     // Предыдущая страница
     if (page > 1) {
@@ -96,22 +112,14 @@ function updatePagination(page, total) {
         pagination.appendChild(prevBtn);
     }
 
-    // Страницы
-    const startPage = Math.max(1, page - 2);
-    const endPage = Math.min(totalPages, page + 2);
-
-    for (let i = startPage; i <= endPage; i++) {
-        const pageBtn = document.createElement('button');
-        pageBtn.textContent = i;
-        if (i === page) {
-            pageBtn.classList.add('active');
-        }
-        pageBtn.onclick = () => loadUsers(i);
-        pagination.appendChild(pageBtn);
-    }
+    // Текущая страница
+    const pageBtn = document.createElement('button');
+    pageBtn.textContent = `${page} из ~${totalPages}`;
+    pageBtn.classList.add('active');
+    pagination.appendChild(pageBtn);
 
     // Следующая страница
-    if (page < totalPages) {
+    if (hasNext) {
         const nextBtn = document.createElement('button');
         nextBtn.innerHTML = '<i class="fas fa-chevron-right"></i>';
         nextBtn.onclick = () => loadUsers(page + 1);
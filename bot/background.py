@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import asyncpg
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTask:
+    """Основа фоновых служб процесса.
+
+    start() запускает корутину _run() отдельной задачей, stop() отменяет ее
+    и дожидается завершения. Подклассы реализуют _run() и при необходимости
+    дополняют start() и stop().
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._db = None
+
+    async def start(self, db=None):
+        self._db = db
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        raise NotImplementedError
+
+
+class Listener(BackgroundTask):
+    """Соединение с LISTEN на канал Postgres.
+
+    Уведомления передаются в on_notify(payload). Раз в interval секунд
+    соединение проверяется и при обрыве открывается заново, после каждого
+    подключения вызывается on_connect(): уведомления, пришедшие без
+    соединения, потеряны, и состояние нужно перечитать.
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        on_notify: Callable[[str], None],
+        on_connect: Callable[[], Awaitable],
+        interval: float = Config.LISTEN_CHECK_INTERVAL,
+    ):
+        super().__init__()
+        self.channel = channel
+        self.on_notify = on_notify
+        self.on_connect = on_connect
+        self.interval = interval
+        self._conn: asyncpg.Connection | None = None
+
+    async def stop(self):
+        await super().stop()
+        if self._conn is not None:
+            self._conn.terminate()
+            self._conn = None
+
+    async def _run(self):
+        while True:
+            try:
+                if self._conn is None or self._conn.is_closed():
+                    self._conn = await self._db.connect()
+                    await self._conn.add_listener(self.channel, self._notify)
+                    await self.on_connect()
+                else:
+                    await self._conn.execute("SELECT 1", timeout=self.interval)
+            except Exception as e:
+                logger.warning(f"Ошибка подписки на канал {self.channel}: {e}")
+                if self._conn is not None:
+                    self._conn.terminate()
+                    self._conn = None
+            await asyncio.sleep(self.interval)
+
+    def _notify(self, conn, pid, channel, payload):
+        self.on_notify(payload)
@@ -0,0 +1,43 @@
+import time
+from collections import OrderedDict
+from typing import Any
+
+
+class UserCache:
+    """Ограниченный LRU-кэш пользователей с временем жизни записей"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: OrderedDict[int, tuple[float, dict[str, Any]]] = OrderedDict()
+
+    def get(self, telegram_id: int) -> dict[str, Any] | None:
+        """Получить пользователя из кэша (None, если нет или устарел)"""
+        item = self._items.get(telegram_id)
+        if item is None:
+            return None
+
+        expires_at, user = item
+        if expires_at < time.monotonic():
+            del self._items[telegram_id]
+            return None
+
+        self._items.move_to_end(telegram_id)
+        return dict(user)
+
+    def set(self, telegram_id: int, user: dict[str, Any]):
+        """Положить пользователя в кэш"""
+        self._items[telegram_id] = (time.monotonic() + self.ttl, dict(user))
+        self._items.move_to_end(telegram_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, telegram_id: int):
+        """Удалить пользователя из кэша"""
+        self._items.pop(telegram_id, None)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
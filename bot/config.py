@@ -19,6 +19,91 @@ class Config:
     DB_NAME = os.getenv("DB_NAME", "avito_bot")
     DB_USER = os.getenv("DB_USER", "postgres")
     DB_PASSWORD = os.getenv("DB_PASSWORD", "")
+    # Пул соединений (таймауты и время жизни в секундах)
+    DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "5"))
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+    DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "10"))
+    DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "5"))
+    DB_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", "300"))
+    DB_MAX_QUERIES = int(os.getenv("DB_MAX_QUERIES", "50000"))
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+    # Соединение, простоявшее дольше этого времени, проверяется перед выдачей
+    DB_HEALTH_CHECK_IDLE = float(os.getenv("DB_HEALTH_CHECK_IDLE", "30"))
+    DB_HEALTH_CHECK_TIMEOUT = float(os.getenv("DB_HEALTH_CHECK_TIMEOUT", "2"))
+
+    # Режим получения апдейтов: polling или webhook
+    BOT_MODE = os.getenv("BOT_MODE", "polling")
+    # Публичный адрес, на который Telegram шлет апдейты (для webhook)
+    WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+    # Сколько одновременных соединений Telegram держит к вебхуку (1-100)
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    WEBHOOK_HANDLE_IN_BACKGROUND = (
+        os.getenv("WEBHOOK_HANDLE_IN_BACKGROUND", "true").lower() == "true"
+    )
+    # Число процессов бота (больше одного - только в режиме webhook)
+    BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+    # Как часто процессы пытаются стать лидером для фоновых задач (секунды)
+    LEADER_CHECK_INTERVAL = float(os.getenv("LEADER_CHECK_INTERVAL", "10"))
+    # Сколько апдейтов процесс обрабатывает одновременно
+    UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "100"))
+    # Уведомления Яндекс Кассы (в режиме polling сервер поднимается, если включено)
+    YOOKASSA_WEBHOOK_ENABLED = (
+        os.getenv("YOOKASSA_WEBHOOK_ENABLED", "false").lower() == "true"
+    )
+    YOOKASSA_WEBHOOK_PATH = os.getenv("YOOKASSA_WEBHOOK_PATH", "/yookassa/webhook")
+    YOOKASSA_WEBHOOK_CHECK_IP = (
+        os.getenv("YOOKASSA_WEBHOOK_CHECK_IP", "true").lower() == "true"
+    )
+    # Балансировщики перед ботом (через запятую, адреса или сети). Только от
+    # них адрес кассы берется из X-Forwarded-For; без них за балансировщиком
+    # проверка адреса отклонит все уведомления
+    YOOKASSA_TRUSTED_PROXIES = [
+        network.strip()
+        for network in os.getenv("YOOKASSA_TRUSTED_PROXIES", "").split(",")
+        if network.strip()
+    ]
+
+    # Ограничение частоты запросов: имя лимита -> (токенов в секунду, емкость)
+    THROTTLE_BACKEND = os.getenv("THROTTLE_BACKEND", "memory")  # memory или postgres
+    THROTTLE_LIMITS = {
+        "default": (
+            float(os.getenv("THROTTLE_DEFAULT_RATE", "1")),
+            int(os.getenv("THROTTLE_DEFAULT_BURST", "5")),
+        ),
+        "links": (
+            float(os.getenv("THROTTLE_LINKS_RATE", "0.2")),
+            int(os.getenv("THROTTLE_LINKS_BURST", "3")),
+        ),
+        "payments": (
+            float(os.getenv("THROTTLE_PAYMENTS_RATE", "0.1")),
+            int(os.getenv("THROTTLE_PAYMENTS_BURST", "2")),
+        ),
+    }
+
+    # Лимиты исходящих сообщений Telegram (сообщений в секунду)
+    SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+    SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+    SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))
+    SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+    # Рассылки используют только часть общего лимита
+    BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "20"))
+
+    # Окончание подписок: окно предзагрузки (секунды) и напоминания
+    EXPIRY_HORIZON = float(os.getenv("EXPIRY_HORIZON", "3600"))
+    EXPIRY_HEAP_SIZE = int(os.getenv("EXPIRY_HEAP_SIZE", "10000"))
+    EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", "500"))
+    EXPIRY_REMINDER_DAYS = int(os.getenv("EXPIRY_REMINDER_DAYS", "3"))
+    EXPIRY_REMINDER_INTERVAL = float(os.getenv("EXPIRY_REMINDER_INTERVAL", "600"))
+    # Через сколько секунд недоставленное напоминание можно захватить снова
+    EXPIRY_REMINDER_LEASE = float(os.getenv("EXPIRY_REMINDER_LEASE", "3600"))
+
+    # Кэш пользователей
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))  # секунды
 
     # YooKassa
     YOOKASSA_SHOP_ID = os.getenv("YOOKASSA_SHOP_ID", "")
@@ -26,6 +111,24 @@ class Config:
     YOOKASSA_RETURN_URL = os.getenv(
         "YOOKASSA_RETURN_URL", "https://t.me/avitoparser_rus_bot"
     )
+    # Адрес API можно переопределить, например, на локальную заглушку
+    YOOKASSA_API_URL = os.getenv("YOOKASSA_API_URL", "https://api.yookassa.ru/v3")
+    YOOKASSA_TIMEOUT = float(os.getenv("YOOKASSA_TIMEOUT", "10"))  # секунды
+    YOOKASSA_MAX_CONNECTIONS = int(os.getenv("YOOKASSA_MAX_CONNECTIONS", "20"))
+    YOOKASSA_RETRIES = int(os.getenv("YOOKASSA_RETRIES", "2"))
+    # Пакетная обработка вебхуков
+    WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "500"))
+    WEBHOOK_FLUSH_INTERVAL = float(os.getenv("WEBHOOK_FLUSH_INTERVAL", "1"))  # секунды
+    # Фоновая сверка платежей в ожидании (интервалы в секундах)
+    RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "30"))
+    RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "50"))
+    RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "5"))
+    RECONCILE_MIN_AGE = int(os.getenv("RECONCILE_MIN_AGE", "30"))
+    RECONCILE_BACKOFF_BASE = int(os.getenv("RECONCILE_BACKOFF_BASE", "30"))
+    RECONCILE_BACKOFF_MAX = int(os.getenv("RECONCILE_BACKOFF_MAX", "3600"))
+
+    # Как часто проверять соединения LISTEN (тарифы, окончания подписок), секунды
+    LISTEN_CHECK_INTERVAL = float(os.getenv("LISTEN_CHECK_INTERVAL", "30"))
 
     # Settings for receipts (54-ФЗ)
     DEFAULT_EMAIL = os.getenv("DEFAULT_EMAIL", "user@example.com")
@@ -38,6 +141,14 @@ class Config:
     # Admin panel
     ADMIN_PANEL_URL = os.getenv("ADMIN_PANEL_URL", "http://localhost:5000")
 
+    # Метрики Prometheus
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+    # Апдейты дольше этого порога логируются с разбивкой времени (секунды)
+    SLOW_UPDATE_THRESHOLD = float(os.getenv("SLOW_UPDATE_THRESHOLD", "1"))
+
     # Logging
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
@@ -74,6 +185,15 @@ class Config:
         if not cls.DB_PASSWORD:
             errors.append("DB_PASSWORD не установлен")
 
+        if cls.BOT_MODE not in ("polling", "webhook"):
+            errors.append(f"Неизвестный BOT_MODE: {cls.BOT_MODE}")
+
+        if cls.BOT_MODE == "webhook" and not cls.WEBHOOK_BASE_URL:
+            errors.append("WEBHOOK_BASE_URL не установлен")
+
+        if cls.BOT_WORKERS > 1 and cls.BOT_MODE != "webhook":
+            errors.append("Несколько процессов бота работают только в режиме webhook")
+
         # Автоматически определяем username бота из токена
         if cls.BOT_TOKEN and not cls.BOT_USERNAME:
             try:
@@ -97,25 +217,7 @@ class Config:
         if errors:
             raise ValueError(f"Ошибки конфигурации: {', '.join(errors)}")
 
-    @classmethod
-    def get_plan_by_key(cls, plan_key):
-        """Получить план по ключу"""
-        return cls.SUBSCRIPTION_PLANS.get(plan_key)
-
-    @classmethod
-    def get_all_plans(cls):
-        """Получить все планы"""
-        return cls.SUBSCRIPTION_PLANS
-
     @classmethod
     def format_price(cls, price):
         """Форматирование цены"""
         return f"{price}₽"
-
-    @classmethod
-    def get_subscription_plans_display(cls):
-        """Получить отформатированный список планов для отображения"""
-        plans_text = ""
-        for key, plan in cls.SUBSCRIPTION_PLANS.items():
-            plans_text += f"{key}. {plan['name']} - {cls.format_price(plan['price'])}\n"
-        return plans_text
@@ -1,14 +1,45 @@
+import asyncio
+import contextlib
+import time
 import asyncpg
 from typing import  Any
 from config import Config
+from cache import UserCache
+from plan_catalog import catalog
+from statements import StatementConnection, get_statement, prepare_statements
+import metrics
+import migrations
+import tracing
 import logging
 
 logger = logging.getLogger(__name__)
 
+NO_SUBSCRIPTION_MESSAGE = (
+    "❌ У вас нет активной подписки. "
+    "Нажмите '💎 Купить подписку' для приобретения доступа."
+)
 
+
+def limit_exhausted_message(used_requests: int, request_limit: int) -> str:
+    return (
+        f"❌ Вы исчерпали лимит запросов ({used_requests}/{request_limit}). "
+        "Лимит обновится при продлении подписки."
+    )
+
+
+@metrics.timed_methods(metrics.DB_QUERY_SECONDS, tracing.DB)
 class Database:
     pool: asyncpg.Pool
-    
+
+    def __init__(self):
+        self.user_cache = UserCache(Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL)
+        # Метрики насыщения пула
+        self.acquire_waiting = 0
+        self.acquire_total = 0
+        self.acquire_timeouts = 0
+        self.acquire_wait_seconds = 0.0
+        self.acquire_wait_max = 0.0
+        self.health_check_failures = 0
 
     @classmethod
     async def create(cls) -> "Database":
@@ -20,6 +51,14 @@ class Database:
                 database=Config.DB_NAME,
                 host=Config.DB_HOST,
                 port=Config.DB_PORT,
+                min_size=Config.DB_POOL_MIN_SIZE,
+                max_size=Config.DB_POOL_MAX_SIZE,
+                command_timeout=Config.DB_COMMAND_TIMEOUT,
+                max_inactive_connection_lifetime=Config.DB_MAX_INACTIVE_LIFETIME,
+                max_queries=Config.DB_MAX_QUERIES,
+                statement_cache_size=Config.DB_STATEMENT_CACHE_SIZE,
+                connection_class=StatementConnection,
+                init=prepare_statements,
             )
             logger.info("✅ Подключение к БД успешно установлено")
             return self
@@ -27,167 +66,186 @@ class Database:
             logger.error(f"❌ Ошибка подключения к БД: {e}")
             raise
 
-    async def create_tables(self):
-        """Создание таблиц"""
+    async def connect(self) -> asyncpg.Connection:
+        """Отдельное соединение вне пула (для долгих сессионных блокировок)"""
+        return await asyncpg.connect(
+            user=Config.DB_USER,
+            password=Config.DB_PASSWORD,
+            database=Config.DB_NAME,
+            host=Config.DB_HOST,
+            port=Config.DB_PORT,
+        )
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        """Взять соединение из пула.
+
+        Ожидание ограничено DB_ACQUIRE_TIMEOUT, долго простаивавшие соединения
+        проверяются перед выдачей, время ожидания попадает в метрики пула.
+        """
+        self.acquire_waiting += 1
+        started = time.monotonic()
         try:
-            async with self.pool.acquire() as conn:
-                # Таблица пользователей
-                await conn.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS users (
-                        id SERIAL PRIMARY KEY,
-                        telegram_id BIGINT UNIQUE NOT NULL,
-                        username VARCHAR(255),
-                        full_name VARCHAR(255),
-                        created_at TIMESTAMP DEFAULT NOW()
-                    )
-                """
-                )
-
-                # Таблица подписок
-                await conn.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS subscriptions (
-                        id SERIAL PRIMARY KEY,
-                        user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                        plan_key VARCHAR(50) NOT NULL,
-                        request_limit INTEGER NOT NULL,
-                        used_requests INTEGER DEFAULT 0,
-                        start_date TIMESTAMP DEFAULT NOW(),
-                        end_date TIMESTAMP,
-                        is_active BOOLEAN DEFAULT TRUE,
-                        created_at TIMESTAMP DEFAULT NOW()
-                    )
-                """
-                )
+            conn = await self._acquire_healthy()
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            logger.warning(
+                f"Пул БД исчерпан: нет свободного соединения за {Config.DB_ACQUIRE_TIMEOUT} с"
+            )
+            raise
+        finally:
+            self.acquire_waiting -= 1
 
-                # Таблица платежей
-                await conn.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS payments (
-                        id SERIAL PRIMARY KEY,
-                        user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                        subscription_id INTEGER REFERENCES subscriptions(id) ON DELETE SET NULL,
-                        payment_id VARCHAR(255) UNIQUE NOT NULL,
-                        amount DECIMAL(10, 2) NOT NULL,
-                        plan_key VARCHAR(50) NOT NULL,
-                        status VARCHAR(50) DEFAULT 'pending',
-                        created_at TIMESTAMP DEFAULT NOW(),
-                        updated_at TIMESTAMP DEFAULT NOW()
-                    )
-                """
-                )
+        waited = time.monotonic() - started
+        self.acquire_total += 1
+        self.acquire_wait_seconds += waited
+        self.acquire_wait_max = max(self.acquire_wait_max, waited)
+        try:
+            yield conn
+        finally:
+            conn.mark_released()
+            await self.pool.release(conn)
+
+    async def _acquire_healthy(self):
+        """Соединение из пула, прошедшее проверку живости"""
+        deadline = time.monotonic() + Config.DB_ACQUIRE_TIMEOUT
+        while True:
+            timeout = max(deadline - time.monotonic(), 0)
+            conn = await self.pool.acquire(timeout=timeout)
+            if conn.idle_time() < Config.DB_HEALTH_CHECK_IDLE:
+                return conn
+            try:
+                await conn.execute("SELECT 1", timeout=Config.DB_HEALTH_CHECK_TIMEOUT)
+                return conn
+            except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+                # Битое соединение закрываем: пул откроет вместо него новое
+                self.health_check_failures += 1
+                logger.warning(f"Соединение с БД не прошло проверку: {e}")
+                conn.terminate()
+                await self.pool.release(conn)
+                if time.monotonic() >= deadline:
+                    raise asyncio.TimeoutError()
+
+    def get_pool_metrics(self) -> dict[str, Any]:
+        """Состояние пула соединений"""
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        return {
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "min_size": self.pool.get_min_size(),
+            "max_size": self.pool.get_max_size(),
+            "waiting": self.acquire_waiting,
+            "acquire_total": self.acquire_total,
+            "acquire_timeouts": self.acquire_timeouts,
+            "acquire_wait_seconds": self.acquire_wait_seconds,
+            "acquire_wait_max": self.acquire_wait_max,
+            "health_check_failures": self.health_check_failures,
+        }
+
+    async def migrate(self):
+        """Применение миграций схемы"""
+        try:
+            async with self.acquire() as conn:
+                applied = await migrations.migrate(conn)
+                if applied:
+                    logger.info(f"✅ Применены миграции: {applied}")
+                else:
+                    logger.info("✅ Схема БД актуальна")
 
-                # Таблица ссылок
-                await conn.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS user_links (
-                        id SERIAL PRIMARY KEY,
-                        user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                        subscription_id INTEGER REFERENCES subscriptions(id) ON DELETE SET NULL,
-                        url TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT NOW()
-                    )
-                """
-                )
+            # Добавляем инструкции по умолчанию
+            await self.add_default_instructions()
+        except Exception as e:
+            logger.error(f"❌ Ошибка применения миграций: {e}")
+            raise
 
-                # Таблица инструкций
-                await conn.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS instructions (
-                        id SERIAL PRIMARY KEY,
-                        title VARCHAR(255) NOT NULL,
-                        text_content TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT NOW()
-                    )
-                """
-                )
+    @staticmethod
+    async def _fetch(conn, name: str, *args):
+        """Выполнить именованный запрос из реестра"""
+        statement = await get_statement(conn, name)
+        return await statement.fetch(*args)
 
-                logger.info("✅ Таблицы созданы/проверены")
+    @staticmethod
+    async def _fetchrow(conn, name: str, *args):
+        statement = await get_statement(conn, name)
+        return await statement.fetchrow(*args)
 
-                # Добавляем инструкции по умолчанию
-                await self.add_default_instructions()
-        except Exception as e:
-            logger.error(f"❌ Ошибка создания таблиц: {e}")
-            raise
+    @staticmethod
+    async def _fetchval(conn, name: str, *args):
+        statement = await get_statement(conn, name)
+        return await statement.fetchval(*args)
 
     async def get_or_create_user(
         self, telegram_id: int, username: str = None, full_name: str = None
     ):
-        """Получить или создать пользователя"""
+        """Получить или создать пользователя.
+
+        Единственный путь записи в users из бота: результат INSERT/UPDATE
+        сразу кладется в кэш, при ошибке запись из кэша удаляется.
+        """
+        user = self.user_cache.get(telegram_id)
+        if user and not self._user_changed(user, username, full_name):
+            return user
+
         try:
-            async with self.pool.acquire() as conn:
-                # Пытаемся найти пользователя
-                user = await conn.fetchrow(
-                    "SELECT * FROM users WHERE telegram_id = $1", telegram_id
-                )
+            async with self.acquire() as conn:
+                if not user:
+                    # Пытаемся найти пользователя
+                    user = await self._fetchrow(conn, "user_by_telegram_id", telegram_id)
 
                 if user:
-                    # Обновляем информацию, если она изменилась
-                    if username or full_name:
-                        await conn.execute(
-                            """
-                            UPDATE users 
-                            SET username = COALESCE($2, username),
-                                full_name = COALESCE($3, full_name)
-                            WHERE id = $1
-                            """,
+                    # Обновляем информацию, только если она изменилась
+                    if self._user_changed(user, username, full_name):
+                        user = await self._fetchrow(
+                            conn,
+                            "update_user",
                             user["id"],
                             username,
                             full_name,
                         )
-                    return dict(user)
                 else:
                     # Создаем нового пользователя
-                    new_user = await conn.fetchrow(
-                        """
-                        INSERT INTO users (telegram_id, username, full_name)
-                        VALUES ($1, $2, $3)
-                        RETURNING *
-                        """,
+                    user = await self._fetchrow(
+                        conn,
+                        "insert_user",
                         telegram_id,
                         username,
                         full_name,
                     )
-                    return dict(new_user)
+
+                user = dict(user)
+                self.user_cache.set(telegram_id, user)
+                return user
         except Exception as e:
+            self.user_cache.invalidate(telegram_id)
             logger.error(f"Ошибка get_or_create_user: {e}")
             return None
 
+    @staticmethod
+    def _user_changed(user, username: str | None, full_name: str | None) -> bool:
+        """Отличаются ли переданные данные от сохраненных"""
+        return (username is not None and username != user["username"]) or (
+            full_name is not None and full_name != user["full_name"]
+        )
+
     async def get_user_statistics(self, user_id: int) -> dict[str, Any]:
         """Получить статистику пользователя"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Получаем пользователя
-                user = await conn.fetchrow("SELECT * FROM users WHERE id = $1", user_id)
+                user = await self._fetchrow(conn, "user_by_id", user_id)
 
                 if not user:
                     return {}
 
                 # Получаем активную подписку
-                subscription = await conn.fetchrow(
-                    """
-                    SELECT * FROM subscriptions 
-                    WHERE user_id = $1 AND is_active = TRUE 
-                    ORDER BY end_date DESC LIMIT 1
-                    """,
-                    user_id,
+                subscription = await self._fetchrow(
+                    conn, "active_subscription", user_id
                 )
 
                 # Получаем общую статистику
-                stats = await conn.fetchrow(
-                    """
-                    SELECT 
-                        COUNT(DISTINCT ul.id) as total_requests,
-                        COUNT(DISTINCT p.id) as total_payments,
-                        COALESCE(SUM(p.amount) FILTER (WHERE p.status = 'succeeded'), 0) as total_spent
-                    FROM users u
-                    LEFT JOIN user_links ul ON u.id = ul.user_id
-                    LEFT JOIN payments p ON u.id = p.user_id
-                    WHERE u.id = $1
-                    """,
-                    user_id,
-                )
+                stats = await self._fetchrow(conn, "user_activity", user_id)
 
                 result = {
                     "full_name": user["full_name"],
@@ -202,10 +260,10 @@ class Database:
                 }
 
                 if subscription:
-                    plan = Config.SUBSCRIPTION_PLANS.get(subscription["plan_key"], {})
+                    plan = catalog.get(subscription["plan_key"])
                     result.update(
                         {
-                            "plan": plan.get("name", subscription["plan_key"]),
+                            "plan": plan.name if plan else subscription["plan_key"],
                             "end_date": subscription["end_date"],
                             "used_requests": subscription["used_requests"],
                             "request_limit": subscription["request_limit"],
@@ -217,125 +275,67 @@ class Database:
             logger.error(f"Ошибка get_user_statistics: {e}")
             return {}
     async def get_subscription_plans(self):
+        """Активные тарифы из tariff_plans (по возрастанию цены)"""
         try:
-            async with self.pool.acquire() as conn:
-                plans = await conn.fetch
-        catch:
-    async def check_request_limit(self, user_id: int):
-        """Проверить лимит запросов пользователя"""
+            async with self.acquire() as conn:
+                return await self._fetch(conn, "tariff_plans")
+        except Exception as e:
+            # Пустой список затер бы каталог тарифов, поэтому ошибку пробрасываем
+            logger.error(f"Ошибка get_subscription_plans: {e}")
+            raise
+
+    async def consume_request(self, user_id: int, url: str):
+        """Списать один запрос и сохранить ссылку (одна транзакция, один запрос к БД)"""
         try:
-            async with self.pool.acquire() as conn:
-                # Получаем активную подписку
-                subscription = await conn.fetchrow(
-                    """
-                    SELECT * FROM subscriptions 
-                    WHERE user_id = $1 AND is_active = TRUE 
-                    AND (end_date IS NULL OR end_date > NOW())
-                    ORDER BY end_date DESC LIMIT 1
-                    """,
-                    user_id,
-                )
+            async with self.acquire() as conn:
+                result = await self._fetchrow(conn, "consume_request", user_id, url)
 
-                if not subscription:
+                if not result:
                     return {
                         "has_access": False,
-                        "message": "❌ У вас нет активной подписки. Нажмите '💎 Купить подписку' для приобретения доступа.",
+                        "message": NO_SUBSCRIPTION_MESSAGE,
                         "remaining": 0,
                         "total": 0,
                         "subscription_id": None,
                     }
 
-                remaining = (
-                    subscription["request_limit"] - subscription["used_requests"]
-                )
+                remaining = result["request_limit"] - result["used_requests"]
 
-                if remaining <= 0:
+                if not result["consumed"]:
                     return {
                         "has_access": False,
-                        "message": f"❌ Вы исчерпали лимит запросов ({subscription['used_requests']}/{subscription['request_limit']}). Лимит обновится при продлении подписки.",
+                        "message": limit_exhausted_message(
+                            result["used_requests"], result["request_limit"]
+                        ),
                         "remaining": remaining,
-                        "total": subscription["request_limit"],
-                        "subscription_id": subscription["id"],
+                        "total": result["request_limit"],
+                        "subscription_id": result["subscription_id"],
                     }
 
                 return {
                     "has_access": True,
                     "message": "",
                     "remaining": remaining,
-                    "total": subscription["request_limit"],
-                    "subscription_id": subscription["id"],
+                    "total": result["request_limit"],
+                    "subscription_id": result["subscription_id"],
                 }
         except Exception as e:
-            logger.error(f"Ошибка check_request_limit: {e}")
-            return {
-                "has_access": False,
-                "message": "❌ Ошибка проверки лимита. Попробуйте позже.",
-                "remaining": 0,
-                "total": 0,
-                "subscription_id": None,
-            }
-
-    async def add_user_link(self, user_id: int, url: str):
-        """Добавить ссылку пользователя"""
-        try:
-            async with self.pool.acquire() as conn:
-                # Получаем активную подписку
-                subscription = await conn.fetchrow(
-                    """
-                    SELECT * FROM subscriptions 
-                    WHERE user_id = $1 AND is_active = TRUE 
-                    AND (end_date IS NULL OR end_date > NOW())
-                    ORDER BY end_date DESC LIMIT 1
-                    """,
-                    user_id,
-                )
-
-                if subscription:
-                    await conn.execute(
-                        """
-                        INSERT INTO user_links (user_id, subscription_id, url)
-                        VALUES ($1, $2, $3)
-                        """,
-                        user_id,
-                        subscription["id"],
-                        url,
-                    )
-                    return True
-                return False
-        except Exception as e:
-            logger.error(f"Ошибка add_user_link: {e}")
-            return False
+            logger.error(f"Ошибка consume_request: {e}")
+            raise
 
-    async def increment_request_count(
-        self, user_id: int, subscription_id: int, url: str
-    ):
-        """Увеличить счетчик запросов"""
-        try:
-            async with self.pool.acquire() as conn:
-                await conn.execute(
-                    """
-                    UPDATE subscriptions 
-                    SET used_requests = used_requests + 1
-                    WHERE id = $1 AND user_id = $2
-                    """,
-                    subscription_id,
-                    user_id,
-                )
+    async def take_throttle_token(self, key: str, rate: float, burst: int) -> bool:
+        """Забрать токен из общей корзины ограничения частоты.
 
-                # Также добавляем ссылку
-                await self.add_user_link(user_id, url)
-                return True
-        except Exception as e:
-            logger.error(f"Ошибка increment_request_count: {e}")
-            return False
+        Ошибки не перехватываются: решение при сбое принимает вызывающий.
+        """
+        async with self.acquire() as conn:
+            return await self._fetchval(conn, "throttle_take", key, rate, burst)
 
     async def get_instructions(self):
         """Получить инструкции"""
         try:
-            async with self.pool.acquire() as conn:
-                instructions = await conn.fetch(
-                    "SELECT * FROM instructions ORDER BY created_at DESC"
-                )
+            async with self.acquire() as conn:
+                instructions = await self._fetch(conn, "instructions")
                 return [dict(inst) for inst in instructions]
         except Exception as e:
             logger.error(f"Ошибка get_instructions: {e}")
@@ -344,20 +344,8 @@ class Database:
     async def get_statistics(self):
         """Получить общую статистику"""
         try:
-            async with self.pool.acquire() as conn:
-                stats = await conn.fetchrow(
-                    """
-                    SELECT 
-                        COUNT(DISTINCT u.id) as total_users,
-                        COUNT(DISTINCT s.id) FILTER (WHERE s.is_active = TRUE AND (s.end_date IS NULL OR s.end_date > NOW())) as current_subscribers,
-                        COUNT(DISTINCT ul.id) as total_links,
-                        COALESCE(SUM(s.used_requests), 0) as total_requests_used,
-                        COALESCE(SUM(s.request_limit), 0) as total_requests_limit
-                    FROM users u
-                    LEFT JOIN subscriptions s ON u.id = s.user_id
-                    LEFT JOIN user_links ul ON u.id = ul.user_id
-                """
-                )
+            async with self.acquire() as conn:
+                stats = await self._fetchrow(conn, "statistics")
                 return dict(stats) if stats else {}
         except Exception as e:
             logger.error(f"Ошибка get_statistics: {e}")
@@ -366,19 +354,8 @@ class Database:
     async def get_payments_statistics(self, days: int = 30):
         """Получить статистику платежей за указанный период"""
         try:
-            async with self.pool.acquire() as conn:
-                stats = await conn.fetchrow(
-                    f"""
-                    SELECT 
-                        COUNT(*) as total_payments,
-                        COUNT(*) FILTER (WHERE status = 'succeeded') as successful_payments,
-                        COUNT(*) FILTER (WHERE status = 'pending') as pending_payments,
-                        COALESCE(SUM(amount) FILTER (WHERE status = 'succeeded'), 0) as total_revenue,
-                        COALESCE(AVG(amount) FILTER (WHERE status = 'succeeded'), 0) as avg_payment
-                    FROM payments
-                    WHERE created_at >= NOW() - INTERVAL '{days} days'
-                """
-                )
+            async with self.acquire() as conn:
+                stats = await self._fetchrow(conn, "payments_statistics", days)
                 return dict(stats) if stats else {}
         except Exception as e:
             logger.error(f"Ошибка get_payments_statistics: {e}")
@@ -387,63 +364,175 @@ class Database:
     async def create_subscription(self, user_id: int, plan_key: str, payment_id: str):
         """Создать подписку после успешного платежа"""
         try:
-            async with self.pool.acquire() as conn:
-                plan = Config.SUBSCRIPTION_PLANS.get(plan_key)
-                if not plan:
-                    return False
-
-                # Деактивируем старые подписки пользователя
-                await conn.execute(
-                    "UPDATE subscriptions SET is_active = FALSE WHERE user_id = $1",
-                    user_id,
-                )
+            async with self.acquire() as conn:
+                return await self._create_subscription(conn, user_id, plan_key, payment_id)
+        except Exception as e:
+            logger.error(f"Ошибка create_subscription: {e}")
+            return False
 
-                # Создаем новую подписку - ИСПРАВЛЕНО: используем duration_months из плана
-                subscription = await conn.fetchrow(
-                    """
-                    INSERT INTO subscriptions (
-                        user_id, plan_key, request_limit, used_requests, end_date, is_active
-                    )
-                    VALUES ($1, $2, $3, 0, NOW() + INTERVAL '1 month' * $4, TRUE)
-                    RETURNING *
-                    """,
-                    user_id,
-                    plan_key,
-                    plan["requests"],
-                    plan.get(
-                        "duration_months", plan["days"] // 30
-                    ),  # Преобразуем дни в месяцы
-                )
+    async def _create_subscription(
+        self, conn: asyncpg.Connection, user_id: int, plan_key: str, payment_id: str
+    ) -> bool:
+        """Идемпотентная активация подписки по платежу одним запросом.
+
+        Возвращает True, если подписка создана, и False, если тариф не найден
+        или подписка по этому платежу уже существует.
+        """
+        result = await self._fetchrow(
+            conn, "create_subscription", user_id, plan_key, payment_id
+        )
+
+        if not result["plan_found"]:
+            # Оплата прошла, а подписку выдать не из чего - нужен разбор вручную
+            logger.error(
+                f"Тариф {plan_key} не найден, подписка по оплаченному платежу "
+                f"{payment_id} (user_id={user_id}) не создана"
+            )
+            return False
+        if result["subscription_id"] is None:
+            logger.info(f"Подписка по платежу {payment_id} уже активирована")
+            return False
+        return True
 
-                # Обновляем статус платежа
-                await conn.execute(
-                    """
-                    UPDATE payments 
-                    SET status = 'succeeded', 
-                        subscription_id = $1,
-                        updated_at = NOW()
-                    WHERE payment_id = $2
-                    """,
-                    subscription["id"],
-                    payment_id,
+    async def add_payment_event(self, payment_id: str, status: str) -> bool:
+        """Сохранить событие уведомления кассы. False - такое событие уже ждет применения.
+
+        Ошибки не перехватываются: пока событие не записано, кассе нельзя
+        отвечать 200.
+        """
+        async with self.acquire() as conn:
+            event_id = await self._fetchval(
+                conn, "insert_payment_event", payment_id, status
+            )
+            return event_id is not None
+
+    async def process_payment_events(self, limit: int) -> dict[str, int]:
+        """Забрать из payment_events пачку событий и применить ее одной транзакцией.
+
+        SKIP LOCKED позволяет нескольким процессам разбирать события
+        одновременно; при ошибке транзакция откатывается и события остаются
+        в таблице.
+        """
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                events = await self._fetch(conn, "claim_payment_events", limit)
+                result = await self._apply_payment_events(
+                    conn, [(e["payment_id"], e["status"]) for e in events]
                 )
+                return {"events": len(events), **result}
+
+    async def apply_payment_events(self, events: list[tuple[str, str]]):
+        """Применить пачку статусов платежей (payment_id, status) одной транзакцией"""
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                return await self._apply_payment_events(conn, events)
+
+    async def _apply_payment_events(
+        self, conn: asyncpg.Connection, events: list[tuple[str, str]]
+    ) -> dict[str, int]:
+        """Слить статусы с payments одним UPDATE и активировать подписки.
+
+        Статус меняется только на более поздний по жизненному циклу
+        платежа. Для платежей, впервые перешедших в succeeded, в той же
+        транзакции активируются подписки.
+        """
+        if not events:
+            return {"updated": 0, "activated": 0}
+
+        payment_ids, statuses = zip(*events)
+        changed = await self._fetch(
+            conn, "apply_payment_statuses", list(payment_ids), list(statuses)
+        )
+
+        activated = 0
+        for payment in changed:
+            if payment["status"] == "succeeded":
+                if await self._create_subscription(
+                    conn,
+                    payment["user_id"],
+                    payment["plan_key"],
+                    payment["payment_id"],
+                ):
+                    activated += 1
+
+        return {"updated": len(changed), "activated": activated}
+
+    async def claim_pending_payments(
+        self, limit: int, min_age: int, backoff_base: int, backoff_max: int
+    ) -> list[dict]:
+        """Забрать платежи в ожидании, которые пора сверить с кассой.
+
+        Следующая проверка сразу переносится с экспоненциальной задержкой,
+        а SKIP LOCKED не дает двум процессам взять один и тот же платеж.
+        """
+        try:
+            async with self.acquire() as conn:
+                payments = await self._fetch(
+                    conn,
+                    "claim_pending_payments",
+                    limit,
+                    min_age,
+                    backoff_base,
+                    backoff_max,
+                )
+                return [dict(p) for p in payments]
+        except Exception as e:
+            logger.error(f"Ошибка claim_pending_payments: {e}")
+            return []
 
-                return True
+    async def get_upcoming_expirations(self, horizon: float, limit: int) -> list[float]:
+        """Через сколько секунд закончатся активные подписки (в пределах horizon)"""
+        try:
+            async with self.acquire() as conn:
+                rows = await self._fetch(conn, "upcoming_expirations", horizon, limit)
+                return [row["seconds"] for row in rows]
         except Exception as e:
-            logger.error(f"Ошибка create_subscription: {e}")
-            return False
+            logger.error(f"Ошибка get_upcoming_expirations: {e}")
+            return []
+
+    async def expire_due_subscriptions(self, limit: int) -> list[dict]:
+        """Снять is_active с пачки подписок, у которых наступил end_date"""
+        async with self.acquire() as conn:
+            rows = await self._fetch(conn, "expire_due_subscriptions", limit)
+            return [dict(row) for row in rows]
+
+    async def claim_expiry_reminders(
+        self, days: int, limit: int, lease: float
+    ) -> list[dict]:
+        """Захватить на lease секунд подписки, о скором окончании которых пора напомнить"""
+        async with self.acquire() as conn:
+            rows = await self._fetch(
+                conn, "claim_expiry_reminders", days, limit, lease
+            )
+            return [dict(row) for row in rows]
+
+    async def mark_reminder_sent(self, subscription_id: int):
+        """Отметить напоминание доставленным"""
+        try:
+            async with self.acquire() as conn:
+                await self._fetchval(conn, "mark_reminder_sent", subscription_id)
+        except Exception as e:
+            logger.error(f"Ошибка mark_reminder_sent: {e}")
+
+    async def get_pending_payments_lag(self):
+        """Количество платежей в ожидании и возраст самого старого (в секундах)"""
+        try:
+            async with self.acquire() as conn:
+                stats = await self._fetchrow(conn, "pending_payments_lag")
+                return dict(stats) if stats else {}
+        except Exception as e:
+            logger.error(f"Ошибка get_pending_payments_lag: {e}")
+            return {}
 
     async def create_payment_record(
         self, user_id: int, payment_id: str, amount: float, plan_key: str
     ):
         """Создать запись о платеже"""
         try:
-            async with self.pool.acquire() as conn:
-                await conn.execute(
-                    """
-                    INSERT INTO payments (user_id, payment_id, amount, plan_key, status)
-                    VALUES ($1, $2, $3, $4, 'pending')
-                    """,
+            async with self.acquire() as conn:
+                await self._fetchval(
+                    conn,
+                    "insert_payment",
                     user_id,
                     payment_id,
                     amount,
@@ -457,13 +546,10 @@ class Database:
     async def update_payment_status(self, payment_id: str, status: str):
         """Обновить статус платежа"""
         try:
-            async with self.pool.acquire() as conn:
-                await conn.execute(
-                    """
-                    UPDATE payments 
-                    SET status = $1, updated_at = NOW()
-                    WHERE payment_id = $2
-                    """,
+            async with self.acquire() as conn:
+                await self._fetchval(
+                    conn,
+                    "update_payment_status",
                     status,
                     payment_id,
                 )
@@ -475,9 +561,9 @@ class Database:
     async def get_payment_by_yookassa_id(self, yookassa_payment_id: str):
         """Получить платеж по ID из Яндекс Кассы"""
         try:
-            async with self.pool.acquire() as conn:
-                payment = await conn.fetchrow(
-                    "SELECT * FROM payments WHERE payment_id = $1", yookassa_payment_id
+            async with self.acquire() as conn:
+                payment = await self._fetchrow(
+                    conn, "payment_by_payment_id", yookassa_payment_id
                 )
                 return dict(payment) if payment else None
         except Exception as e:
@@ -487,16 +573,8 @@ class Database:
     async def get_active_subscription(self, user_id: int):
         """Получить активную подписку пользователя"""
         try:
-            async with self.pool.acquire() as conn:
-                subscription = await conn.fetchrow(
-                    """
-                    SELECT * FROM subscriptions 
-                    WHERE user_id = $1 AND is_active = TRUE 
-                    AND (end_date IS NULL OR end_date > NOW())
-                    ORDER BY end_date DESC LIMIT 1
-                    """,
-                    user_id,
-                )
+            async with self.acquire() as conn:
+                subscription = await self._fetchrow(conn, "active_subscription", user_id)
                 return dict(subscription) if subscription else None
         except Exception as e:
             logger.error(f"Ошибка get_active_subscription: {e}")
@@ -504,12 +582,18 @@ class Database:
 
     async def get_user_by_telegram_id(self, telegram_id: int):
         """Получить пользователя по Telegram ID"""
+        cached = self.user_cache.get(telegram_id)
+        if cached:
+            return cached
+
         try:
-            async with self.pool.acquire() as conn:
-                user = await conn.fetchrow(
-                    "SELECT * FROM users WHERE telegram_id = $1", telegram_id
-                )
-                return dict(user) if user else None
+            async with self.acquire() as conn:
+                user = await self._fetchrow(conn, "user_by_telegram_id", telegram_id)
+                if not user:
+                    return None
+                user = dict(user)
+                self.user_cache.set(telegram_id, user)
+                return user
         except Exception as e:
             logger.error(f"Ошибка get_user_by_telegram_id: {e}")
             return None
@@ -517,14 +601,10 @@ class Database:
     async def get_payments_by_user(self, user_id: int, limit: int = 10):
         """Получить платежи пользователя"""
         try:
-            async with self.pool.acquire() as conn:
-                payments = await conn.fetch(
-                    """
-                    SELECT * FROM payments 
-                    WHERE user_id = $1 
-                    ORDER BY created_at DESC 
-                    LIMIT $2
-                    """,
+            async with self.acquire() as conn:
+                payments = await self._fetch(
+                    conn,
+                    "payments_by_user",
                     user_id,
                     limit,
                 )
@@ -536,7 +616,7 @@ class Database:
     async def add_default_instructions(self):
         """Добавить инструкции по умолчанию (если таблица пуста)"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 count = await conn.fetchval("SELECT COUNT(*) FROM instructions")
 
                 if count == 0:
@@ -579,11 +659,11 @@ class Database:
     async def get_all_users(self, limit: int = 50):
         """Получить всех пользователей"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 users = await conn.fetch(
                     """
                     SELECT 
-                        u.*,
+                        u.id, u.telegram_id, u.username, u.full_name, u.created_at,
                         COUNT(DISTINCT s.id) as total_subscriptions,
                         COUNT(DISTINCT p.id) as total_payments,
                         MAX(s.end_date) as last_subscription_end
@@ -601,6 +681,3 @@ class Database:
             logger.error(f"Ошибка get_all_users: {e}")
             return []
 
-
-# Создаем глобальный экземпляр базы данных
-db_instance :Database
@@ -0,0 +1,176 @@
+import asyncio
+import functools
+import heapq
+import logging
+
+from background import BackgroundTask, Listener
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Канал, в который триггер на subscriptions сообщает о новых end_date
+EXPIRY_CHANNEL = "subscription_end_dates"
+
+
+class ExpiryScheduler(BackgroundTask):
+    """Фоновое завершение подписок и напоминания о продлении.
+
+    Ближайшие окончания подписок (на horizon секунд вперед) держатся в куче,
+    которая заполняется по индексу end_date WHERE is_active. Планировщик
+    просыпается к ближайшему окончанию и пачками выставляет is_active = FALSE,
+    поэтому остальным запросам достаточно фильтра по is_active. Новые и
+    продленные подписки попадают в кучу сразу по NOTIFY. Раз в
+    reminder_interval секунд пользователям, у которых подписка заканчивается
+    в ближайшие reminder_days дней, отправляется напоминание. Напоминание
+    отмечается в БД после доставки; не доставленное за reminder_lease
+    секунд (например, из-за перезапуска) захватывается снова.
+    """
+
+    def __init__(
+        self,
+        send_queue,
+        horizon: float = Config.EXPIRY_HORIZON,
+        batch_size: int = Config.EXPIRY_BATCH_SIZE,
+        reminder_days: int = Config.EXPIRY_REMINDER_DAYS,
+        reminder_interval: float = Config.EXPIRY_REMINDER_INTERVAL,
+        reminder_lease: float = Config.EXPIRY_REMINDER_LEASE,
+    ):
+        super().__init__()
+        self.send_queue = send_queue
+        self.horizon = horizon
+        self.batch_size = batch_size
+        self.reminder_days = reminder_days
+        self.reminder_interval = reminder_interval
+        self.reminder_lease = reminder_lease
+        self._heap: list[float] = []
+        self._pushed: list[float] | None = None
+        self._refill_requested = False
+        self._wakeup = asyncio.Event()
+        self._listener = Listener(
+            EXPIRY_CHANNEL, self._on_notify, self._on_connect
+        )
+
+        # Метрики
+        self.expired_total = 0
+        self.reminders_total = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    async def start(self, db=None):
+        await super().start(db)
+        await self._listener.start(db)
+
+    async def stop(self):
+        await self._listener.stop()
+        await super().stop()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_refill = next_reminders = loop.time()
+        while True:
+            now = loop.time()
+            self._wakeup.clear()
+            try:
+                if now >= next_refill or self._refill_requested:
+                    self._refill_requested = False
+                    # Перечитывание кучи заодно подбирает пропущенные окончания
+                    next_refill = await self._refill(now)
+                    await self.expire_due()
+                elif self._heap and self._heap[0] <= now:
+                    while self._heap and self._heap[0] <= now:
+                        heapq.heappop(self._heap)
+                    await self.expire_due()
+
+                if now >= next_reminders:
+                    next_reminders = now + self.reminder_interval
+                    await self.send_reminders()
+            except Exception as e:
+                logger.error(f"Ошибка планировщика окончания подписок: {e}")
+
+            wake = min(next_refill, next_reminders)
+            if self._heap:
+                wake = min(wake, self._heap[0])
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), max(wake - loop.time(), 0)
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refill(self, now: float) -> float:
+        """Перечитать кучу, вернуть время следующего перечитывания"""
+        # Уведомления, пришедшие во время запроса, могут не попасть в его снимок
+        self._pushed = []
+        try:
+            seconds = await self._db.get_upcoming_expirations(
+                self.horizon, Config.EXPIRY_HEAP_SIZE
+            )
+            deadlines = [now + max(s, 0) for s in seconds]
+            self._heap = deadlines + self._pushed
+        finally:
+            self._pushed = None
+        heapq.heapify(self._heap)
+
+        next_refill = now + self.horizon / 2
+        if len(deadlines) == Config.EXPIRY_HEAP_SIZE:
+            # В кучу вошли не все окончания горизонта: остальные нужны,
+            # как только пройдет последнее загруженное
+            next_refill = min(next_refill, max(deadlines[-1], now + 1))
+        return next_refill
+
+    def _on_notify(self, payload: str):
+        try:
+            seconds = float(payload)
+        except ValueError:
+            logger.warning(f"Некорректное уведомление об окончании подписки: {payload!r}")
+            return
+        if seconds > self.horizon:
+            return
+        deadline = asyncio.get_running_loop().time() + max(seconds, 0)
+        heapq.heappush(self._heap, deadline)
+        if self._pushed is not None:
+            self._pushed.append(deadline)
+        self._wakeup.set()
+
+    async def _on_connect(self):
+        # Пока LISTEN не было, новые окончания могли пройти мимо кучи
+        self._refill_requested = True
+        self._wakeup.set()
+
+    async def expire_due(self):
+        """Завершить все подписки с наступившим end_date"""
+        while True:
+            expired = await self._db.expire_due_subscriptions(self.batch_size)
+            self.expired_total += len(expired)
+            for subscription in expired:
+                self.send_queue.send(
+                    subscription["telegram_id"],
+                    "⌛ <b>Срок вашей подписки истек.</b>\n\n"
+                    "Чтобы продолжить добавлять ссылки, оформите новую подписку: "
+                    "нажмите '💎 Купить подписку'.",
+                )
+            if expired:
+                logger.info(f"Завершено подписок: {len(expired)}")
+            if len(expired) < self.batch_size:
+                return
+
+    async def send_reminders(self):
+        while True:
+            due = await self._db.claim_expiry_reminders(
+                self.reminder_days, self.batch_size, self.reminder_lease
+            )
+            self.reminders_total += len(due)
+            for subscription in due:
+                end_date = subscription["end_date"].strftime("%d.%m.%Y")
+                self.send_queue.send(
+                    subscription["telegram_id"],
+                    f"⏰ <b>Ваша подписка заканчивается {end_date}.</b>\n\n"
+                    "Продлите ее заранее в разделе '💎 Купить подписку', "
+                    "чтобы не потерять доступ.",
+                    on_sent=functools.partial(
+                        self._db.mark_reminder_sent, subscription["id"]
+                    ),
+                )
+            if len(due) < self.batch_size:
+                return
@@ -1,10 +1,9 @@
 import asyncio
 import logging
+import signal
 import sys
 from datetime import datetime
 
-from ..bot2.keyboards import get_main_menu, get_subscription_plans
-
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
@@ -12,8 +11,17 @@ from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 
 from config import Config
-from .database import Database, db_instance
-from payment_handler import YooKassaPayment
+import metrics
+import send_queue as outgoing
+from expiry_scheduler import ExpiryScheduler
+from plan_catalog import catalog
+from screens import screens
+import throttling
+import tracing
+import webhook_server
+import workers
+from database import Database, NO_SUBSCRIPTION_MESSAGE, limit_exhausted_message
+from payment_handler import YooKassaPayment, client as payment_client, webhook_queue, reconciler
 from utils import validate_url
 
 # Настройка логирования для Docker
@@ -31,22 +39,40 @@ try:
         token=Config.BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
     dp = Dispatcher()
+    # Блокировка пользователя снаружи семафора: очередь апдейтов одного
+    # пользователя ждет без слота и не занимает места остальных
+    dp.update.outer_middleware(workers.UserLockMiddleware())
+    dp.update.outer_middleware(webhook_server.UpdateConcurrencyMiddleware())
+    bot.session.middleware(tracing.TelegramTimingMiddleware())
+    bot.session.middleware(outgoing.SendRateLimitMiddleware())
+    send_queue = outgoing.SendQueue(bot)
+    expiry_scheduler = ExpiryScheduler(send_queue)
+    throttling_middleware = throttling.ThrottlingMiddleware(
+        throttling.MemoryBucketStore()
+    )
+    for observer in (dp.message, dp.callback_query):
+        # Лимит проверяется первым, до хендлера и его запросов к БД
+        observer.middleware(throttling_middleware)
+        observer.middleware(metrics.MetricsMiddleware())
+        observer.middleware(tracing.TracingMiddleware())
 except Exception as e:
     logger.error(f"Ошибка инициализации бота: {e}")
     sys.exit(1)
 
 
 # Функция для ожидания готовности БД
-async def wait_for_db(retries: int = 10, delay: int = 5):
-    global db_instance
+async def wait_for_db(
+    retries: int = 10, delay: int = 5, migrate: bool = True
+) -> Database | None:
     """Ожидание подключения к БД"""
     for i in range(retries):
         try:
-            db_instance = await Database.create()
+            db = await Database.create()
             logger.info(f"Попытка подключения к БД {i+1}/{retries}")
-            await db_instance.create_tables()
+            if migrate:
+                await db.migrate()
             logger.info("✅ Подключение к БД установлено")
-            return True
+            return db
         except Exception as e:
             logger.warning(f"Ошибка подключения к БД: {e}")
             if i < retries - 1:
@@ -59,9 +85,9 @@ async def wait_for_db(retries: int = 10, delay: int = 5):
 
 # Команда /start
 @dp.message(Command("start"))
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, db: Database):
     try:
-        user = await db_instance.get_or_create_user(
+        user = await db.get_or_create_user(
             telegram_id=message.from_user.id,
             username=message.from_user.username ,
             full_name=message.from_user.full_name or "Пользователь",
@@ -75,27 +101,10 @@ async def cmd_start(message: Message):
 
         is_admin = message.from_user.id in Config.ADMIN_IDS
 
-        welcome_text = f"""👋 Привет, {message.from_user.first_name}!
-
-🤖 Я бот для управления подписками с Яндекс Кассой.
-
-✨ <b>Доступные функции:</b>
-• Безопасная оплата через Яндекс Кассу
-• Добавление ссылок с учетом лимита
-• Просмотр статистики и истории
-• Автоматическое обновление подписок
-
-💎 <b>Тарифные планы:</b>
-1. 1 месяц (5 запросов) - 500₽
-2. 3 месяца (15 запросов) - 1200₽
-3. 6 месяцев (30 запросов) - 2000₽
-4. 12 месяцев (60 запросов) - 3500₽
-
-<b>Запрос</b> - добавление одной ссылки. Лимит обновляется при продлении.
-
-Используйте кнопки ниже для навигации! 🚀"""
-
-        await message.answer(welcome_text, reply_markup=get_main_menu(is_admin))
+        await message.answer(
+            screens.welcome(message.from_user.first_name),
+            reply_markup=screens.main_menu(is_admin),
+        )
 
     except Exception as e:
         logger.error(f"Ошибка в /start: {e}")
@@ -105,42 +114,21 @@ async def cmd_start(message: Message):
 # Обработка покупки подписки
 @dp.message(F.text == "💎 Купить подписку")
 async def buy_subscription(message: Message):
-    text = """💎 <b>Выберите тарифный план:</b>
-
-1. <b>1 месяц</b> - 500₽
-   • 5 запросов ссылок
-   • Доступ на 30 дней
-
-2. <b>3 месяца</b> - 1200₽ (экономия 20%)
-   • 15 запросов ссылок
-   • Доступ на 90 дней
-
-3. <b>6 месяцев</b> - 2000₽ (экономия 33%)
-   • 30 запросов ссылок
-   • Доступ на 180 дней
-
-4. <b>12 месяцев</b> - 3500₽ (экономия 41%)
-   • 60 запросов ссылок
-   • Доступ на 365 дней
-
-Выберите подходящий вариант:"""
-
-    await message.answer(text, reply_markup=get_subscription_plans())
+    await message.answer(screens.buy_text, reply_markup=screens.plans_keyboard)
 
 
 # Обработка выбора тарифа
-@dp.callback_query(F.data.startswith("buy_"))
-async def process_buy_callback(callback: CallbackQuery):
+@dp.callback_query(F.data.startswith("buy_"), flags={"throttle": "payments"})
+async def process_buy_callback(callback: CallbackQuery, db: Database):
     plan_key = callback.data.split("_")[1]
 
-    if plan_key not in Config.SUBSCRIPTION_PLANS:
+    plan = catalog.get(plan_key)
+    if plan is None:
         await callback.answer("❌ Тарифный план не найден")
         return
 
-    plan = Config.SUBSCRIPTION_PLANS[plan_key]
-
     # Получаем пользователя
-    user = await db_instance.get_or_create_user(
+    user = await db.get_or_create_user(
         telegram_id=callback.from_user.id,
         username=callback.from_user.username,
         full_name=callback.from_user.full_name or "Пользователь",
@@ -154,15 +142,15 @@ async def process_buy_callback(callback: CallbackQuery):
 
     # Создаем платеж
     payment_result = await YooKassaPayment.create_payment(
-        user_id=user["id"], plan_key=plan_key, telegram_id=callback.from_user.id
+        db, user_id=user["id"], plan_key=plan_key, telegram_id=callback.from_user.id
     )
 
     if payment_result["success"]:
         payment_text = f"""✅ <b>Платеж создан!</b>
 
-💳 <b>Сумма:</b> {payment_result['amount']}₽
+💳 <b>Сумма:</b> {plan.price_text}
 📋 <b>Тариф:</b> {payment_result['plan_name']}
-📅 <b>Доступно запросов:</b> {plan['requests']}
+📅 <b>Доступно запросов:</b> {plan.requests}
 
 <b>Для оплаты перейдите по ссылке:</b>
 {payment_result['confirmation_url']}
@@ -190,8 +178,8 @@ async def process_buy_callback(callback: CallbackQuery):
 
 # Добавление ссылки с проверкой лимита
 @dp.message(F.text == "🔗 Добавить ссылку")
-async def add_link_command(message: Message):
-    user = await db_instance.get_or_create_user(
+async def add_link_command(message: Message, db: Database):
+    user = await db.get_or_create_user(
         telegram_id=message.from_user.id,
         username=message.from_user.username,
         full_name=message.from_user.full_name or "Пользователь",
@@ -201,22 +189,30 @@ async def add_link_command(message: Message):
         await message.answer("❌ Ошибка пользователя")
         return
 
-    # Проверяем лимит запросов
-    limit_check = await db_instance.check_request_limit(user["id"])
+    # Только показываем остаток: запрос списывается вместе с сохранением ссылки
+    subscription = await db.get_active_subscription(user["id"])
+    if not subscription:
+        await message.answer(NO_SUBSCRIPTION_MESSAGE)
+        return
 
-    if not limit_check["has_access"]:
-        await message.answer(limit_check["message"])
+    remaining = subscription["request_limit"] - subscription["used_requests"]
+    if remaining <= 0:
+        await message.answer(
+            limit_exhausted_message(
+                subscription["used_requests"], subscription["request_limit"]
+            )
+        )
         return
 
     await message.answer(
-        f"✅ <b>Доступно:</b> {limit_check['remaining']} из {limit_check['total']} запросов\n\n"
+        f"✅ <b>Доступно:</b> {remaining} из {subscription['request_limit']} запросов\n\n"
         f"Отправьте мне ссылку для сохранения (формат: https://example.com):"
     )
 
 
 # Обработка ссылок
-@dp.message(F.text.contains("http"))
-async def handle_link_message(message: Message):
+@dp.message(F.text.contains("http"), flags={"throttle": "links"})
+async def handle_link_message(message: Message, db: Database):
     # Валидация URL
     if not validate_url(message.text):
         await message.answer(
@@ -224,7 +220,7 @@ async def handle_link_message(message: Message):
         )
         return
 
-    user = await db_instance.get_or_create_user(
+    user = await db.get_or_create_user(
         telegram_id=message.from_user.id,
         username=message.from_user.username,
         full_name=message.from_user.full_name or "Пользователь",
@@ -234,29 +230,18 @@ async def handle_link_message(message: Message):
         await message.answer("❌ Ошибка пользователя")
         return
 
-    # Проверяем лимит запросов
-    limit_check = await db_instance.check_request_limit(user["id"])
-
-    if not limit_check["has_access"]:
-        await message.answer(limit_check["message"])
-        return
-
     try:
-        # Добавляем ссылку
-        await db_instance.add_user_link(user["id"], message.text)
-
-        # Увеличиваем счетчик запросов
-        await db_instance.increment_request_count(
-            user["id"], limit_check["subscription_id"], message.text
-        )
+        # Списываем запрос и сохраняем ссылку одной операцией
+        limit_check = await db.consume_request(user["id"], message.text)
 
-        # Обновляем информацию о лимите
-        new_limit = await db_instance.check_request_limit(user["id"])
+        if not limit_check["has_access"]:
+            await message.answer(limit_check["message"])
+            return
 
         await message.answer(
             f"✅ <b>Ссылка сохранена!</b>\n\n"
             f"🔗 {message.text[:50]}...\n\n"
-            f"📊 <b>Осталось запросов:</b> {new_limit['remaining']}/{new_limit['total']}"
+            f"📊 <b>Осталось запросов:</b> {limit_check['remaining']}/{limit_check['total']}"
         )
     except Exception as e:
         logger.error(f"Ошибка сохранения ссылки: {e}")
@@ -265,8 +250,8 @@ async def handle_link_message(message: Message):
 
 # Статистика пользователя
 @dp.message(F.text == "📊 Моя статистика")
-async def user_statistics(message: Message):
-    user = await db_instance.get_or_create_user(
+async def user_statistics(message: Message, db: Database):
+    user = await db.get_or_create_user(
         telegram_id=message.from_user.id,
         username=message.from_user.username,
         full_name=message.from_user.full_name or "Пользователь",
@@ -276,7 +261,7 @@ async def user_statistics(message: Message):
         await message.answer("❌ Ошибка пользователя")
         return
 
-    stats = await db_instance.get_user_statistics(user["id"])
+    stats = await db.get_user_statistics(user["id"])
 
     if stats.get("plan"):
         end_date = (
@@ -307,32 +292,16 @@ async def user_statistics(message: Message):
 
 💡 <b>Совет:</b> Следите за лимитом запросов и продлевайте подписку вовремя!"""
     else:
-        text = """📊 <b>Ваша статистика</b>
-
-❌ <b>У вас нет активной подписки.</b>
-
-💎 Для доступа к функциям бота приобретите подписку:
-• 1 месяц (5 запросов) - 500₽
-• 3 месяца (15 запросов) - 1200₽
-• 6 месяцев (30 запросов) - 2000₽
-• 12 месяцев (60 запросов) - 3500₽
-
-<b>Нажмите "💎 Купить подписку" для выбора тарифа.</b>
-
-✨ <b>Что дает подписка:</b>
-• Возможность добавлять ссылки
-• Доступ ко всем функциям бота
-• Приоритетную поддержку
-• Автоматическое обновление"""
+        text = screens.no_subscription_text
 
     await message.answer(text)
 
 
 # Инструкции
 @dp.message(F.text == "📋 Инструкция")
-async def show_instructions(message: Message):
+async def show_instructions(message: Message, db: Database):
     try:
-        instructions = await db_instance.get_instructions()
+        instructions = await db.get_instructions()
 
         if instructions:
             text = "📖 <b>Инструкции по использованию бота:</b>\n\n"
@@ -376,13 +345,13 @@ async def admin_panel(message: Message):
 
 # Команды для админов
 @dp.message(Command("stats"))
-async def admin_stats(message: Message):
+async def admin_stats(message: Message, db: Database):
     if message.from_user.id not in Config.ADMIN_IDS:
         return
 
     try:
-        stats = await db_instance.get_statistics()
-        payment_stats = await db_instance.get_payments_statistics(30)
+        stats = await db.get_statistics()
+        payment_stats = await db.get_payments_statistics(30)
 
         text = f"""📊 <b>Статистика бота</b>
 
@@ -409,8 +378,8 @@ async def admin_stats(message: Message):
 
 # Кнопка "Назад"
 @dp.callback_query(F.data == "back_to_main")
-async def back_to_main(callback: CallbackQuery):
-    user = await db_instance.get_or_create_user(
+async def back_to_main(callback: CallbackQuery, db: Database):
+    user = await db.get_or_create_user(
         telegram_id=callback.from_user.id,
         username=callback.from_user.username,
         full_name=callback.from_user.full_name or "Пользователь",
@@ -420,19 +389,19 @@ async def back_to_main(callback: CallbackQuery):
         is_admin = callback.from_user.id in Config.ADMIN_IDS
         await callback.message.edit_text("Главное меню", reply_markup=None)
         await callback.message.answer(
-            "Главное меню", reply_markup=get_main_menu(is_admin)
+            "Главное меню", reply_markup=screens.main_menu(is_admin)
         )
 
     await callback.answer()
 
 
 @dp.message(Command("users"))
-async def admin_users(message: Message):
+async def admin_users(message: Message, db: Database):
     if message.from_user.id not in Config.ADMIN_IDS:
         return
 
     try:
-        users = await db_instance.get_all_users(20)
+        users = await db.get_all_users(20)
 
         if not users:
             await message.answer("📭 Пользователей нет")
@@ -461,22 +430,137 @@ async def admin_users(message: Message):
 
 
 # Основная функция
-async def main():
+async def main(worker_index: int = 0, migrate: bool = True):
     logger.info("🚀 Запуск бота подписки...")
 
     # Ждем подключения к БД
-    if not await wait_for_db():
+    db = await wait_for_db(migrate=migrate)
+    if not db:
         logger.error("Не удалось подключиться к БД. Завершение работы.")
         sys.exit(1)
+    # Хендлеры получают БД через аргумент db, очередь рассылок - send_queue
+    dp["db"] = db
+    dp["send_queue"] = send_queue
+    if Config.THROTTLE_BACKEND == "postgres":
+        throttling_middleware.store = throttling.PostgresBucketStore(db)
+
+    # Тарифы нужны экранам и хендлерам до приема апдейтов
+    try:
+        await catalog.start(db)
+    except Exception as e:
+        logger.error(f"Не удалось загрузить тарифы: {e}")
+        sys.exit(1)
+
+    await webhook_queue.start(db)
+    await send_queue.start()
+    # Сверку платежей и окончание подписок ведет один процесс из всех запущенных
+    async def start_background():
+        await reconciler.start(db)
+        await expiry_scheduler.start(db)
+
+    async def stop_background():
+        await reconciler.stop()
+        await expiry_scheduler.stop()
+
+    leader = workers.LeaderElection(on_elected=start_background, on_lost=stop_background)
+    await leader.start(db)
+
+    metrics_runner = None
+    if Config.METRICS_ENABLED:
+        metrics.register_gauges("bot_db_pool", "Пул БД", db.get_pool_metrics)
+        metrics.register_gauges(
+            "bot_payments_reconcile",
+            "Сверка платежей",
+            lambda: {
+                "pending": reconciler.pending_payments,
+                "oldest_pending_seconds": reconciler.oldest_pending_seconds,
+                "checked_total": reconciler.checked_total,
+                "errors_total": reconciler.errors_total,
+            },
+        )
+        metrics.register_gauges(
+            "bot_subscriptions_expiry",
+            "Окончание подписок",
+            lambda: {
+                "scheduled": len(expiry_scheduler),
+                "expired_total": expiry_scheduler.expired_total,
+                "reminders_total": expiry_scheduler.reminders_total,
+            },
+        )
+        metrics.registry.register(
+            metrics.Gauge(
+                "bot_send_queue_backlog",
+                "Сообщения рассылок в очереди",
+                function=lambda: len(send_queue),
+            )
+        )
+        metrics.registry.register(
+            metrics.Gauge(
+                "bot_webhook_queue_backlog",
+                "События кассы, принятые процессом и еще не примененные",
+                function=lambda: len(webhook_queue),
+            )
+        )
+        # У каждого процесса свой порт метрик
+        metrics_runner = await metrics.start_metrics_server(
+            Config.METRICS_HOST, Config.METRICS_PORT + worker_index
+        )
+
+    # По SIGTERM (перезапуск, остановка родительским процессом) выходим
+    # штатно: finally ниже применяет принятые вебхуки и закрывает соединения.
+    # В режиме polling сигналы перехватывает сам aiogram.
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
 
     # Запуск бота
+    server_runner = None
     try:
         logger.info("✅ Бот запущен и готов к работе!")
-        await dp.start_polling(bot)
+        if Config.BOT_MODE == "webhook":
+            await webhook_server.run_webhook(bot, dp, stopping)
+        else:
+            if Config.YOOKASSA_WEBHOOK_ENABLED:
+                server_runner = await webhook_server.start_server(
+                    webhook_server.build_app()
+                )
+            # Вебхук мог остаться от запуска в режиме webhook
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"Ошибка запуска бота: {e}")
         sys.exit(1)
+    finally:
+        await leader.stop()
+        await catalog.stop()
+        await webhook_queue.stop()
+        await send_queue.stop()
+        if server_runner:
+            await server_runner.cleanup()
+        await payment_client.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+
+
+async def migrate_schema():
+    """Применить миграции и закрыть соединения (до запуска процессов)"""
+    db = await wait_for_db()
+    if not db:
+        logger.error("Не удалось подключиться к БД. Завершение работы.")
+        sys.exit(1)
+    await db.pool.close()
+
+
+def run_worker(worker_index: int):
+    # Схему уже обновил родительский процесс
+    asyncio.run(main(worker_index, migrate=False))
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if Config.BOT_WORKERS > 1:
+        # Миграции выполняются один раз, а не в каждом процессе наперегонки
+        asyncio.run(migrate_schema())
+        workers.run_processes(Config.BOT_WORKERS, run_worker)
+    else:
+        asyncio.run(main())
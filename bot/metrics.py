@@ -0,0 +1,280 @@
+"""Метрики процесса бота в текстовом формате Prometheus.
+
+Небольшой собственный реестр счетчиков, гистограмм и gauge-метрик без
+внешних зависимостей. Метрики отдаются aiohttp-сервером на /metrics.
+"""
+import functools
+import inspect
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable
+
+from aiogram import BaseMiddleware
+from aiohttp import web
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict[str, Any]) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Metric):
+    """Gauge-метрика: значение задается явно или вычисляется при сборе"""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function: Callable | None = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def render(self) -> list[str]:
+        if self._function is not None:
+            try:
+                return [f"{self.name} {float(self._function())}"]
+            except Exception as e:
+                logger.debug(f"Не удалось вычислить {self.name}: {e}")
+                return []
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ключ меток -> [счетчики по корзинам, сумма, количество]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][i] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            samples = metric.render()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+UPDATES_TOTAL = registry.register(
+    Counter("bot_updates_total", "Обработанные апдейты", ("handler", "status"))
+)
+UPDATES_IN_PROGRESS = registry.register(
+    Gauge("bot_updates_in_progress", "Апдейты в обработке прямо сейчас")
+)
+HANDLER_SECONDS = registry.register(
+    Histogram("bot_handler_duration_seconds", "Время работы хендлера", ("handler",))
+)
+DB_QUERY_SECONDS = registry.register(
+    Histogram(
+        "bot_db_query_duration_seconds", "Время методов Database", ("method", "status")
+    )
+)
+YOOKASSA_SECONDS = registry.register(
+    Histogram(
+        "bot_yookassa_request_duration_seconds",
+        "Время запросов к API Яндекс Кассы",
+        ("method", "status"),
+    )
+)
+
+
+def timed(histogram: Histogram, trace_part: str | None = None):
+    """Декоратор корутины: время вызова с метками method и status.
+
+    Если задан trace_part, время также попадает в трассу текущего апдейта.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            status = "ok"
+            try:
+                with tracing.span(trace_part) if trace_part else nullcontext():
+                    return await func(*args, **kwargs)
+            except BaseException:
+                status = "error"
+                raise
+            finally:
+                histogram.observe(
+                    time.perf_counter() - started, method=func.__name__, status=status
+                )
+
+        return wrapper
+
+    return decorator
+
+
+def timed_methods(histogram: Histogram, trace_part: str | None = None):
+    """Декоратор класса: применить timed ко всем публичным корутинам"""
+
+    def decorator(cls):
+        for name, value in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.iscoroutinefunction(value):
+                setattr(cls, name, timed(histogram, trace_part)(value))
+        return cls
+
+    return decorator
+
+
+def register_gauges(prefix: str, documentation: str, source: Callable[[], dict]):
+    """Зарегистрировать gauge на каждое числовое поле словаря source()"""
+    for key in source():
+        registry.register(
+            Gauge(
+                f"{prefix}_{key}",
+                f"{documentation}: {key}",
+                function=lambda key=key: source()[key],
+            )
+        )
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Время и исход каждого хендлера (внутренняя middleware наблюдателя)"""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+
+        UPDATES_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            UPDATES_IN_PROGRESS.dec()
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+            UPDATES_TOTAL.inc(handler=name, status=status)
+
+
+async def metrics_view(request: web.Request) -> web.Response:
+    return web.Response(
+        text=registry.render(), content_type="text/plain", charset="utf-8"
+    )
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Поднять HTTP-сервер с /metrics, вернуть runner для остановки"""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,595 @@
+"""Версионированные миграции схемы бота.
+
+Каждая миграция применяется один раз, номер примененной версии
+записывается в schema_migrations. Новые изменения схемы добавляются
+только новыми миграциями в конец списка MIGRATIONS.
+"""
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки, чтобы две реплики не мигрировали одновременно
+MIGRATIONS_LOCK_KEY = 7410001
+# Построение индексов и заполнение счетчиков не укладываются в обычный
+# command_timeout пула, поэтому у миграций свой таймаут (секунды)
+MIGRATION_TIMEOUT = 3600
+# Как часто повторять попытку взять блокировку миграций (секунды)
+MIGRATIONS_LOCK_POLL = 1
+
+_CONCURRENT_INDEX = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    statements: tuple[str, ...]
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    transactional: bool = True
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(
+        1,
+        "initial schema",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                telegram_id BIGINT UNIQUE NOT NULL,
+                username VARCHAR(255),
+                full_name VARCHAR(255),
+                created_at TIMESTAMP DEFAULT NOW()
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                plan_key VARCHAR(50) NOT NULL,
+                request_limit INTEGER NOT NULL,
+                used_requests INTEGER DEFAULT 0,
+                start_date TIMESTAMP DEFAULT NOW(),
+                end_date TIMESTAMP,
+                is_active BOOLEAN DEFAULT TRUE,
+                created_at TIMESTAMP DEFAULT NOW()
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS payments (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                subscription_id INTEGER REFERENCES subscriptions(id) ON DELETE SET NULL,
+                payment_id VARCHAR(255) UNIQUE NOT NULL,
+                amount DECIMAL(10, 2) NOT NULL,
+                plan_key VARCHAR(50) NOT NULL,
+                status VARCHAR(50) DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT NOW(),
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS user_links (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                subscription_id INTEGER REFERENCES subscriptions(id) ON DELETE SET NULL,
+                url TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW()
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS instructions (
+                id SERIAL PRIMARY KEY,
+                title VARCHAR(255) NOT NULL,
+                text_content TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW()
+            )
+            """,
+        ),
+    ),
+    Migration(
+        2,
+        "statistics counters",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                name VARCHAR(50) NOT NULL,
+                shard SMALLINT NOT NULL,
+                value BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (name, shard)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS payment_daily_stats (
+                day DATE PRIMARY KEY,
+                total_payments INTEGER NOT NULL DEFAULT 0,
+                successful_payments INTEGER NOT NULL DEFAULT 0,
+                pending_payments INTEGER NOT NULL DEFAULT 0,
+                total_revenue DECIMAL(12, 2) NOT NULL DEFAULT 0
+            )
+            """,
+            """
+            CREATE OR REPLACE FUNCTION bump_stats_counter(counter_name TEXT, delta BIGINT)
+            RETURNS VOID AS $$
+            BEGIN
+                IF delta <> 0 THEN
+                    INSERT INTO stats_counters (name, shard, value)
+                    VALUES (counter_name, pg_backend_pid() % 16, delta)
+                    ON CONFLICT (name, shard)
+                    DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+                END IF;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION count_rows_stats_trigger()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    PERFORM bump_stats_counter(TG_ARGV[0], 1);
+                ELSE
+                    PERFORM bump_stats_counter(TG_ARGV[0], -1);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION subscriptions_stats_trigger()
+            RETURNS TRIGGER AS $$
+            DECLARE
+                used_delta BIGINT := 0;
+                limit_delta BIGINT := 0;
+                active_delta BIGINT := 0;
+            BEGIN
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    used_delta := COALESCE(NEW.used_requests, 0);
+                    limit_delta := COALESCE(NEW.request_limit, 0);
+                    active_delta := CASE WHEN NEW.is_active THEN 1 ELSE 0 END;
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    used_delta := used_delta - COALESCE(OLD.used_requests, 0);
+                    limit_delta := limit_delta - COALESCE(OLD.request_limit, 0);
+                    active_delta := active_delta - CASE WHEN OLD.is_active THEN 1 ELSE 0 END;
+                END IF;
+                PERFORM bump_stats_counter('total_requests_used', used_delta);
+                PERFORM bump_stats_counter('total_requests_limit', limit_delta);
+                PERFORM bump_stats_counter('active_subscriptions', active_delta);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION bump_payment_daily_stats(
+                stat_day DATE, payment_status TEXT, payment_amount DECIMAL, sign INTEGER
+            )
+            RETURNS VOID AS $$
+            BEGIN
+                INSERT INTO payment_daily_stats AS d (
+                    day, total_payments, successful_payments, pending_payments, total_revenue
+                )
+                VALUES (
+                    stat_day,
+                    sign,
+                    CASE WHEN payment_status = 'succeeded' THEN sign ELSE 0 END,
+                    CASE WHEN payment_status = 'pending' THEN sign ELSE 0 END,
+                    CASE WHEN payment_status = 'succeeded' THEN sign * payment_amount ELSE 0 END
+                )
+                ON CONFLICT (day) DO UPDATE SET
+                    total_payments = d.total_payments + EXCLUDED.total_payments,
+                    successful_payments = d.successful_payments + EXCLUDED.successful_payments,
+                    pending_payments = d.pending_payments + EXCLUDED.pending_payments,
+                    total_revenue = d.total_revenue + EXCLUDED.total_revenue;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION payments_stats_trigger()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM bump_payment_daily_stats(OLD.created_at::date, OLD.status, OLD.amount, -1);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM bump_payment_daily_stats(NEW.created_at::date, NEW.status, NEW.amount, 1);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            """,
+            """
+            CREATE OR REPLACE TRIGGER users_stats
+            AFTER INSERT OR DELETE ON users
+            FOR EACH ROW EXECUTE FUNCTION count_rows_stats_trigger('total_users');
+
+            CREATE OR REPLACE TRIGGER user_links_stats
+            AFTER INSERT OR DELETE ON user_links
+            FOR EACH ROW EXECUTE FUNCTION count_rows_stats_trigger('total_links');
+
+            CREATE OR REPLACE TRIGGER subscriptions_stats
+            AFTER INSERT OR DELETE ON subscriptions
+            FOR EACH ROW EXECUTE FUNCTION subscriptions_stats_trigger();
+
+            CREATE OR REPLACE TRIGGER subscriptions_stats_update
+            AFTER UPDATE ON subscriptions
+            FOR EACH ROW
+            WHEN (
+                OLD.used_requests IS DISTINCT FROM NEW.used_requests
+                OR OLD.request_limit IS DISTINCT FROM NEW.request_limit
+                OR OLD.is_active IS DISTINCT FROM NEW.is_active
+            )
+            EXECUTE FUNCTION subscriptions_stats_trigger();
+
+            CREATE OR REPLACE TRIGGER payments_stats
+            AFTER INSERT OR DELETE ON payments
+            FOR EACH ROW EXECUTE FUNCTION payments_stats_trigger();
+
+            CREATE OR REPLACE TRIGGER payments_stats_update
+            AFTER UPDATE ON payments
+            FOR EACH ROW
+            WHEN (
+                OLD.status IS DISTINCT FROM NEW.status
+                OR OLD.amount IS DISTINCT FROM NEW.amount
+                OR OLD.created_at IS DISTINCT FROM NEW.created_at
+            )
+            EXECUTE FUNCTION payments_stats_trigger();
+            """,
+            # Первичное заполнение по уже существующим данным. Триггеры выше
+            # держат блокировки таблиц до конца транзакции, так что
+            # параллельные записи не будут посчитаны дважды.
+            """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM stats_counters) THEN
+                    INSERT INTO stats_counters (name, shard, value)
+                    SELECT 'total_users', 0, COUNT(*) FROM users
+                    UNION ALL
+                    SELECT 'total_links', 0, COUNT(*) FROM user_links
+                    UNION ALL
+                    SELECT 'total_requests_used', 0, COALESCE(SUM(used_requests), 0) FROM subscriptions
+                    UNION ALL
+                    SELECT 'total_requests_limit', 0, COALESCE(SUM(request_limit), 0) FROM subscriptions
+                    UNION ALL
+                    SELECT 'active_subscriptions', 0, COUNT(*) FILTER (WHERE is_active) FROM subscriptions;
+
+                    INSERT INTO payment_daily_stats (
+                        day, total_payments, successful_payments, pending_payments, total_revenue
+                    )
+                    SELECT
+                        created_at::date,
+                        COUNT(*),
+                        COUNT(*) FILTER (WHERE status = 'succeeded'),
+                        COUNT(*) FILTER (WHERE status = 'pending'),
+                        COALESCE(SUM(amount) FILTER (WHERE status = 'succeeded'), 0)
+                    FROM payments
+                    GROUP BY created_at::date
+                    ON CONFLICT (day) DO NOTHING;
+                END IF;
+            END;
+            $$
+            """,
+        ),
+    ),
+    Migration(
+        3,
+        "indexes for hot queries",
+        (
+            # Активная подписка пользователя: consume_request,
+            # get_active_subscription, get_user_statistics
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_subscriptions_user_active
+            ON subscriptions (user_id, end_date DESC)
+            WHERE is_active
+            """,
+            # Список подписок в админ-панели (keyset по end_date, id)
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_subscriptions_end_date
+            ON subscriptions (end_date DESC, id DESC)
+            """,
+            # История и статистика платежей пользователя
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_payments_user_created
+            ON payments (user_id, created_at DESC)
+            """,
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_links_user_id
+            ON user_links (user_id)
+            """,
+            # Список пользователей в админ-панели (keyset по created_at, id)
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_created_at
+            ON users (created_at DESC, id DESC)
+            """,
+        ),
+        transactional=False,
+    ),
+    Migration(
+        4,
+        "subscription per payment",
+        (
+            """
+            ALTER TABLE subscriptions
+            ADD COLUMN IF NOT EXISTS payment_id VARCHAR(255)
+            """,
+            # Повторная активация по тому же платежу упирается в этот индекс
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_subscriptions_payment_id
+            ON subscriptions (payment_id)
+            """,
+        ),
+    ),
+    Migration(
+        5,
+        "payment reconciliation schedule",
+        (
+            """
+            ALTER TABLE payments
+            ADD COLUMN IF NOT EXISTS check_attempts INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS next_check_at TIMESTAMP NOT NULL DEFAULT NOW()
+            """,
+            # Очередь сверки: только платежи в ожидании
+            """
+            CREATE INDEX IF NOT EXISTS idx_payments_pending_check
+            ON payments (next_check_at)
+            WHERE status = 'pending'
+            """,
+        ),
+    ),
+    Migration(
+        6,
+        "throttle buckets",
+        (
+            # Данные корзин не нужны после сбоя, поэтому таблица без WAL
+            """
+            CREATE UNLOGGED TABLE IF NOT EXISTS throttle_buckets (
+                key VARCHAR(255) PRIMARY KEY,
+                tokens DOUBLE PRECISION NOT NULL,
+                allowed BOOLEAN NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL
+            )
+            """,
+        ),
+    ),
+    Migration(
+        7,
+        "subscription expiry reminders",
+        (
+            """
+            ALTER TABLE subscriptions
+            ADD COLUMN IF NOT EXISTS reminder_sent BOOLEAN NOT NULL DEFAULT FALSE
+            """,
+        ),
+    ),
+    Migration(
+        8,
+        "active subscriptions by end date",
+        (
+            # Очередь окончаний подписок и напоминаний
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_subscriptions_active_end_date
+            ON subscriptions (end_date)
+            WHERE is_active
+            """,
+        ),
+        transactional=False,
+    ),
+    Migration(
+        9,
+        "tariff plans catalog",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS tariff_plans (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                price DECIMAL(10,2) NOT NULL,
+                duration_days INTEGER NOT NULL,
+                request_limit INTEGER NOT NULL,
+                description TEXT,
+                is_active BOOLEAN DEFAULT TRUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            # id тарифа совпадает с plan_key уже оформленных подписок
+            """
+            INSERT INTO tariff_plans (id, name, price, duration_days, request_limit, description) VALUES
+            (1, '1 месяц (5 запросов)', 500.00, 30, 5, 'Месячная подписка с 5 запросами ссылок'),
+            (2, '3 месяца (15 запросов)', 1200.00, 90, 15, '3 месяца с 15 запросами ссылок'),
+            (3, '6 месяцев (30 запросов)', 2000.00, 180, 30, '6 месяцев с 30 запросами ссылок'),
+            (4, '12 месяцев (60 запросов)', 3500.00, 365, 60, 'Годовая подписка с 60 запросами ссылок')
+            ON CONFLICT (id) DO NOTHING
+            """,
+            """
+            SELECT setval(
+                pg_get_serial_sequence('tariff_plans', 'id'),
+                GREATEST((SELECT MAX(id) FROM tariff_plans), 1)
+            )
+            """,
+            # Боты перечитывают каталог по уведомлению, а не на каждый запрос
+            """
+            CREATE OR REPLACE FUNCTION notify_tariff_plans_changed() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('tariff_plans_changed', '');
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS tariff_plans_changed ON tariff_plans",
+            """
+            CREATE TRIGGER tariff_plans_changed
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tariff_plans
+            FOR EACH STATEMENT EXECUTE PROCEDURE notify_tariff_plans_changed()
+            """,
+        ),
+    ),
+    Migration(
+        10,
+        "payment events staging",
+        (
+            # Уведомление кассы подтверждается только после записи сюда,
+            # поэтому переживает перезапуск процесса
+            """
+            CREATE TABLE IF NOT EXISTS payment_events (
+                id BIGSERIAL PRIMARY KEY,
+                payment_id VARCHAR(255) NOT NULL,
+                status VARCHAR(50) NOT NULL,
+                received_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                UNIQUE (payment_id, status)
+            )
+            """,
+        ),
+    ),
+    Migration(
+        11,
+        "expiry reminder claims",
+        (
+            # Напоминание отмечается отправленным только после доставки
+            """
+            ALTER TABLE subscriptions
+            ADD COLUMN IF NOT EXISTS reminder_claimed_at TIMESTAMP
+            """,
+        ),
+    ),
+    Migration(
+        12,
+        "subscription end date notifications",
+        (
+            # Планировщик окончаний кладет новые и продленные end_date в кучу
+            # сразу, а не при следующем перечитывании. Секунды до end_date
+            # считаются до commit, поэтому срок в куче выходит чуть позже
+            # настоящего, но не раньше
+            """
+            CREATE OR REPLACE FUNCTION notify_subscription_end_date() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify(
+                    'subscription_end_dates',
+                    EXTRACT(EPOCH FROM NEW.end_date - clock_timestamp())::text
+                );
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS subscription_end_date_changed ON subscriptions",
+            """
+            CREATE TRIGGER subscription_end_date_changed
+            AFTER INSERT OR UPDATE OF end_date, is_active ON subscriptions
+            FOR EACH ROW
+            WHEN (NEW.is_active AND NEW.end_date IS NOT NULL)
+            EXECUTE PROCEDURE notify_subscription_end_date()
+            """,
+        ),
+    ),
+]
+
+
+async def migrate(conn: asyncpg.Connection) -> list[int]:
+    """Применить недостающие миграции, вернуть список примененных версий"""
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
+        )
+    """
+    )
+
+    await _lock(conn)
+    try:
+        applied = {
+            row["version"]
+            for row in await conn.fetch("SELECT version FROM schema_migrations")
+        }
+
+        done = []
+        for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+            if migration.version in applied:
+                continue
+
+            logger.info(f"Применение миграции {migration.version}: {migration.name}")
+            if migration.transactional:
+                async with conn.transaction():
+                    for statement in migration.statements:
+                        await conn.execute(statement, timeout=MIGRATION_TIMEOUT)
+                    await _mark_applied(conn, migration)
+            else:
+                indexes = _concurrent_indexes(migration)
+                await _drop_invalid_indexes(conn, indexes)
+                for statement in migration.statements:
+                    await conn.execute(statement, timeout=MIGRATION_TIMEOUT)
+                # Версия записывается, только если все индексы построены
+                if await _invalid_indexes(conn, indexes):
+                    raise RuntimeError(
+                        f"Миграция {migration.version}: индексы не построены, "
+                        f"повторите запуск"
+                    )
+                await _mark_applied(conn, migration)
+
+            done.append(migration.version)
+
+        return done
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_KEY)
+
+
+async def _lock(conn: asyncpg.Connection):
+    """Взять блокировку миграций, не держа открытый запрос во время ожидания.
+
+    Сессия, ждущая в pg_advisory_lock, держит снимок данных, а CREATE INDEX
+    CONCURRENTLY ждет завершения всех старых снимков - ожидающая реплика
+    заблокировала бы построение индекса у той, что мигрирует.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MIGRATION_TIMEOUT
+    while not await conn.fetchval(
+        "SELECT pg_try_advisory_lock($1)", MIGRATIONS_LOCK_KEY
+    ):
+        if loop.time() >= deadline:
+            raise asyncio.TimeoutError("Не дождались блокировки миграций")
+        await asyncio.sleep(MIGRATIONS_LOCK_POLL)
+
+
+def _concurrent_indexes(migration: Migration) -> list[str]:
+    return [
+        name
+        for statement in migration.statements
+        for name in _CONCURRENT_INDEX.findall(statement)
+    ]
+
+
+async def _invalid_indexes(conn: asyncpg.Connection, names: list[str]) -> list[str]:
+    """Индексы из names, оставшиеся INVALID после прерванного построения"""
+    if not names:
+        return []
+    rows = await conn.fetch(
+        """
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = ANY($1::text[])
+        AND pg_table_is_visible(c.oid)
+        AND NOT i.indisvalid
+        """,
+        names,
+    )
+    return [row["relname"] for row in rows]
+
+
+async def _drop_invalid_indexes(conn: asyncpg.Connection, names: list[str]):
+    # IF NOT EXISTS пропустил бы такой индекс, и он остался бы нерабочим
+    for name in await _invalid_indexes(conn, names):
+        logger.warning(f"Удаление недостроенного индекса {name}")
+        await conn.execute(
+            f"DROP INDEX CONCURRENTLY IF EXISTS {name}", timeout=MIGRATION_TIMEOUT
+        )
+
+
+async def _mark_applied(conn: asyncpg.Connection, migration: Migration):
+    await conn.execute(
+        "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)",
+        migration.version,
+        migration.name,
+    )
@@ -1,29 +1,37 @@
-from yookassa import Payment, Configuration
 import uuid
 import logging
 from config import Config
-from .database import db_instance as db
+from yookassa_client import YooKassaClient
+from webhook_queue import WebhookQueue, EVENT_STATUSES
+from payment_reconciler import PaymentReconciler
+from database import Database
+from plan_catalog import catalog
 
 logger = logging.getLogger(__name__)
 
-# Настройка Яндекс Кассы
-Configuration.account_id = Config.YOOKASSA_SHOP_ID
-Configuration.secret_key = Config.YOOKASSA_SECRET_KEY
+# Клиент Яндекс Кассы (общий для всего процесса)
+client = YooKassaClient()
+
+# Очередь вебхуков и сверка платежей, запускаются в main() после подключения к БД
+webhook_queue = WebhookQueue()
+reconciler = PaymentReconciler(client)
 
 class YooKassaPayment:
     @staticmethod
-    async def create_payment(user_id: int, plan_key: str, telegram_id: int) -> dict:
+    async def create_payment(
+        db: Database, user_id: int, plan_key: str, telegram_id: int
+    ) -> dict:
         """Создание платежа в Яндекс Кассе"""
         try:
-            plan = Config.SUBSCRIPTION_PLANS.get(plan_key)
+            plan = catalog.get(plan_key)
             if not plan:
                 return {'success': False, 'error': 'Тарифный план не найден'}
             
-            # Генерируем уникальный ID платежа
-            payment_id = str(uuid.uuid4())
+            # Генерируем ключ идемпотентности платежа
+            idempotence_key = str(uuid.uuid4())
             
             # Создаем описание платежа
-            description = f"Подписка на {plan['name']} для пользователя {telegram_id}"
+            description = f"Подписка на {plan.name} для пользователя {telegram_id}"
             
             # Вариант 1: Используем email из конфига
             receipt = {
@@ -36,7 +44,7 @@ class YooKassaPayment:
                         "description": description[:128],  # Максимум 128 символов
                         "quantity": "1.00",
                         "amount": {
-                            "value": str(plan['price']),
+                            "value": str(plan.price),
                             "currency": "RUB"
                         },
                         "vat_code": Config.VAT_CODE,  # Используем из конфига
@@ -56,7 +64,7 @@ class YooKassaPayment:
             # Создаем платеж в Яндекс Кассе
             payment_data = {
                 "amount": {
-                    "value": str(plan['price']),
+                    "value": str(plan.price),
                     "currency": "RUB"
                 },
                 "payment_method_data": {
@@ -72,7 +80,7 @@ class YooKassaPayment:
                     "user_id": user_id,
                     "telegram_id": telegram_id,
                     "plan_key": plan_key,
-                    "plan_name": plan['name']
+                    "plan_name": plan.name
                 },
                 "receipt": receipt
             }
@@ -81,22 +89,22 @@ class YooKassaPayment:
             if hasattr(Config, 'TAX_SYSTEM_CODE') and Config.TAX_SYSTEM_CODE:
                 payment_data["tax_system_code"] = Config.TAX_SYSTEM_CODE
             
-            payment = Payment.create(payment_data)
+            payment = await client.create_payment(payment_data, idempotence_key)
             
             # Сохраняем платеж в БД
             await db.create_payment_record(
                 user_id=user_id,
-                payment_id=payment.id,
-                amount=float(plan['price']),
+                payment_id=payment['id'],
+                amount=float(plan.price),
                 plan_key=plan_key
             )
             
             return {
                 'success': True,
-                'payment_id': payment.id,
-                'confirmation_url': payment.confirmation.confirmation_url,
-                'amount': plan['price'],
-                'plan_name': plan['name']
+                'payment_id': payment['id'],
+                'confirmation_url': payment['confirmation']['confirmation_url'],
+                'amount': plan.price,
+                'plan_name': plan.name
             }
             
         except Exception as e:
@@ -104,27 +112,26 @@ class YooKassaPayment:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
-    async def check_payment_status(payment_id: str) -> dict:
+    async def check_payment_status(db: Database, payment_id: str) -> dict:
         """Проверка статуса платежа"""
         try:
-            payment = Payment.find_one(payment_id)
+            payment = await client.get_payment(payment_id)
+            metadata = payment.get('metadata') or {}
             
             # Если платеж успешен, активируем подписку
-            if payment.status == 'succeeded':
-                metadata = payment.metadata
-                if metadata:
-                    user_id = metadata.get('user_id')
-                    plan_key = metadata.get('plan_key')
-                    if user_id and plan_key:
-                        # Активируем подписку
-                        await db.create_subscription(user_id, plan_key, payment_id)
+            if payment['status'] == 'succeeded':
+                user_id = metadata.get('user_id')
+                plan_key = metadata.get('plan_key')
+                if user_id and plan_key:
+                    # Активируем подписку (метаданные касса возвращает строками)
+                    await db.create_subscription(int(user_id), plan_key, payment_id)
             
             return {
                 'success': True,
-                'status': payment.status,
-                'paid': payment.paid,
-                'amount': payment.amount.value,
-                'metadata': payment.metadata
+                'status': payment['status'],
+                'paid': payment.get('paid', False),
+                'amount': payment['amount']['value'],
+                'metadata': metadata
             }
         except Exception as e:
             logger.error(f"Ошибка проверки статуса платежа: {e}")
@@ -132,40 +139,19 @@ class YooKassaPayment:
     
     @staticmethod
     async def handle_webhook(data: dict) -> dict:
-        """Обработка вебхука от Яндекс Кассы"""
+        """Обработка вебхука от Яндекс Кассы (событие ставится в очередь)"""
         try:
             event = data.get('event')
             payment_data = data.get('object', {})
             payment_id = payment_data.get('id')
             
-            if event == 'payment.succeeded':
-                # Обновляем статус платежа в БД
-                await db.update_payment_status(payment_id, 'succeeded')
-                
-                # Получаем метаданные для активации подписки
-                metadata = payment_data.get('metadata', {})
-                user_id = metadata.get('user_id')
-                plan_key = metadata.get('plan_key')
-                
-                if user_id and plan_key:
-                    # Активируем подписку
-                    await db.create_subscription(user_id, plan_key, payment_id)
-                
-                return {'success': True, 'message': 'Payment succeeded and subscription activated'}
-            
-            elif event == 'payment.waiting_for_capture':
-                await db.update_payment_status(payment_id, 'pending')
-                return {'success': True, 'message': 'Payment pending capture'}
-            
-            elif event == 'payment.canceled':
-                await db.update_payment_status(payment_id, 'failed')
-                return {'success': True, 'message': 'Payment canceled'}
-            
-            elif event == 'payment.refund.succeeded':
-                await db.update_payment_status(payment_id, 'refunded')
-                return {'success': True, 'message': 'Payment refunded'}
+            if event not in EVENT_STATUSES:
+                return {'success': False, 'error': 'Unknown event'}
             
-            return {'success': False, 'error': 'Unknown event'}
+            # Успех возвращается только после записи события в БД
+            if await webhook_queue.put(event, payment_id):
+                return {'success': True, 'message': 'Event queued'}
+            return {'success': True, 'message': 'Duplicate event ignored'}
         except Exception as e:
             logger.error(f"Ошибка обработки вебхука: {e}")
             return {'success': False, 'error': str(e)}
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+
+from background import BackgroundTask
+from config import Config
+from yookassa_client import YooKassaClient
+
+logger = logging.getLogger(__name__)
+
+# Статус платежа в БД для каждого статуса платежа в кассе
+PROVIDER_STATUSES = {
+    "succeeded": "succeeded",
+    "canceled": "failed",
+    "waiting_for_capture": "pending",
+}
+
+
+class PaymentReconciler(BackgroundTask):
+    """Фоновая сверка платежей в ожидании с Яндекс Кассой.
+
+    Раз в interval секунд забирает из БД пачку платежей, у которых подошло
+    время проверки, опрашивает кассу не более чем concurrency запросами
+    одновременно и применяет изменившиеся статусы тем же путем, что и
+    вебхуки (с активацией подписок).
+    """
+
+    def __init__(
+        self,
+        client: YooKassaClient,
+        interval: float = Config.RECONCILE_INTERVAL,
+        batch_size: int = Config.RECONCILE_BATCH_SIZE,
+        concurrency: int = Config.RECONCILE_CONCURRENCY,
+    ):
+        super().__init__()
+        self.client = client
+        self.interval = interval
+        self.batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+        # Метрики
+        self.last_run_at: float | None = None
+        self.pending_payments = 0
+        self.oldest_pending_seconds = 0.0
+        self.checked_total = 0
+        self.updated_total = 0
+        self.activated_total = 0
+        self.errors_total = 0
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка сверки платежей: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        payments = await self._db.claim_pending_payments(
+            self.batch_size,
+            Config.RECONCILE_MIN_AGE,
+            Config.RECONCILE_BACKOFF_BASE,
+            Config.RECONCILE_BACKOFF_MAX,
+        )
+
+        statuses = await asyncio.gather(
+            *(self._fetch_status(p["payment_id"]) for p in payments)
+        )
+        events = [
+            (payment["payment_id"], status)
+            for payment, status in zip(payments, statuses)
+            if status and status != "pending"
+        ]
+
+        if events:
+            result = await self._db.apply_payment_events(events)
+            self.updated_total += result["updated"]
+            self.activated_total += result["activated"]
+
+        lag = await self._db.get_pending_payments_lag()
+        self.pending_payments = lag.get("pending_payments", 0)
+        self.oldest_pending_seconds = float(lag.get("oldest_pending_seconds", 0))
+        self.last_run_at = time.time()
+
+        if payments:
+            logger.info(
+                f"Сверка платежей: проверено {len(payments)}, изменилось {len(events)}, "
+                f"в ожидании {self.pending_payments}, "
+                f"самому старому {self.oldest_pending_seconds:.0f} с"
+            )
+
+    async def _fetch_status(self, payment_id: str) -> str | None:
+        async with self._semaphore:
+            try:
+                payment = await self.client.get_payment(payment_id)
+                self.checked_total += 1
+                return PROVIDER_STATUSES.get(payment.get("status"))
+            except Exception as e:
+                self.errors_total += 1
+                logger.warning(f"Не удалось проверить платеж {payment_id}: {e}")
+                return None
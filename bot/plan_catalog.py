@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Callable, Mapping
+
+from background import Listener
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Канал, в который триггер на tariff_plans сообщает об изменениях
+PLANS_CHANNEL = "tariff_plans_changed"
+
+
+@dataclass(frozen=True)
+class Plan:
+    key: str
+    name: str
+    price: Decimal
+    requests: int
+    days: int
+    description: str
+
+    @property
+    def duration_months(self) -> int:
+        return max(self.days // 30, 1)
+
+    @property
+    def price_text(self) -> str:
+        """Цена для показа: 500₽, а не 500.00₽"""
+        return Config.format_price(f"{self.price.normalize():f}")
+
+
+class PlanCatalog(Listener):
+    """Каталог тарифов из таблицы tariff_plans.
+
+    Тарифы читаются из БД целиком и хранятся неизменяемым снимком, поэтому
+    хендлеры получают план без запроса к БД. При изменении tariff_plans
+    (например, из админ-панели) триггер делает NOTIFY, и снимок
+    перечитывается и подменяется целиком, как и после переподключения LISTEN.
+    """
+
+    def __init__(self, interval: float = Config.LISTEN_CHECK_INTERVAL):
+        super().__init__(PLANS_CHANNEL, self._on_notify, self.load, interval)
+        self._snapshot: Mapping[str, Plan] = MappingProxyType({})
+        self._listeners: list[Callable[[Mapping[str, Plan]], None]] = []
+        self._reloads: set[asyncio.Task] = set()
+
+    @property
+    def plans(self) -> Mapping[str, Plan]:
+        return self._snapshot
+
+    def get(self, plan_key: str) -> Plan | None:
+        return self._snapshot.get(plan_key)
+
+    def on_change(self, listener: Callable[[Mapping[str, Plan]], None]):
+        """Вызывать listener(plans) после каждой загрузки каталога"""
+        self._listeners.append(listener)
+
+    async def load(self):
+        rows = await self._db.get_subscription_plans()
+        self._snapshot = MappingProxyType(
+            {
+                str(row["id"]): Plan(
+                    key=str(row["id"]),
+                    name=row["name"],
+                    price=row["price"],
+                    requests=row["request_limit"],
+                    days=row["duration_days"],
+                    description=row["description"] or "",
+                )
+                for row in rows
+            }
+        )
+        logger.info(f"Загружено тарифов: {len(self._snapshot)}")
+        for listener in self._listeners:
+            listener(self._snapshot)
+
+    async def start(self, db):
+        self._db = db
+        await self.load()
+        await super().start(db)
+
+    def _on_notify(self, payload: str):
+        task = asyncio.create_task(self._reload())
+        self._reloads.add(task)
+        task.add_done_callback(self._reloads.discard)
+
+    async def _reload(self):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки тарифов: {e}")
+
+
+catalog = PlanCatalog()
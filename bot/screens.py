@@ -0,0 +1,137 @@
+"""Предсобранные экраны и клавиатуры бота.
+
+Тексты и разметка, зависящие только от каталога тарифов, собираются один
+раз при запуске и пересобираются через rebuild() при изменении тарифов.
+В хендлерах в готовые строки подставляются только данные пользователя.
+"""
+import html
+from typing import Mapping
+
+from aiogram.types import InlineKeyboardButton, KeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
+
+from plan_catalog import Plan, catalog
+
+
+def _plan_line(plan: Plan) -> str:
+    # Количество запросов уже есть в названии тарифа
+    return f"{html.escape(plan.name)} - {plan.price_text}"
+
+
+class Screens:
+    def __init__(self, plans: Mapping[str, Plan]):
+        self.rebuild(plans)
+
+    def rebuild(self, plans: Mapping[str, Plan]):
+        """Пересобрать экраны под новый каталог тарифов"""
+        self.plans = plans
+        self._welcome_body = self._build_welcome_body(plans)
+        self.buy_text = self._build_buy_text(plans)
+        self.no_subscription_text = self._build_no_subscription_text(plans)
+        self.plans_keyboard = self._build_plans_keyboard(plans)
+        self._main_menu = {
+            is_admin: self._build_main_menu(is_admin) for is_admin in (False, True)
+        }
+
+    def welcome(self, first_name: str | None) -> str:
+        return f"👋 Привет, {html.escape(first_name or 'Пользователь')}!" + self._welcome_body
+
+    def main_menu(self, is_admin: bool):
+        return self._main_menu[is_admin]
+
+    @staticmethod
+    def _build_welcome_body(plans: Mapping[str, Plan]) -> str:
+        plans_text = "\n".join(
+            f"{i}. {_plan_line(plan)}" for i, plan in enumerate(plans.values(), 1)
+        )
+        return f"""
+
+🤖 Я бот для управления подписками с Яндекс Кассой.
+
+✨ <b>Доступные функции:</b>
+• Безопасная оплата через Яндекс Кассу
+• Добавление ссылок с учетом лимита
+• Просмотр статистики и истории
+• Автоматическое обновление подписок
+
+💎 <b>Тарифные планы:</b>
+{plans_text}
+
+<b>Запрос</b> - добавление одной ссылки. Лимит обновляется при продлении.
+
+Используйте кнопки ниже для навигации! 🚀"""
+
+    @staticmethod
+    def _build_buy_text(plans: Mapping[str, Plan]) -> str:
+        # Экономия считается относительно самого дорогого месяца
+        month_price = max(
+            (plan.price / plan.duration_months for plan in plans.values()),
+            default=0,
+        )
+        blocks = []
+        for i, plan in enumerate(plans.values(), 1):
+            title = f"{i}. <b>{html.escape(plan.name)}</b> - {plan.price_text}"
+            full_price = month_price * plan.duration_months
+            saving = round((1 - plan.price / full_price) * 100) if full_price else 0
+            if saving > 0:
+                title += f" (экономия {saving}%)"
+            blocks.append(
+                f"{title}\n"
+                f"   • {plan.requests} запросов ссылок\n"
+                f"   • Доступ на {plan.days} дней"
+            )
+        return (
+            "💎 <b>Выберите тарифный план:</b>\n\n"
+            + "\n\n".join(blocks)
+            + "\n\nВыберите подходящий вариант:"
+        )
+
+    @staticmethod
+    def _build_no_subscription_text(plans: Mapping[str, Plan]) -> str:
+        plans_text = "\n".join(f"• {_plan_line(plan)}" for plan in plans.values())
+        return f"""📊 <b>Ваша статистика</b>
+
+❌ <b>У вас нет активной подписки.</b>
+
+💎 Для доступа к функциям бота приобретите подписку:
+{plans_text}
+
+<b>Нажмите "💎 Купить подписку" для выбора тарифа.</b>
+
+✨ <b>Что дает подписка:</b>
+• Возможность добавлять ссылки
+• Доступ ко всем функциям бота
+• Приоритетную поддержку
+• Автоматическое обновление"""
+
+    @staticmethod
+    def _build_plans_keyboard(plans: Mapping[str, Plan]):
+        builder = InlineKeyboardBuilder()
+        for plan_key, plan in plans.items():
+            builder.add(
+                InlineKeyboardButton(
+                    text=f"{plan.name} - {plan.price_text}",
+                    callback_data=f"buy_{plan_key}",
+                )
+            )
+        builder.adjust(1)
+        return builder.as_markup()
+
+    @staticmethod
+    def _build_main_menu(is_admin: bool):
+        builder = ReplyKeyboardBuilder()
+        builder.row(
+            KeyboardButton(text="💎 Купить подписку"),
+            KeyboardButton(text="🔗 Добавить ссылку"),
+        )
+        builder.row(
+            KeyboardButton(text="📊 Моя статистика"),
+            KeyboardButton(text="📋 Инструкция"),
+        )
+        if is_admin:
+            builder.row(KeyboardButton(text="👑 Админ панель"))
+        return builder.as_markup(resize_keyboard=True)
+
+
+screens = Screens(catalog.plans)
+catalog.on_change(screens.rebuild)
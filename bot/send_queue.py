@@ -0,0 +1,177 @@
+"""Исходящие сообщения с учетом лимитов Telegram.
+
+Все запросы к Bot API, адресованные чату, проходят через
+SendRateLimitMiddleware: он выдерживает общий лимит бота и лимит на чат,
+а при RetryAfter ждет указанное время и повторяет запрос. Массовые
+рассылки ставятся в SendQueue и отправляются в фоне с отдельным, меньшим
+лимитом, чтобы не вытеснять ответы пользователям.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+from background import BackgroundTask
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Асинхронный token bucket: acquire() ждет, пока появится токен"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def delay(self) -> float:
+        """Забрать токен и вернуть, сколько секунд ждать до его использования"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        return max(wait, self._paused_until - now)
+
+    async def acquire(self):
+        # Под блокировкой ожидающие получают токены по очереди
+        async with self._lock:
+            wait = self.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Не выдавать токены ближайшие seconds секунд (после RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class SendRateLimitMiddleware(BaseRequestMiddleware):
+    """Лимиты Bot API для запросов с chat_id и повтор при RetryAfter.
+
+    Лимит Telegram общий для токена, поэтому при нескольких процессах
+    общий лимит делится между ними.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = Config.SEND_GLOBAL_RATE / Config.BOT_WORKERS,
+        chat_rate: float = Config.SEND_CHAT_RATE,
+        chat_burst: int = Config.SEND_CHAT_BURST,
+        max_retries: int = Config.SEND_MAX_RETRIES,
+        max_chats: int = 10000,
+    ):
+        self.global_limiter = RateLimiter(global_rate, max(int(global_rate), 1))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chats: OrderedDict[int | str, RateLimiter] = OrderedDict()
+
+    def _chat_limiter(self, chat_id: int | str) -> RateLimiter:
+        limiter = self._chats.pop(chat_id, None)
+        if limiter is None:
+            limiter = RateLimiter(self.chat_rate, self.chat_burst)
+        self._chats[chat_id] = limiter
+        if len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+        return limiter
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        chat_limiter = self._chat_limiter(chat_id) if chat_id is not None else None
+
+        for attempt in range(self.max_retries + 1):
+            if chat_limiter is not None:
+                await chat_limiter.acquire()
+                await self.global_limiter.acquire()
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(
+                    f"Telegram просит подождать {e.retry_after} с ({type(method).__name__})"
+                )
+                if chat_limiter is not None:
+                    # Ждет только этот чат: ответы в остальные чаты уходят без задержки
+                    chat_limiter.pause(e.retry_after)
+                else:
+                    self.global_limiter.pause(e.retry_after)
+                    await asyncio.sleep(e.retry_after)
+
+
+class SendQueue(BackgroundTask):
+    """Фоновая очередь рассылок.
+
+    Сообщения отправляются не чаще rate в секунду, хендлеры только ставят
+    их в очередь. Ошибки отдельных чатов (бот заблокирован и т.п.)
+    логируются и не останавливают рассылку. on_sent сообщения вызывается
+    только после успешной отправки.
+    """
+
+    def __init__(self, bot: Bot, rate: float = Config.BROADCAST_RATE / Config.BOT_WORKERS):
+        super().__init__()
+        self.bot = bot
+        self.limiter = RateLimiter(rate)
+        self._queue: asyncio.Queue[
+            tuple[int, str, Callable[[], Awaitable] | None, dict]
+        ] = asyncio.Queue()
+
+        # Метрики
+        self.sent_total = 0
+        self.failed_total = 0
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def send(
+        self,
+        chat_id: int,
+        text: str,
+        on_sent: Callable[[], Awaitable] | None = None,
+        **kwargs,
+    ):
+        """Поставить сообщение в очередь"""
+        self._queue.put_nowait((chat_id, text, on_sent, kwargs))
+
+    def broadcast(self, chat_ids, text: str, **kwargs) -> int:
+        """Поставить в очередь одно сообщение для многих чатов"""
+        count = 0
+        for chat_id in chat_ids:
+            self.send(chat_id, text, **kwargs)
+            count += 1
+        return count
+
+    async def stop(self):
+        await super().stop()
+        if self._queue.qsize():
+            logger.warning(f"Не отправлено сообщений из очереди: {self._queue.qsize()}")
+
+    async def _run(self):
+        while True:
+            chat_id, text, on_sent, kwargs = await self._queue.get()
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                self.sent_total += 1
+            except TelegramAPIError as e:
+                self.failed_total += 1
+                logger.info(f"Сообщение в чат {chat_id} не отправлено: {e}")
+            except Exception as e:
+                self.failed_total += 1
+                logger.error(f"Ошибка отправки сообщения в чат {chat_id}: {e}")
+            else:
+                if on_sent is not None:
+                    try:
+                        await on_sent()
+                    except Exception as e:
+                        logger.error(f"Ошибка обработки отправки в чат {chat_id}: {e}")
@@ -0,0 +1,364 @@
+"""Реестр именованных SQL-запросов бота.
+
+Запросы готовятся (PREPARE) один раз на каждое соединение пула и дальше
+переиспользуются без повторного разбора и планирования. Вместо SELECT *
+везде перечислены нужные колонки.
+"""
+import logging
+import time
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+USER_COLUMNS = "id, telegram_id, username, full_name, created_at"
+SUBSCRIPTION_COLUMNS = (
+    "id, user_id, plan_key, request_limit, used_requests, "
+    "start_date, end_date, is_active, payment_id, created_at"
+)
+PAYMENT_COLUMNS = (
+    "id, user_id, subscription_id, payment_id, amount, plan_key, "
+    "status, created_at, updated_at"
+)
+
+# Порядок статусов в жизненном цикле платежа: статус платежа меняется
+# только на более поздний, поэтому запоздавший повтор уведомления
+# (например, succeeded после refunded) ничего не откатывает
+STATUS_RANK = {"pending": 0, "failed": 1, "succeeded": 1, "refunded": 2}
+
+
+def _status_rank(column: str) -> str:
+    cases = " ".join(f"WHEN '{status}' THEN {rank}" for status, rank in STATUS_RANK.items())
+    return f"(CASE {column} {cases} ELSE 0 END)"
+
+
+STATEMENTS: dict[str, str] = {
+    # Пользователи
+    "user_by_telegram_id": f"""
+        SELECT {USER_COLUMNS} FROM users WHERE telegram_id = $1
+    """,
+    "user_by_id": f"""
+        SELECT {USER_COLUMNS} FROM users WHERE id = $1
+    """,
+    # Пользователя могут одновременно создавать несколько процессов
+    "insert_user": f"""
+        INSERT INTO users (telegram_id, username, full_name)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (telegram_id) DO UPDATE
+        SET username = COALESCE(EXCLUDED.username, users.username),
+            full_name = COALESCE(EXCLUDED.full_name, users.full_name)
+        RETURNING {USER_COLUMNS}
+    """,
+    "update_user": f"""
+        UPDATE users 
+        SET username = COALESCE($2, username),
+            full_name = COALESCE($3, full_name)
+        WHERE id = $1
+        RETURNING {USER_COLUMNS}
+    """,
+    "user_activity": """
+        SELECT 
+            (SELECT COUNT(*) FROM user_links WHERE user_id = $1) as total_requests,
+            (SELECT COUNT(*) FROM payments WHERE user_id = $1) as total_payments,
+            (
+                SELECT COALESCE(SUM(amount), 0) FROM payments
+                WHERE user_id = $1 AND status = 'succeeded'
+            ) as total_spent
+    """,
+    # Подписки
+    # Истекшие подписки снимает ExpiryScheduler, поэтому достаточно is_active
+    "active_subscription": f"""
+        SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions 
+        WHERE user_id = $1 AND is_active = TRUE 
+        ORDER BY end_date DESC LIMIT 1
+    """,
+    # Очередь окончаний подписок (индекс end_date WHERE is_active)
+    "upcoming_expirations": """
+        SELECT EXTRACT(EPOCH FROM end_date - NOW())::float8 as seconds
+        FROM subscriptions
+        WHERE is_active = TRUE
+        AND end_date <= NOW() + INTERVAL '1 second' * $1
+        ORDER BY end_date
+        LIMIT $2
+    """,
+    "expire_due_subscriptions": """
+        WITH expired AS (
+            UPDATE subscriptions
+            SET is_active = FALSE
+            WHERE id IN (
+                SELECT id FROM subscriptions
+                WHERE is_active = TRUE AND end_date <= NOW()
+                ORDER BY end_date
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, user_id
+        )
+        SELECT expired.id, u.telegram_id
+        FROM expired
+        JOIN users u ON u.id = expired.user_id
+    """,
+    # reminder_sent выставляется только после отправки; захват без отправки
+    # (перезапуск процесса) истекает через $3 секунд
+    "claim_expiry_reminders": """
+        WITH due AS (
+            UPDATE subscriptions
+            SET reminder_claimed_at = NOW()
+            WHERE id IN (
+                SELECT id FROM subscriptions
+                WHERE is_active = TRUE
+                AND reminder_sent = FALSE
+                AND (reminder_claimed_at IS NULL
+                     OR reminder_claimed_at < NOW() - INTERVAL '1 second' * $3)
+                AND end_date <= NOW() + INTERVAL '1 day' * $1
+                ORDER BY end_date
+                LIMIT $2
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, user_id, end_date
+        )
+        SELECT due.id, due.end_date, u.telegram_id
+        FROM due
+        JOIN users u ON u.id = due.user_id
+    """,
+    "mark_reminder_sent": """
+        UPDATE subscriptions SET reminder_sent = TRUE WHERE id = $1
+    """,
+    "consume_request": """
+        WITH sub AS (
+            SELECT id, request_limit, used_requests
+            FROM subscriptions
+            WHERE user_id = $1 AND is_active = TRUE
+            ORDER BY end_date DESC LIMIT 1
+            FOR UPDATE
+        ),
+        consumed AS (
+            UPDATE subscriptions s
+            SET used_requests = s.used_requests + 1
+            FROM sub
+            WHERE s.id = sub.id AND s.used_requests < s.request_limit
+            RETURNING s.id, s.used_requests
+        ),
+        link AS (
+            INSERT INTO user_links (user_id, subscription_id, url)
+            SELECT $1, id, $2 FROM consumed
+            RETURNING id
+        )
+        SELECT
+            sub.id AS subscription_id,
+            sub.request_limit,
+            COALESCE(consumed.used_requests, sub.used_requests) AS used_requests,
+            consumed.id IS NOT NULL AS consumed
+        FROM sub
+        LEFT JOIN consumed ON TRUE
+    """,
+    # Лимит и срок берутся из tariff_plans по ключу без фильтра is_active:
+    # тариф могли отключить, пока платеж был в пути, а оплата уже прошла
+    "create_subscription": """
+        WITH plan AS (
+            SELECT request_limit, duration_days
+            FROM tariff_plans
+            WHERE id::text = $2
+        ),
+        new_subscription AS (
+            INSERT INTO subscriptions (
+                user_id, plan_key, request_limit, used_requests, end_date, is_active, payment_id
+            )
+            SELECT $1, $2, plan.request_limit, 0,
+                NOW() + INTERVAL '1 day' * plan.duration_days, TRUE, $3
+            FROM plan
+            ON CONFLICT (payment_id) DO NOTHING
+            RETURNING id
+        ),
+        -- Деактивируем старые подписки, только если подписка действительно создана.
+        -- Новую строку этот UPDATE не видит: все части запроса работают
+        -- с одним снимком данных.
+        deactivated AS (
+            UPDATE subscriptions
+            SET is_active = FALSE
+            WHERE user_id = $1 AND is_active = TRUE
+            AND EXISTS (SELECT 1 FROM new_subscription)
+        ),
+        -- Обновляем статус платежа
+        paid AS (
+            UPDATE payments
+            SET status = 'succeeded',
+                subscription_id = new_subscription.id,
+                updated_at = NOW()
+            FROM new_subscription
+            WHERE payments.payment_id = $3
+        )
+        SELECT
+            (SELECT id FROM new_subscription) AS subscription_id,
+            EXISTS (SELECT 1 FROM plan) AS plan_found
+    """,
+    "tariff_plans": """
+        SELECT id, name, price, duration_days, request_limit, description
+        FROM tariff_plans
+        WHERE is_active = TRUE
+        ORDER BY price, id
+    """,
+    # Платежи
+    "insert_payment": """
+        INSERT INTO payments (user_id, payment_id, amount, plan_key, status)
+        VALUES ($1, $2, $3, $4, 'pending')
+    """,
+    "update_payment_status": """
+        UPDATE payments 
+        SET status = $1, updated_at = NOW()
+        WHERE payment_id = $2
+    """,
+    # Сверка платежей: следующая проверка сразу переносится с экспоненциальной
+    # задержкой ($3 - база, $4 - максимум в секундах)
+    "claim_pending_payments": """
+        UPDATE payments
+        SET check_attempts = check_attempts + 1,
+            next_check_at = NOW() + LEAST(
+                INTERVAL '1 second' * $3 * POWER(2, LEAST(check_attempts, 20)),
+                INTERVAL '1 second' * $4
+            )
+        WHERE id IN (
+            SELECT id FROM payments
+            WHERE status = 'pending'
+            AND next_check_at <= NOW()
+            AND created_at <= NOW() - INTERVAL '1 second' * $2
+            ORDER BY next_check_at
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING payment_id, user_id, plan_key, created_at, check_attempts
+    """,
+    "pending_payments_lag": """
+        SELECT 
+            COUNT(*) as pending_payments,
+            COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(created_at)), 0) as oldest_pending_seconds
+        FROM payments
+        WHERE status = 'pending'
+    """,
+    # События уведомлений кассы; повтор еще не примененного события не пишется
+    "insert_payment_event": """
+        INSERT INTO payment_events (payment_id, status)
+        VALUES ($1, $2)
+        ON CONFLICT (payment_id, status) DO NOTHING
+        RETURNING id
+    """,
+    "claim_payment_events": """
+        DELETE FROM payment_events
+        WHERE id IN (
+            SELECT id FROM payment_events
+            ORDER BY id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING payment_id, status
+    """,
+    # $1, $2 - массивы payment_id и статусов; из нескольких событий одного
+    # платежа берется самое позднее
+    "apply_payment_statuses": f"""
+        WITH events AS (
+            SELECT DISTINCT ON (payment_id) payment_id, status
+            FROM unnest($1::varchar[], $2::varchar[]) AS e(payment_id, status)
+            ORDER BY payment_id, {_status_rank("status")} DESC
+        )
+        UPDATE payments p
+        SET status = events.status, updated_at = NOW()
+        FROM events
+        WHERE p.payment_id = events.payment_id
+        AND {_status_rank("events.status")} > {_status_rank("p.status")}
+        RETURNING p.payment_id, p.user_id, p.plan_key, p.status
+    """,
+    "payment_by_payment_id": f"""
+        SELECT {PAYMENT_COLUMNS} FROM payments WHERE payment_id = $1
+    """,
+    "payments_by_user": f"""
+        SELECT {PAYMENT_COLUMNS} FROM payments 
+        WHERE user_id = $1 
+        ORDER BY created_at DESC 
+        LIMIT $2
+    """,
+    # Ограничение частоты: $2 - токенов в секунду, $3 - емкость корзины
+    "throttle_take": """
+        INSERT INTO throttle_buckets AS b (key, tokens, allowed, updated_at)
+        VALUES ($1, $3::float8 - 1, TRUE, NOW())
+        ON CONFLICT (key) DO UPDATE
+        SET tokens = LEAST(
+                $3::float8,
+                b.tokens + EXTRACT(EPOCH FROM NOW() - b.updated_at) * $2::float8
+            ) - CASE WHEN LEAST(
+                $3::float8,
+                b.tokens + EXTRACT(EPOCH FROM NOW() - b.updated_at) * $2::float8
+            ) >= 1 THEN 1 ELSE 0 END,
+            allowed = LEAST(
+                $3::float8,
+                b.tokens + EXTRACT(EPOCH FROM NOW() - b.updated_at) * $2::float8
+            ) >= 1,
+            updated_at = NOW()
+        RETURNING allowed
+    """,
+    # Инструкции
+    "instructions": """
+        SELECT id, title, text_content, created_at
+        FROM instructions ORDER BY created_at DESC
+    """,
+    # Статистика
+    "statistics": """
+        SELECT 
+            COALESCE(SUM(value) FILTER (WHERE name = 'total_users'), 0)::bigint as total_users,
+            COALESCE(SUM(value) FILTER (WHERE name = 'active_subscriptions'), 0)::bigint as current_subscribers,
+            COALESCE(SUM(value) FILTER (WHERE name = 'total_links'), 0)::bigint as total_links,
+            COALESCE(SUM(value) FILTER (WHERE name = 'total_requests_used'), 0)::bigint as total_requests_used,
+            COALESCE(SUM(value) FILTER (WHERE name = 'total_requests_limit'), 0)::bigint as total_requests_limit
+        FROM stats_counters
+    """,
+    "payments_statistics": """
+        SELECT 
+            COALESCE(SUM(total_payments), 0) as total_payments,
+            COALESCE(SUM(successful_payments), 0) as successful_payments,
+            COALESCE(SUM(pending_payments), 0) as pending_payments,
+            COALESCE(SUM(total_revenue), 0) as total_revenue,
+            COALESCE(SUM(total_revenue) / NULLIF(SUM(successful_payments), 0), 0) as avg_payment
+        FROM payment_daily_stats
+        WHERE day > CURRENT_DATE - $1::int
+    """,
+}
+
+
+class StatementConnection(asyncpg.Connection):
+    """Соединение пула с собственным набором подготовленных запросов"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements: dict[str, asyncpg.prepared_stmt.PreparedStatement] = {}
+        # Время последнего возврата в пул, для проверки живости
+        self.released_at: float | None = None
+
+    def mark_released(self):
+        self.released_at = time.monotonic()
+
+    def idle_time(self) -> float:
+        """Сколько секунд соединение простояло в пуле"""
+        if self.released_at is None:
+            return 0.0
+        return time.monotonic() - self.released_at
+
+
+async def prepare_statements(conn: StatementConnection):
+    """Хук init пула: подготовить все запросы реестра на новом соединении.
+
+    До применения миграций таблиц может не быть - такие запросы
+    подготавливаются позже, при первом использовании.
+    """
+    for name in STATEMENTS:
+        try:
+            await get_statement(conn, name)
+        except asyncpg.PostgresError as e:
+            logger.debug(f"Запрос {name} будет подготовлен позже: {e}")
+
+
+async def get_statement(conn, name: str) -> asyncpg.prepared_stmt.PreparedStatement:
+    """Подготовленный запрос из реестра для данного соединения"""
+    statement = conn.statements.get(name)
+    if statement is None:
+        statement = await conn.prepare(STATEMENTS[name])
+        conn.statements[name] = statement
+    return statement
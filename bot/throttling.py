@@ -0,0 +1,100 @@
+"""Ограничение частоты запросов пользователей (token bucket).
+
+Лимит хендлера задается флагом throttle (имя из Config.THROTTLE_LIMITS),
+по умолчанию действует лимит "default". Проверка выполняется до хендлера,
+то есть до любых запросов к БД. Корзины хранятся в памяти процесса или,
+при нескольких процессах, в PostgreSQL.
+"""
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_TEXT = "⏳ Слишком много запросов. Подождите немного и попробуйте снова."
+
+THROTTLED_TOTAL = metrics.registry.register(
+    metrics.Counter("bot_throttled_total", "Отклоненные по лимиту апдейты", ("limit",))
+)
+
+
+class MemoryBucketStore:
+    """Корзины в памяти процесса (самые старые вытесняются)"""
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        # ключ -> (токены, время последнего обновления)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int) -> bool:
+        """Забрать токен; False - лимит исчерпан"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_size:
+            self._buckets.popitem(last=False)
+        return allowed
+
+
+class PostgresBucketStore:
+    """Корзины в таблице throttle_buckets, общие для всех процессов"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def take(self, key: str, rate: float, burst: int) -> bool:
+        return await self.db.take_throttle_token(key, rate, burst)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, store, limits: dict[str, tuple[float, int]] = Config.THROTTLE_LIMITS):
+        self.store = store
+        self.limits = limits
+        # Кого уже предупредили: повторные отказы не отправляют сообщений
+        self._warned: set[str] = set()
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None or user.id in Config.ADMIN_IDS:
+            return await handler(event, data)
+
+        name = get_flag(data, "throttle", default="default")
+        rate, burst = self.limits.get(name, self.limits["default"])
+        key = f"{name}:{user.id}"
+
+        try:
+            allowed = await self.store.take(key, rate, burst)
+        except Exception as e:
+            # Без хранилища лимитов пропускаем апдейт, а не роняем бота
+            logger.error(f"Ошибка проверки лимита запросов: {e}")
+            allowed = True
+
+        if allowed:
+            self._warned.discard(key)
+            return await handler(event, data)
+
+        THROTTLED_TOTAL.inc(limit=name)
+        text = None
+        if key not in self._warned:
+            if len(self._warned) > 100000:
+                self._warned.clear()
+            self._warned.add(key)
+            text = THROTTLED_TEXT
+
+        if isinstance(event, CallbackQuery):
+            # Без ответа на callback у кнопки крутится индикатор загрузки
+            await event.answer(text)
+        elif text:
+            await event.answer(text)
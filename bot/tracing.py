@@ -0,0 +1,109 @@
+"""Трассировка времени обработки апдейтов.
+
+На время хендлера в contextvar кладется UpdateTrace. Вызовы БД, Telegram
+API и кассы добавляют в него свое время через span(), а апдейты дольше
+SLOW_UPDATE_THRESHOLD логируются одной JSON-строкой с разбивкой по частям.
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Части, на которые раскладывается время апдейта
+DB = "db"
+TELEGRAM = "telegram"
+PAYMENT = "payment"
+
+
+@dataclass
+class UpdateTrace:
+    handler: str
+    event_type: str
+    user_id: int | None
+    started: float = field(default_factory=time.perf_counter)
+    # часть -> [секунды, количество вызовов]
+    spans: dict[str, list] = field(default_factory=dict)
+    # часть, внутри которой мы сейчас находимся (вложенные вызовы не суммируются)
+    active: str | None = None
+
+    def add(self, part: str, seconds: float):
+        span = self.spans.setdefault(part, [0.0, 0])
+        span[0] += seconds
+        span[1] += 1
+
+    def as_dict(self, total: float) -> dict:
+        accounted = sum(seconds for seconds, _ in self.spans.values())
+        return {
+            "handler": self.handler,
+            "event": self.event_type,
+            "user_id": self.user_id,
+            "total_ms": round(total * 1000, 1),
+            "spans": {
+                part: {"ms": round(seconds * 1000, 1), "calls": calls}
+                for part, (seconds, calls) in self.spans.items()
+            },
+            "other_ms": round(max(total - accounted, 0) * 1000, 1),
+        }
+
+
+current_trace: ContextVar[UpdateTrace | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(part: str):
+    """Учесть время блока в текущем апдейте как часть part"""
+    trace = current_trace.get()
+    if trace is None or trace.active is not None:
+        yield
+        return
+
+    trace.active = part
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.active = None
+        trace.add(part, time.perf_counter() - started)
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Замер времени хендлера и лог медленных апдейтов"""
+
+    def __init__(self, slow_threshold: float = Config.SLOW_UPDATE_THRESHOLD):
+        self.slow_threshold = slow_threshold
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        user = data.get("event_from_user")
+        trace = UpdateTrace(
+            handler=handler_object.callback.__name__ if handler_object else "unknown",
+            event_type=type(event).__name__,
+            user_id=user.id if user else None,
+        )
+        token = current_trace.set(trace)
+        try:
+            return await handler(event, data)
+        finally:
+            current_trace.reset(token)
+            total = time.perf_counter() - trace.started
+            if total >= self.slow_threshold:
+                logger.warning(
+                    f"Медленный апдейт: {json.dumps(trace.as_dict(total), ensure_ascii=False)}"
+                )
+
+
+class TelegramTimingMiddleware(BaseRequestMiddleware):
+    """Учет времени запросов к Telegram Bot API в трассе апдейта"""
+
+    async def __call__(self, make_request, bot, method):
+        with span(TELEGRAM):
+            return await make_request(bot, method)
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+
+from background import BackgroundTask
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Статус платежа для каждого события Яндекс Кассы
+EVENT_STATUSES = {
+    "payment.succeeded": "succeeded",
+    "payment.waiting_for_capture": "pending",
+    "payment.canceled": "failed",
+    "payment.refund.succeeded": "refunded",
+}
+
+
+class WebhookQueue(BackgroundTask):
+    """Очередь вебхуков Яндекс Кассы с пакетным применением.
+
+    Событие сначала записывается в таблицу payment_events, и только после
+    этого кассе отвечают 200, поэтому принятые уведомления переживают
+    перезапуск процесса. Фоновая задача раз в flush_interval секунд (или
+    сразу после batch_size новых событий) забирает события пачками и
+    применяет каждую пачку одной транзакцией. Пачки забираются через
+    SKIP LOCKED, так что разбирать таблицу может любой процесс.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = Config.WEBHOOK_BATCH_SIZE,
+        flush_interval: float = Config.WEBHOOK_FLUSH_INTERVAL,
+    ):
+        super().__init__()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Принятые этим процессом события, еще не прошедшие через flush()
+        self._received = 0
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return self._received
+
+    async def put(self, event: str, payment_id: str) -> bool:
+        """Сохранить событие. False - событие неизвестно или уже ждет применения.
+
+        Ошибка записи пробрасывается: касса должна получить не 200 и повторить
+        уведомление.
+        """
+        status = EVENT_STATUSES.get(event)
+        if not status or not payment_id:
+            return False
+        if self._db is None:
+            raise RuntimeError("Очередь вебхуков не запущена")
+
+        if not await self._db.add_payment_event(payment_id, status):
+            return False
+
+        self._received += 1
+        if self._received >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def stop(self):
+        await super().stop()
+        # Применяем то, что успело накопиться; остальное разберут другие процессы
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Применить все сохраненные события, пачками по batch_size"""
+        if self._db is None:
+            return
+
+        self._received = 0
+        while True:
+            try:
+                result = await self._db.process_payment_events(self.batch_size)
+            except Exception as e:
+                # События остались в таблице и будут применены в следующий раз
+                logger.error(f"Ошибка применения пачки вебхуков: {e}")
+                return
+
+            if result["events"]:
+                logger.info(
+                    f"Применено событий платежей: {result['events']}, "
+                    f"обновлено: {result['updated']}, подписок активировано: {result['activated']}"
+                )
+            if result["events"] < self.batch_size:
+                return
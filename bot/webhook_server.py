@@ -0,0 +1,151 @@
+"""HTTP-сервер бота: вебхук Telegram и уведомления Яндекс Кассы.
+
+В режиме BOT_MODE=webhook апдейты Telegram приходят на WEBHOOK_PATH,
+поэтому несколько экземпляров бота могут стоять за балансировщиком.
+Уведомления кассы принимаются на YOOKASSA_WEBHOOK_PATH в обоих режимах.
+"""
+import asyncio
+import ipaddress
+import logging
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import Config
+from payment_handler import YooKassaPayment
+
+logger = logging.getLogger(__name__)
+
+# Адреса, с которых Яндекс Касса отправляет уведомления
+YOOKASSA_NETWORKS = [
+    ipaddress.ip_network(network)
+    for network in (
+        "185.71.76.0/27",
+        "185.71.77.0/27",
+        "77.75.153.0/25",
+        "77.75.156.11/32",
+        "77.75.156.35/32",
+        "77.75.154.128/25",
+        "2a02:5180::/32",
+    )
+]
+
+
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(network, strict=False)
+    for network in Config.YOOKASSA_TRUSTED_PROXIES
+]
+
+
+class UpdateConcurrencyMiddleware(BaseMiddleware):
+    """Ограничение числа апдейтов, обрабатываемых одновременно"""
+
+    def __init__(self, limit: int = Config.UPDATE_CONCURRENCY):
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(self, handler, event, data):
+        async with self._semaphore:
+            return await handler(event, data)
+
+
+def _in_networks(address: str | None, networks) -> bool:
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def _client_address(request: web.Request) -> str | None:
+    """Адрес отправителя с учетом доверенных балансировщиков.
+
+    X-Forwarded-For учитывается, только если запрос пришел от доверенного
+    прокси; адреса в заголовке разбираются справа налево до первого
+    недоверенного - левее него значения мог подставить сам клиент.
+    """
+    remote = request.remote
+    if not _in_networks(remote, TRUSTED_PROXIES):
+        return remote
+    forwarded = request.headers.getall("X-Forwarded-For", [])
+    hops = [hop.strip() for value in forwarded for hop in value.split(",")]
+    for hop in reversed(hops):
+        if not _in_networks(hop, TRUSTED_PROXIES):
+            return hop
+    return remote
+
+
+def _is_yookassa_address(address: str | None) -> bool:
+    return _in_networks(address, YOOKASSA_NETWORKS)
+
+
+async def yookassa_webhook(request: web.Request) -> web.Response:
+    """Уведомление Яндекс Кассы: событие ставится в очередь вебхуков"""
+    if Config.YOOKASSA_WEBHOOK_CHECK_IP:
+        address = _client_address(request)
+        if not _is_yookassa_address(address):
+            logger.warning(f"Уведомление кассы с чужого адреса: {address}")
+            return web.json_response({"success": False}, status=403)
+
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.json_response({"success": False, "error": "Invalid JSON"}, status=400)
+
+    result = await YooKassaPayment.handle_webhook(data)
+    # На неизвестные события тоже отвечаем 200, иначе касса будет их повторять
+    status = 200 if result["success"] or result.get("error") == "Unknown event" else 500
+    return web.json_response(result, status=status)
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok"})
+
+
+def build_app(bot: Bot | None = None, dp: Dispatcher | None = None) -> web.Application:
+    """Приложение aiohttp; без bot и dp - только уведомления кассы"""
+    app = web.Application()
+    app.router.add_get("/health", health)
+    app.router.add_post(Config.YOOKASSA_WEBHOOK_PATH, yookassa_webhook)
+
+    if bot is not None and dp is not None:
+        SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            secret_token=Config.WEBHOOK_SECRET or None,
+            handle_in_background=Config.WEBHOOK_HANDLE_IN_BACKGROUND,
+        ).register(app, path=Config.WEBHOOK_PATH)
+        setup_application(app, dp, bot=bot)
+    return app
+
+
+async def start_server(app: web.Application) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    # Несколько процессов слушают один порт, ядро распределяет соединения
+    await web.TCPSite(
+        runner,
+        Config.WEBHOOK_HOST,
+        Config.WEBHOOK_PORT,
+        reuse_port=Config.BOT_WORKERS > 1,
+    ).start()
+    logger.info(f"🌐 HTTP-сервер слушает {Config.WEBHOOK_HOST}:{Config.WEBHOOK_PORT}")
+    return runner
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, stopping: asyncio.Event):
+    """Принимать апдейты через вебхук, пока не установлен stopping"""
+    runner = await start_server(build_app(bot, dp))
+    try:
+        await bot.set_webhook(
+            url=f"{Config.WEBHOOK_BASE_URL.rstrip('/')}{Config.WEBHOOK_PATH}",
+            secret_token=Config.WEBHOOK_SECRET or None,
+            max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info("✅ Вебхук Telegram установлен")
+        # Вебхук не удаляем при остановке: его продолжают обслуживать другие экземпляры
+        await stopping.wait()
+        logger.info("Остановка HTTP-сервера")
+    finally:
+        await runner.cleanup()
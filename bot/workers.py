@@ -0,0 +1,126 @@
+"""Работа бота в несколько процессов.
+
+Процессы принимают апдейты через общий вебхук (SO_REUSEPORT на одном хосте
+или балансировщик между хостами). Лимит запросов защищен блокировкой строки
+подписки в БД, апдейты одного пользователя внутри процесса выполняются по
+очереди, а фоновые задачи запускает только процесс-лидер, выбранный через
+advisory-блокировку PostgreSQL.
+"""
+import asyncio
+import logging
+import multiprocessing
+import signal
+from typing import Awaitable, Callable
+
+import asyncpg
+from aiogram import BaseMiddleware
+
+from background import BackgroundTask
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки лидера (отличается от ключа миграций)
+LEADER_LOCK_KEY = 7410002
+
+
+class UserLockMiddleware(BaseMiddleware):
+    """Последовательная обработка апдейтов одного пользователя"""
+
+    def __init__(self):
+        # user_id -> [блокировка, число ожидающих апдейтов]
+        self._locks: dict[int, list] = {}
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        entry = self._locks.setdefault(user.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await handler(event, data)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user.id]
+
+
+class LeaderElection(BackgroundTask):
+    """Выбор одного процесса для фоновых задач.
+
+    Лидер держит сессионную advisory-блокировку на отдельном соединении.
+    Если соединение рвется, блокировка снимается сервером и ее забирает
+    другой процесс.
+    """
+
+    def __init__(
+        self,
+        on_elected: Callable[[], Awaitable],
+        on_lost: Callable[[], Awaitable],
+        key: int = LEADER_LOCK_KEY,
+        interval: float = Config.LEADER_CHECK_INTERVAL,
+    ):
+        super().__init__()
+        self.on_elected = on_elected
+        self.on_lost = on_lost
+        self.key = key
+        self.interval = interval
+        self.is_leader = False
+        self._conn: asyncpg.Connection | None = None
+
+    async def stop(self):
+        await super().stop()
+        await self._resign()
+
+    async def _run(self):
+        while True:
+            try:
+                if self._conn is None or self._conn.is_closed():
+                    self._conn = await self._db.connect()
+
+                if self.is_leader:
+                    # Проверяем, что соединение (а с ним и блокировка) живо
+                    await self._conn.execute("SELECT 1", timeout=self.interval)
+                elif await self._conn.fetchval(
+                    "SELECT pg_try_advisory_lock($1)", self.key
+                ):
+                    self.is_leader = True
+                    logger.info("👑 Процесс выбран лидером для фоновых задач")
+                    await self.on_elected()
+            except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+                logger.warning(f"Потеряно соединение выбора лидера: {e}")
+                await self._resign()
+            await asyncio.sleep(self.interval)
+
+    async def _resign(self):
+        if self.is_leader:
+            self.is_leader = False
+            logger.info("Процесс больше не лидер")
+            await self.on_lost()
+        if self._conn is not None:
+            self._conn.terminate()
+            self._conn = None
+
+
+def run_processes(count: int, target: Callable[[int], None]):
+    """Запустить count процессов target(index) и дождаться их завершения"""
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=target, args=(index,), name=f"bot-worker-{index}")
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"🚀 Запущено процессов бота: {count}")
+
+    def terminate(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    for process in processes:
+        process.join()
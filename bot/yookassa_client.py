@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from typing import Any
+
+import aiohttp
+
+import metrics
+import tracing
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class YooKassaError(Exception):
+    """Ошибка обращения к API Яндекс Кассы"""
+
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
+
+
+class YooKassaClient:
+    """Асинхронный клиент REST API Яндекс Кассы.
+
+    Одна aiohttp-сессия на процесс: соединения переиспользуются, число
+    одновременных запросов ограничено пулом коннектора, а каждый запрос -
+    таймаутом, поэтому медленный ответ кассы не блокирует event loop.
+    """
+
+    def __init__(
+        self,
+        shop_id: str = Config.YOOKASSA_SHOP_ID,
+        secret_key: str = Config.YOOKASSA_SECRET_KEY,
+        base_url: str = Config.YOOKASSA_API_URL,
+        timeout: float = Config.YOOKASSA_TIMEOUT,
+        max_connections: int = Config.YOOKASSA_MAX_CONNECTIONS,
+        retries: int = Config.YOOKASSA_RETRIES,
+        retry_delay: float = 0.5,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._auth = aiohttp.BasicAuth(shop_id, secret_key)
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._max_connections = max_connections
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                auth=self._auth,
+                timeout=self._timeout,
+                connector=aiohttp.TCPConnector(limit=self._max_connections),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        json: dict | None = None,
+        idempotence_key: str | None = None,
+    ) -> dict[str, Any]:
+        headers = {"Idempotence-Key": idempotence_key} if idempotence_key else None
+        url = f"{self.base_url}{path}"
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._get_session().request(
+                    method, url, json=json, headers=headers
+                ) as response:
+                    try:
+                        data = await response.json(content_type=None)
+                    except ValueError:
+                        # HTML или пустое тело, например страница ошибки прокси
+                        data = None
+                    if not isinstance(data, dict):
+                        data = None
+                    # 5xx и 429 повторяем, остальные ошибки возвращаем сразу
+                    if response.status < 400 and data is not None:
+                        return data
+                    error = YooKassaError(
+                        (data or {}).get("description") or f"HTTP {response.status}",
+                        response.status,
+                    )
+                    if response.status != 429 and response.status < 500:
+                        raise error
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = YooKassaError(f"Ошибка соединения с кассой: {e!r}")
+
+            if attempt < self.retries:
+                delay = self.retry_delay * 2**attempt
+                logger.warning(f"{error}, повтор через {delay} с")
+                await asyncio.sleep(delay)
+
+        raise error
+
+    @metrics.timed(metrics.YOOKASSA_SECONDS, tracing.PAYMENT)
+    async def create_payment(
+        self, payment_data: dict, idempotence_key: str
+    ) -> dict[str, Any]:
+        """Создать платеж (повторы безопасны благодаря Idempotence-Key)"""
+        return await self._request(
+            "POST", "/payments", json=payment_data, idempotence_key=idempotence_key
+        )
+
+    @metrics.timed(metrics.YOOKASSA_SECONDS, tracing.PAYMENT)
+    async def get_payment(self, payment_id: str) -> dict[str, Any]:
+        """Получить платеж по ID"""
+        return await self._request("GET", f"/payments/{payment_id}")
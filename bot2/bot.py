@@ -6,6 +6,7 @@ from aiogram import Bot, Dispatcher, F
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 from .users import get_or_create_user
+from .plans import catalog
 
 
 bot: Bot
@@ -27,7 +28,7 @@ async def start_polling(conf: Config):
 async def cmd_start(message: Message):
     if not message.from_user:
         return
-    user = get_or_create_user(message.from_user.id, message.from_user.username or "", message.from_user.full_name)
+    user = await get_or_create_user(message.from_user.id, message.from_user.username or "", message.from_user.full_name)
     if not user:
         await message.answer("Что-то пошло не так")
     
@@ -58,19 +59,14 @@ def __welcome_text(username: str): return f"""
 
 @dispatcher.message(F.text == "💎 Купить подписку")
 async def buy_subscription(message: Message):
-    from .database_engine import new_session
-    from sqlalchemy import select
-    from .models import TariffPlan
-
     text = """💎 <b>Выберите тарифный план:</b>"""
 
-    with new_session() as session:
-        statement = select(TariffPlan).where(TariffPlan.is_active)
-        plans = session.scalars(statement)
-        for tariff in plans:
-            text += f"""• <b>{tariff.name}</b> - {tariff.price}
+    # Тарифы из снимка в памяти, без запроса к БД
+    plans = catalog.plans
+    for tariff in plans:
+        text += f"""• <b>{tariff.name}</b> - {tariff.price}
     {tariff.description}"""
-            
+
     text += "\n\nВыберите подходящий план:"
 
-    await message.answer(text, reply_markup=get_subscription_plans(list(plans)))
+    await message.answer(text, reply_markup=get_subscription_plans(plans))
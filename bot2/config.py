@@ -23,6 +23,9 @@ class Config:
     DB_NAME = os.getenv("DB_NAME", "avito_bot")
     DB_USER = os.getenv("DB_USER", "postgres")
     DB_PASSWORD = os.getenv("DB_PASSWORD", "")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
 
     # YooKassa
     YOOKASSA_SHOP_ID = os.getenv("YOOKASSA_SHOP_ID", "")
@@ -48,9 +51,7 @@ class Config:
         if not self.DB_PASSWORD:
             raise ValueError("DB_PASSWORD не установлен")
     def get_postgres_url(self):
-        url =f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
-        print("DATABASE_URL", url)
-        return url
+        return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
     # VAT codes explanation:
     # 1 = НДС 20%
@@ -1,27 +1,49 @@
-from sqlalchemy import create_engine, Engine, MetaData
-from sqlalchemy.orm import Session, declarative_base, DeclarativeBase
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from .config import Config
 from .logger import get_logger
 
-engine: Engine
-log = get_logger
+engine: AsyncEngine | None = None
+session_factory: async_sessionmaker[AsyncSession] | None = None
+log = get_logger(__name__)
 
 
-def create(conf: Config):
-    global engine
-    engine = create_engine(conf.get_postgres_url(), echo=True)
-    migrate()
+async def create(conf: Config):
+    global engine, session_factory
+    engine = create_async_engine(
+        conf.get_postgres_url(),
+        pool_size=conf.DB_POOL_SIZE,
+        max_overflow=conf.DB_MAX_OVERFLOW,
+        pool_timeout=conf.DB_POOL_TIMEOUT,
+        # Соединения, закрытые сервером, отбрасываются до выдачи сессии
+        pool_pre_ping=True,
+    )
+    # Объекты остаются доступными после commit: ленивая подгрузка
+    # атрибутов вне сессии в асинхронном режиме невозможна
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    await migrate()
     return engine
 
 
-def new_session():
-    if not Engine:
+def new_session() -> AsyncSession:
+    if session_factory is None:
         raise Exception("database engine is not initialized")
-    session = Session(engine)
-    return session
+    return session_factory()
 
 
-def migrate():
-    from .models import User, TariffPlan
-    metadata :MetaData= declarative_base().metadata
-    metadata.create_all(engine, tables=[User.__table__, TariffPlan.__table__])
+async def migrate():
+    from .models import Base, User, TariffPlan
+
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all, tables=[User.__table__, TariffPlan.__table__]
+        )
+
+
+async def dispose():
+    if engine is not None:
+        await engine.dispose()
@@ -1,7 +1,13 @@
+from functools import cache, lru_cache
+
 from aiogram.types import KeyboardButton, InlineKeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
 
+# Разметка не меняется между вызовами, поэтому собирается один раз.
+# Возвращаемые клавиатуры общие: изменять их нельзя.
+
 
+@cache
 def get_main_menu():
     builder = ReplyKeyboardBuilder()
     builder.row(
@@ -16,15 +22,24 @@ def get_main_menu():
 
 from .models import TariffPlan
 def get_subscription_plans(plans: list[TariffPlan]):
+    # Кэш по содержимому тарифов: изменение тарифа дает новую клавиатуру
+    return _subscription_plans_markup(
+        tuple((plan.id, plan.name, plan.price) for plan in plans)
+    )
+
+
+@lru_cache(maxsize=32)
+def _subscription_plans_markup(plans: tuple[tuple[int, str, float], ...]):
     builder = InlineKeyboardBuilder()
-    for plan in plans:
+    for plan_id, name, price in plans:
         builder.add(
-            InlineKeyboardButton(text=f"{plan.name} - {plan.price}", callback_data="sub_"+str(plan.id)),
+            InlineKeyboardButton(text=f"{name} - {price}", callback_data="sub_"+str(plan_id)),
         )
     builder.adjust(1)
     return builder.as_markup()
 
 
+@cache
 def get_admin_keyboard():
     builder = ReplyKeyboardBuilder()
     builder.row(KeyboardButton(text="👥 Пользователи"))
@@ -34,12 +49,14 @@ def get_admin_keyboard():
     return builder.as_markup(resize_keyboard=True)
 
 
+@cache
 def get_back_to_menu():
     builder = ReplyKeyboardBuilder()
     builder.row(KeyboardButton(text="🔙 Главное меню"))
     return builder.as_markup(resize_keyboard=True)
 
 
+@cache
 def get_payment_methods():
     builder = InlineKeyboardBuilder()
     builder.add(
@@ -1,17 +1,23 @@
 async def main():
     from .config import Config
     from .logger import setup as logger_setup, get_logger
-    from .database_engine import create
+    from .database_engine import create, dispose
     from .bot import start_polling
+    from .plans import catalog
 
     conf = Config()
 
     logger_setup(conf)
     log = get_logger(__name__)
 
-    create(conf)
+    await create(conf)
+    await catalog.start(conf)
 
-    await start_polling(conf)
+    try:
+        await start_polling(conf)
+    finally:
+        await catalog.stop()
+        await dispose()
 
 if __name__ == "__main__":
     import asyncio
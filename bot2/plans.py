@@ -0,0 +1,101 @@
+import asyncio
+
+import asyncpg
+from sqlalchemy import select
+
+from .config import Config
+from .database_engine import new_session
+from .logger import get_logger
+from .models import TariffPlan
+
+log = get_logger(__name__)
+
+# Канал триггера tariff_plans_changed (создает миграция 9 бота)
+PLANS_CHANNEL = "tariff_plans_changed"
+# Как часто проверять соединение LISTEN (секунды)
+CHECK_INTERVAL = 30
+
+
+class PlanCatalog:
+    """Снимок активных тарифов в памяти.
+
+    Хендлеры читают тарифы из снимка без запроса к БД. Снимок
+    перечитывается по NOTIFY от триггера бота и после каждого
+    переподключения LISTEN. Без триггера (бот ни разу не мигрировал
+    базу) тарифы обновляются только при переподключении.
+    """
+
+    def __init__(self, interval: float = CHECK_INTERVAL):
+        self.interval = interval
+        self._plans: tuple[TariffPlan, ...] = ()
+        self._conn: asyncpg.Connection | None = None
+        self._task: asyncio.Task | None = None
+        self._reloads: set[asyncio.Task] = set()
+        self._conf: Config | None = None
+
+    @property
+    def plans(self) -> tuple[TariffPlan, ...]:
+        return self._plans
+
+    async def load(self):
+        statement = (
+            select(TariffPlan)
+            .where(TariffPlan.is_active)
+            .order_by(TariffPlan.price, TariffPlan.id)
+        )
+        async with new_session() as session:
+            self._plans = tuple((await session.scalars(statement)).all())
+        log.info("Loaded %d tariff plans", len(self._plans))
+
+    async def start(self, conf: Config):
+        self._conf = conf
+        await self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            self._conn.terminate()
+            self._conn = None
+
+    async def _run(self):
+        while True:
+            try:
+                if self._conn is None or self._conn.is_closed():
+                    self._conn = await asyncpg.connect(
+                        user=self._conf.DB_USER,
+                        password=self._conf.DB_PASSWORD,
+                        database=self._conf.DB_NAME,
+                        host=self._conf.DB_HOST,
+                        port=self._conf.DB_PORT,
+                    )
+                    await self._conn.add_listener(PLANS_CHANNEL, self._on_notify)
+                    await self.load()
+                else:
+                    await self._conn.execute("SELECT 1", timeout=self.interval)
+            except Exception as e:
+                log.warning("Tariff plans listener failed. Error: %s", e)
+                if self._conn is not None:
+                    self._conn.terminate()
+                    self._conn = None
+            await asyncio.sleep(self.interval)
+
+    def _on_notify(self, conn, pid, channel, payload):
+        task = asyncio.create_task(self._reload())
+        self._reloads.add(task)
+        task.add_done_callback(self._reloads.discard)
+
+    async def _reload(self):
+        try:
+            await self.load()
+        except Exception as e:
+            log.error("Failed reload tariff plans. Error: %s", e)
+
+
+catalog = PlanCatalog()
@@ -1,5 +1,6 @@
 from .models import User
-from sqlalchemy import select
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.postgresql import insert
 from .database_engine import new_session
 from .logger import get_logger
 
@@ -7,39 +8,36 @@ from .logger import get_logger
 log = get_logger(__name__)
 
 
-def get_user_by_telegram_id(telegram_id: int) -> User | None:
-
-    with new_session() as session:
-        statement = select(User).where(User.telegram_id == telegram_id)
-        user = session.scalar(statement)
-        if not User:
-            log.error("No such user with telegram id %d", telegram_id)
-            return None
-        return user
-
-
-def create_user(telegram_id: int, username: str, full_name: str) -> User | None:
-    user = User()
-    user.username = username
-    user.telegram_id = telegram_id
-    user.full_name = full_name
-    with new_session() as session:
+async def get_or_create_user(telegram_id: int, username: str, full_name: str) -> User:
+    # Одновременные создания одного пользователя сходятся на уникальном
+    # telegram_id. Строка переписывается только при изменении имени, иначе
+    # RETURNING пуст и существующий пользователь читается отдельно.
+    statement = insert(User).values(
+        telegram_id=telegram_id, username=username, full_name=full_name
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={
+            "username": statement.excluded.username,
+            "full_name": statement.excluded.full_name,
+        },
+        where=or_(
+            User.username.is_distinct_from(statement.excluded.username),
+            User.full_name.is_distinct_from(statement.excluded.full_name),
+        ),
+    ).returning(User)
+
+    async with new_session() as session:
         try:
-            session.add(user)
-            session.commit()
+            user = await session.scalar(
+                statement, execution_options={"populate_existing": True}
+            )
+            if user is None:
+                user = await session.scalar(
+                    select(User).where(User.telegram_id == telegram_id)
+                )
+            await session.commit()
         except Exception as e:
-            log.error("Failed create user. Error: %s", e)
-            return None
-
+            log.error("Failed get or create user. Error: %s", e)
+            raise
     return user
-
-
-def get_or_create_user(telegram_id: int, username: str, full_name: str) -> User:
-    usr = get_user_by_telegram_id(telegram_id)
-    if not usr:
-        new_user = create_user(telegram_id=telegram_id, username=username, full_name=full_name)
-        if not new_user:
-            raise Exception("failed create new user", telegram_id, username)
-        return new_user
-    else:
-        return usr
@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули бота и админ-панели импортируются по плоским именам, как при запуске
+sys.path[:0] = [
+    os.path.join(ROOT, "bot"),
+    os.path.join(ROOT, "admin-panel"),
+    os.path.dirname(os.path.abspath(__file__)),
+]
+
+# Config читает окружение при импорте
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("DB_PASSWORD", "test")
+
+
+class FakeClock:
+    """Управляемая замена time.monotonic"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Только для синхронного кода: event loop тоже использует time.monotonic
+    fake = FakeClock()
+    monkeypatch.setattr(time, "monotonic", fake)
+    return fake
@@ -0,0 +1,27 @@
+import asyncio
+import json
+from decimal import Decimal
+
+import api
+
+
+def test_stats_payload_is_json_serializable(monkeypatch):
+    # asyncpg отдает SUM(bigint) как numeric -> Decimal
+    async def fetch_one(query, *args):
+        return {
+            "total_users": Decimal("12"),
+            "active_subs": Decimal("5"),
+            "today_count": 3,
+            "today_total": Decimal("1500.00"),
+        }
+
+    monkeypatch.setattr(api, "fetch_one", fetch_one)
+    payload, status = asyncio.run(api.stats())
+
+    assert status == 200
+    assert json.loads(json.dumps(payload))["stats"] == {
+        "total_users": 12,
+        "active_subs": 5,
+        "today_payments_count": 3,
+        "today_payments_amount": 1500.0,
+    }
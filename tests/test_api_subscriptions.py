@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime
+
+import api
+
+SUB = {
+    "user_id": 1,
+    "telegram_id": 100,
+    "username": "user",
+    "full_name": "User",
+    "start_date": datetime(2024, 1, 1),
+    "is_active": True,
+    "request_limit": 5,
+    "used_requests": 0,
+    "created_at": datetime(2024, 1, 1),
+}
+
+
+def test_pages_through_subscriptions_without_end_date(monkeypatch):
+    queries = []
+
+    async def fetch_query(query, *args):
+        queries.append((query, args))
+        return [
+            dict(SUB, id=3, end_date=None),
+            dict(SUB, id=2, end_date=None),
+        ]
+
+    monkeypatch.setattr(api, "fetch_query", fetch_query)
+    payload, status = asyncio.run(api.subscriptions("all", limit=1))
+
+    assert status == 200
+    assert payload["subscriptions"][0]["end_date"] is None
+    assert api.decode_cursor(payload["next_cursor"]) == (None, 3)
+
+    asyncio.run(api.subscriptions("all", limit=1, cursor=payload["next_cursor"]))
+    query, args = queries[-1]
+    assert "s.end_date IS NOT NULL OR s.id < $1" in query
+    assert args == (3, 2)
+
+
+def test_dated_cursor_compares_end_date_and_id(monkeypatch):
+    queries = []
+
+    async def fetch_query(query, *args):
+        queries.append((query, args))
+        return []
+
+    monkeypatch.setattr(api, "fetch_query", fetch_query)
+    moment = datetime(2024, 6, 1)
+    payload, status = asyncio.run(
+        api.subscriptions("active", cursor=api.encode_cursor(moment, 7))
+    )
+
+    assert status == 200
+    query, args = queries[0]
+    assert "(s.end_date, s.id) < ($1, $2)" in query
+    assert "NULLS FIRST" in query
+    assert args == (moment, 7, 51)
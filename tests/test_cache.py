@@ -0,0 +1,48 @@
+from cache import UserCache
+
+USER = {"id": 1, "telegram_id": 100, "username": "user", "full_name": "User"}
+
+
+def test_get_returns_copy(clock):
+    cache = UserCache()
+    cache.set(100, USER)
+    user = cache.get(100)
+    user["username"] = "changed"
+    assert cache.get(100) == USER
+
+
+def test_missing_user():
+    assert UserCache().get(100) is None
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = UserCache(ttl=60)
+    cache.set(100, USER)
+    clock.advance(59)
+    assert cache.get(100) == USER
+    clock.advance(2)
+    assert cache.get(100) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = UserCache(max_size=2)
+    cache.set(1, USER)
+    cache.set(2, USER)
+    cache.get(1)
+    cache.set(3, USER)
+    assert cache.get(2) is None
+    assert cache.get(1) == USER
+    assert cache.get(3) == USER
+
+
+def test_invalidate_and_clear(clock):
+    cache = UserCache()
+    cache.set(1, USER)
+    cache.set(2, USER)
+    cache.invalidate(1)
+    cache.invalidate(3)
+    assert cache.get(1) is None
+    assert len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+import pytest
+
+from api import InvalidCursor, decode_cursor, encode_cursor
+
+
+def test_round_trip():
+    moment = datetime(2024, 5, 17, 12, 30, 15, 123456)
+    cursor = encode_cursor(moment, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (moment, 42)
+
+
+def test_round_trip_without_moment():
+    assert decode_cursor(encode_cursor(None, 7)) == (None, 7)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(None, 1)[:-2] + "!!"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
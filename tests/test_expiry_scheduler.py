@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from config import Config
+from expiry_scheduler import ExpiryScheduler
+
+
+class FakeDb:
+    def __init__(self, seconds=(), on_query=None):
+        self.seconds = list(seconds)
+        self.on_query = on_query
+
+    async def get_upcoming_expirations(self, horizon, limit):
+        if self.on_query:
+            self.on_query()
+        return self.seconds[:limit]
+
+
+def test_notified_end_dates_within_horizon_are_scheduled():
+    async def main():
+        scheduler = ExpiryScheduler(send_queue=None, horizon=100)
+        scheduler._on_notify("30.5")
+        scheduler._on_notify("-3")
+        scheduler._on_notify("500")
+        scheduler._on_notify("garbage")
+        now = asyncio.get_running_loop().time()
+        assert len(scheduler) == 2
+        assert scheduler._heap[0] <= now
+        assert scheduler._wakeup.is_set()
+
+    asyncio.run(main())
+
+
+def test_notifications_during_refill_are_kept():
+    async def main():
+        scheduler = ExpiryScheduler(send_queue=None, horizon=100)
+        scheduler._db = FakeDb([10, 20], on_query=lambda: scheduler._on_notify("5"))
+        await scheduler._refill(1000.0)
+        assert len(scheduler) == 3
+        assert scheduler._pushed is None
+
+    asyncio.run(main())
+
+
+def test_full_heap_is_refilled_after_last_loaded_end_date(monkeypatch):
+    monkeypatch.setattr(Config, "EXPIRY_HEAP_SIZE", 2)
+
+    async def main():
+        scheduler = ExpiryScheduler(send_queue=None, horizon=100)
+        scheduler._db = FakeDb([10, 20, 30])
+        assert await scheduler._refill(1000.0) == pytest.approx(1020.0)
+        scheduler._db = FakeDb([10])
+        assert await scheduler._refill(1000.0) == pytest.approx(1050.0)
+
+    asyncio.run(main())
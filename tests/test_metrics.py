@@ -0,0 +1,62 @@
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_with_labels():
+    counter = Counter("requests_total", "Requests", ("handler", "status"))
+    counter.inc(handler="start", status="ok")
+    counter.inc(2, handler="start", status="ok")
+    counter.inc(handler="buy", status="error")
+    assert counter.render() == [
+        'requests_total{handler="start",status="ok"} 3',
+        'requests_total{handler="buy",status="error"} 1',
+    ]
+
+
+def test_label_values_are_escaped():
+    counter = Counter("events_total", "Events", ("name",))
+    counter.inc(name='a "b"\\c\nd')
+    assert counter.render() == ['events_total{name="a \\"b\\"\\\\c\\nd"} 1']
+
+
+def test_gauge_set_and_function():
+    gauge = Gauge("in_progress", "In progress")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert gauge.render() == ["in_progress 1"]
+
+    backlog = Gauge("backlog", "Backlog", function=lambda: 7)
+    assert backlog.render() == ["backlog 7.0"]
+
+
+def test_failing_gauge_function_is_skipped():
+    gauge = Gauge("broken", "Broken", function=lambda: 1 / 0)
+    assert gauge.render() == []
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(
+        "duration_seconds", "Duration", ("method",), buckets=(0.1, 1)
+    )
+    histogram.observe(0.05, method="get")
+    histogram.observe(0.5, method="get")
+    histogram.observe(3, method="get")
+    assert histogram.render() == [
+        'duration_seconds_bucket{method="get",le="0.1"} 1',
+        'duration_seconds_bucket{method="get",le="1"} 2',
+        'duration_seconds_bucket{method="get",le="+Inf"} 3',
+        'duration_seconds_sum{method="get"} 3.55',
+        'duration_seconds_count{method="get"} 3',
+    ]
+
+
+def test_registry_renders_only_metrics_with_samples():
+    registry = Registry()
+    registry.register(Counter("empty_total", "Nothing yet"))
+    counter = registry.register(Counter("hits_total", "Hits"))
+    counter.inc()
+    assert registry.render() == (
+        "# HELP hits_total Hits\n"
+        "# TYPE hits_total counter\n"
+        "hits_total 1\n"
+    )
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import GetMe, SendMessage
+
+from send_queue import RateLimiter, SendQueue, SendRateLimitMiddleware
+
+
+def test_burst_is_free_then_spaced_by_rate(clock):
+    limiter = RateLimiter(rate=10, burst=2)
+    assert limiter.delay() == 0
+    assert limiter.delay() == 0
+    assert limiter.delay() == pytest.approx(0.1)
+    assert limiter.delay() == pytest.approx(0.2)
+
+
+def test_tokens_refill_over_time(clock):
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.delay()
+    clock.advance(1)
+    assert limiter.delay() == 0
+
+
+def test_pause_delays_next_token(clock):
+    limiter = RateLimiter(rate=100, burst=5)
+    limiter.pause(3)
+    assert limiter.delay() == pytest.approx(3)
+    clock.advance(3)
+    assert limiter.delay() == 0
+
+
+def test_shorter_pause_does_not_shorten_longer_one(clock):
+    limiter = RateLimiter(rate=100, burst=5)
+    limiter.pause(5)
+    limiter.pause(1)
+    assert limiter.delay() == pytest.approx(5)
+
+
+def flood_wait_once(retry_after: float):
+    """make_request, который на первый вызов отвечает RetryAfter"""
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(method)
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method, "Flood control", retry_after)
+        return "ok"
+
+    return make_request, calls
+
+
+def test_chat_flood_wait_pauses_only_that_chat():
+    async def main():
+        middleware = SendRateLimitMiddleware(
+            global_rate=100, chat_rate=100, chat_burst=5
+        )
+        make_request, calls = flood_wait_once(0.05)
+        method = SendMessage(chat_id=1, text="hi")
+        assert await middleware(make_request, None, method) == "ok"
+        assert len(calls) == 2
+        assert middleware.global_limiter.delay() == 0
+        assert middleware._chat_limiter(2).delay() == 0
+
+    asyncio.run(main())
+
+
+def test_request_without_chat_pauses_globally():
+    async def main():
+        middleware = SendRateLimitMiddleware(global_rate=100)
+        make_request, calls = flood_wait_once(0.2)
+        started = asyncio.get_running_loop().time()
+        assert await middleware(make_request, None, GetMe()) == "ok"
+        assert asyncio.get_running_loop().time() - started >= 0.2
+        assert len(calls) == 2
+
+    asyncio.run(main())
+
+
+def test_retry_after_is_raised_when_retries_run_out():
+    async def main():
+        middleware = SendRateLimitMiddleware(max_retries=0)
+        make_request, _ = flood_wait_once(0.05)
+        with pytest.raises(TelegramRetryAfter):
+            await middleware(make_request, None, SendMessage(chat_id=1, text="hi"))
+
+    asyncio.run(main())
+
+
+class FakeBot:
+    def __init__(self, blocked=()):
+        self.blocked = set(blocked)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.blocked:
+            method = SendMessage(chat_id=chat_id, text=text)
+            raise TelegramForbiddenError(method, "bot was blocked by the user")
+        self.sent.append(chat_id)
+
+
+def test_on_sent_is_called_only_after_delivery():
+    async def main():
+        bot = FakeBot(blocked={2})
+        queue = SendQueue(bot, rate=1000)
+        delivered = []
+
+        async def on_sent(chat_id):
+            delivered.append(chat_id)
+
+        for chat_id in (1, 2, 3):
+            queue.send(chat_id, "hi", on_sent=lambda chat_id=chat_id: on_sent(chat_id))
+        await queue.start()
+        while len(queue) or queue.sent_total + queue.failed_total < 3:
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+        assert bot.sent == [1, 3]
+        assert delivered == [1, 3]
+        assert queue.failed_total == 1
+
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, call
+
+from aiogram.types import CallbackQuery, Message
+
+from throttling import THROTTLED_TEXT, MemoryBucketStore, ThrottlingMiddleware
+
+
+def take(store, key, rate=1.0, burst=3):
+    return asyncio.run(store.take(key, rate, burst))
+
+
+def test_burst_then_limited(clock):
+    store = MemoryBucketStore()
+    assert [take(store, "a") for _ in range(4)] == [True, True, True, False]
+
+
+def test_tokens_refill_at_rate(clock):
+    store = MemoryBucketStore()
+    for _ in range(3):
+        take(store, "a", rate=2)
+    assert not take(store, "a", rate=2)
+    clock.advance(0.5)
+    assert take(store, "a", rate=2)
+    assert not take(store, "a", rate=2)
+
+
+def test_refill_is_capped_by_burst(clock):
+    store = MemoryBucketStore()
+    take(store, "a")
+    clock.advance(3600)
+    assert [take(store, "a") for _ in range(4)] == [True, True, True, False]
+
+
+def test_keys_are_independent(clock):
+    store = MemoryBucketStore()
+    for _ in range(3):
+        take(store, "a")
+    assert not take(store, "a")
+    assert take(store, "b")
+
+
+def test_oldest_bucket_is_evicted(clock):
+    store = MemoryBucketStore(max_size=2)
+    for _ in range(3):
+        take(store, "a")
+    take(store, "b")
+    take(store, "c")
+    # Корзина "a" вытеснена и начинается заново, полной
+    assert take(store, "a")
+
+
+def throttled_event(spec):
+    event = AsyncMock(spec=spec)
+    event.from_user = SimpleNamespace(id=1)
+    event.answer = AsyncMock()
+    return event
+
+
+def throttle(event):
+    """Трижды прогнать event через ThrottlingMiddleware с лимитом в один запрос"""
+    middleware = ThrottlingMiddleware(MemoryBucketStore(), {"default": (0.001, 1)})
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event)
+
+    async def main():
+        for _ in range(3):
+            await middleware(handler, event, {"event_from_user": event.from_user})
+
+    asyncio.run(main())
+    return handled
+
+
+def test_throttled_message_is_warned_once():
+    message = throttled_event(Message)
+    assert len(throttle(message)) == 1
+    message.answer.assert_awaited_once_with(THROTTLED_TEXT)
+
+
+def test_throttled_callback_is_always_answered():
+    callback = throttled_event(CallbackQuery)
+    assert len(throttle(callback)) == 1
+    assert callback.answer.await_args_list == [call(THROTTLED_TEXT), call(None)]
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from webhook_queue import WebhookQueue
+
+
+class FakeDatabase:
+    """payment_events в памяти"""
+
+    def __init__(self):
+        self.events: dict[tuple[str, str], None] = {}
+        self.applied: list[list[tuple[str, str]]] = []
+        self.fail = False
+
+    async def add_payment_event(self, payment_id, status):
+        if (payment_id, status) in self.events:
+            return False
+        self.events[(payment_id, status)] = None
+        return True
+
+    async def process_payment_events(self, limit):
+        if self.fail:
+            raise ConnectionError("db is down")
+        batch = list(self.events)[:limit]
+        for key in batch:
+            del self.events[key]
+        if batch:
+            self.applied.append(batch)
+        return {"events": len(batch), "updated": len(batch), "activated": 0}
+
+
+def run(scenario, **kwargs):
+    async def main():
+        db = FakeDatabase()
+        queue = WebhookQueue(**{"batch_size": 2, "flush_interval": 60, **kwargs})
+        await queue.start(db)
+        try:
+            await scenario(queue, db)
+        finally:
+            await queue.stop()
+        return db
+
+    return asyncio.run(main())
+
+
+def test_put_stores_event_before_returning():
+    async def scenario(queue, db):
+        assert await queue.put("payment.succeeded", "p1")
+        assert db.events == {("p1", "succeeded"): None}
+        assert len(queue) == 1
+
+    run(scenario)
+
+
+def test_unknown_and_duplicate_events_are_rejected():
+    async def scenario(queue, db):
+        assert not await queue.put("payment.unknown", "p1")
+        assert not await queue.put("payment.succeeded", None)
+        assert await queue.put("payment.succeeded", "p1")
+        assert not await queue.put("payment.succeeded", "p1")
+        assert await queue.put("payment.refund.succeeded", "p1")
+
+    run(scenario)
+
+
+def test_put_before_start_fails():
+    async def main():
+        await WebhookQueue().put("payment.succeeded", "p1")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+
+
+def test_full_batch_wakes_up_flush():
+    async def scenario(queue, db):
+        await queue.put("payment.succeeded", "p1")
+        await queue.put("payment.canceled", "p2")
+        await asyncio.sleep(0.05)
+        assert db.applied == [[("p1", "succeeded"), ("p2", "failed")]]
+        assert len(queue) == 0
+
+    run(scenario)
+
+
+def test_flush_drains_in_batches():
+    async def scenario(queue, db):
+        for i in range(5):
+            db.events[(f"p{i}", "succeeded")] = None
+        await queue.flush()
+        assert [len(batch) for batch in db.applied] == [2, 2, 1]
+        assert not db.events
+
+    run(scenario)
+
+
+def test_failed_flush_keeps_events():
+    async def scenario(queue, db):
+        await queue.put("payment.succeeded", "p1")
+        db.fail = True
+        await queue.flush()
+        assert db.events == {("p1", "succeeded"): None}
+        db.fail = False
+
+    db = run(scenario)
+    # Остановка очереди применяет оставшееся
+    assert db.applied == [[("p1", "succeeded")]]
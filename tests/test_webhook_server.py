@@ -0,0 +1,59 @@
+import ipaddress
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+
+import webhook_server
+
+YOOKASSA = "185.71.76.1"
+PROXY = "10.0.0.5"
+
+
+def request(remote, forwarded=None):
+    headers = {"X-Forwarded-For": forwarded} if forwarded else {}
+    return make_mocked_request(
+        "POST", "/yookassa/webhook", headers=headers, transport=FakeTransport(remote)
+    )
+
+
+class FakeTransport:
+    def __init__(self, remote):
+        self.remote = remote
+
+    def get_extra_info(self, name, default=None):
+        return (self.remote, 12345) if name == "peername" else default
+
+
+@pytest.fixture
+def trusted_proxy(monkeypatch):
+    monkeypatch.setattr(
+        webhook_server, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")]
+    )
+
+
+def test_direct_request_uses_peer_address():
+    assert webhook_server._client_address(request(YOOKASSA)) == YOOKASSA
+
+
+def test_forwarded_header_ignored_without_trusted_proxy():
+    address = webhook_server._client_address(request("203.0.113.7", YOOKASSA))
+    assert address == "203.0.113.7"
+
+
+def test_forwarded_header_from_trusted_proxy(trusted_proxy):
+    address = webhook_server._client_address(request(PROXY, YOOKASSA))
+    assert address == YOOKASSA
+    assert webhook_server._is_yookassa_address(address)
+
+
+def test_spoofed_leftmost_address_is_not_trusted(trusted_proxy):
+    # Клиент сам подставил адрес кассы, балансировщик дописал реальный
+    address = webhook_server._client_address(
+        request(PROXY, f"{YOOKASSA}, 203.0.113.7")
+    )
+    assert address == "203.0.113.7"
+
+
+def test_chain_of_trusted_proxies(trusted_proxy):
+    address = webhook_server._client_address(request(PROXY, f"{YOOKASSA}, 10.1.2.3"))
+    assert address == YOOKASSA
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from yookassa_client import YooKassaClient, YooKassaError
+from yookassa_stub import run_stub
+
+PAYMENT = {
+    "amount": {"value": "500.00", "currency": "RUB"},
+    "confirmation": {"type": "redirect", "return_url": "https://t.me/test"},
+    "capture": True,
+    "description": "Подписка",
+    "metadata": {"user_id": "1", "plan_key": "1"},
+}
+
+
+def run(scenario):
+    """Запустить сценарий с заглушкой кассы и клиентом к ней"""
+
+    async def main():
+        async with run_stub() as (stub, base_url):
+            client = YooKassaClient(
+                shop_id="shop",
+                secret_key="secret",
+                base_url=base_url,
+                timeout=0.2,
+                retries=2,
+                retry_delay=0.01,
+            )
+            try:
+                return await scenario(stub, client)
+            finally:
+                await client.close()
+
+    return asyncio.run(main())
+
+
+def test_create_and_get_payment():
+    async def scenario(stub, client):
+        payment = await client.create_payment(PAYMENT, "key-1")
+        fetched = await client.get_payment(payment["id"])
+        assert fetched == payment
+        assert payment["metadata"] == {"user_id": "1", "plan_key": "1"}
+
+    run(scenario)
+
+
+def test_same_idempotence_key_creates_one_payment():
+    async def scenario(stub, client):
+        first = await client.create_payment(PAYMENT, "key-1")
+        second = await client.create_payment(PAYMENT, "key-1")
+        other = await client.create_payment(PAYMENT, "key-2")
+        assert first["id"] == second["id"]
+        assert other["id"] != first["id"]
+        assert len(stub.payments) == 2
+
+    run(scenario)
+
+
+def test_retries_server_errors_with_same_idempotence_key():
+    async def scenario(stub, client):
+        stub.fail_statuses = [500, 429]
+        payment = await client.create_payment(PAYMENT, "key-1")
+        assert len(stub.payments) == 1
+        assert stub.requests == [("POST", "/payments", "key-1")] * 3
+        return payment
+
+    assert run(scenario)["status"] == "pending"
+
+
+def test_gives_up_after_retries():
+    async def scenario(stub, client):
+        stub.fail_statuses = [503, 503, 503]
+        with pytest.raises(YooKassaError) as error:
+            await client.get_payment("missing")
+        assert error.value.status == 503
+        assert len(stub.requests) == 3
+
+    run(scenario)
+
+
+def test_non_json_server_error_is_retried():
+    async def scenario(stub, client):
+        stub.html_errors = True
+        stub.fail_statuses = [502]
+        payment = await client.create_payment(PAYMENT, "key-1")
+        assert len(stub.requests) == 2
+        assert payment["status"] == "pending"
+
+        stub.requests.clear()
+        stub.fail_statuses = [502, 502, 502]
+        with pytest.raises(YooKassaError) as error:
+            await client.get_payment(payment["id"])
+        assert error.value.status == 502
+        assert str(error.value) == "HTTP 502"
+        assert len(stub.requests) == 3
+
+    run(scenario)
+
+
+def test_client_errors_are_not_retried():
+    async def scenario(stub, client):
+        with pytest.raises(YooKassaError) as error:
+            await client.get_payment("missing")
+        assert error.value.status == 404
+        assert str(error.value) == "Payment not found"
+        assert len(stub.requests) == 1
+
+    run(scenario)
+
+
+def test_timeout_is_retried():
+    async def scenario(stub, client):
+        payment = await client.create_payment(PAYMENT, "key-1")
+        stub.requests.clear()
+        stub.delays = [0.4]
+        assert await client.get_payment(payment["id"]) == payment
+        assert len(stub.requests) == 2
+
+    run(scenario)
+
+
+def test_timeout_without_retries_raises():
+    async def scenario(stub, client):
+        client.retries = 0
+        stub.delays = [0.4]
+        with pytest.raises(YooKassaError) as error:
+            await client.get_payment("any")
+        assert error.value.status is None
+
+    run(scenario)
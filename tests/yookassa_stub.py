@@ -0,0 +1,120 @@
+"""Локальная заглушка REST API Яндекс Кассы.
+
+Поддерживает POST /payments и GET /payments/{id}. Платежи с одинаковым
+Idempotence-Key не создаются повторно, как в настоящей кассе. Через
+fail_statuses и delays можно заставить следующие ответы вернуть ошибку
+(с html_errors - HTML-страницей вместо JSON) или задержаться, чтобы
+проверить повторы и таймауты клиента.
+
+Для ручной проверки бота заглушку можно запустить отдельно и указать
+YOOKASSA_API_URL=http://127.0.0.1:8090:
+
+    python tests/yookassa_stub.py
+"""
+import asyncio
+import contextlib
+import uuid
+
+from aiohttp import web
+
+
+class YooKassaStub:
+    def __init__(self):
+        self.payments: dict[str, dict] = {}
+        self.idempotence_keys: dict[str, str] = {}
+        # Все запросы: (метод, путь, Idempotence-Key)
+        self.requests: list[tuple[str, str, str | None]] = []
+        # Статусы, которые получат следующие запросы (по одному на запрос)
+        self.fail_statuses: list[int] = []
+        # Задержки следующих ответов в секундах (по одной на запрос)
+        self.delays: list[float] = []
+        # Отдавать ошибки из fail_statuses HTML-страницей, как прокси
+        self.html_errors = False
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/payments", self.create_payment)
+        app.router.add_get("/payments/{payment_id}", self.get_payment)
+        return app
+
+    async def _prepare(self, request: web.Request) -> web.Response | None:
+        self.requests.append(
+            (request.method, request.path, request.headers.get("Idempotence-Key"))
+        )
+        if self.delays:
+            await asyncio.sleep(self.delays.pop(0))
+        if self.fail_statuses:
+            status = self.fail_statuses.pop(0)
+            if self.html_errors:
+                return web.Response(
+                    text=f"<html><body>{status} Bad Gateway</body></html>",
+                    status=status,
+                    content_type="text/html",
+                )
+            return web.json_response(
+                {"type": "error", "description": f"stub error {status}"}, status=status
+            )
+        return None
+
+    async def create_payment(self, request: web.Request) -> web.Response:
+        error = await self._prepare(request)
+        if error is not None:
+            return error
+
+        key = request.headers.get("Idempotence-Key")
+        if not key:
+            return web.json_response(
+                {"type": "error", "description": "Idempotence-Key is required"},
+                status=400,
+            )
+        if key in self.idempotence_keys:
+            return web.json_response(self.payments[self.idempotence_keys[key]])
+
+        data = await request.json()
+        payment_id = str(uuid.uuid4())
+        payment = {
+            "id": payment_id,
+            "status": "pending",
+            "paid": False,
+            "amount": data["amount"],
+            "description": data.get("description"),
+            "metadata": data.get("metadata", {}),
+            "confirmation": {
+                "type": "redirect",
+                "confirmation_url": f"https://yookassa.test/checkout/{payment_id}",
+            },
+        }
+        self.payments[payment_id] = payment
+        self.idempotence_keys[key] = payment_id
+        return web.json_response(payment)
+
+    async def get_payment(self, request: web.Request) -> web.Response:
+        error = await self._prepare(request)
+        if error is not None:
+            return error
+
+        payment = self.payments.get(request.match_info["payment_id"])
+        if payment is None:
+            return web.json_response(
+                {"type": "error", "description": "Payment not found"}, status=404
+            )
+        return web.json_response(payment)
+
+
+@contextlib.asynccontextmanager
+async def run_stub(host: str = "127.0.0.1", port: int = 0):
+    """Запустить заглушку, вернуть (stub, base_url)"""
+    stub = YooKassaStub()
+    runner = web.AppRunner(stub.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    try:
+        yield stub, f"http://{host}:{port}"
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    web.run_app(YooKassaStub().app(), host="127.0.0.1", port=8090)